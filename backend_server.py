@@ -3,21 +3,46 @@ Starbucks Capacity Dashboard - Backend Server
 Queries Epicor REST API directly and serves data to frontend
 """
 
-from flask import Flask, jsonify, send_from_directory, request
+from flask import Blueprint, Flask, Response, current_app, jsonify, make_response, send_from_directory, request
 from flask_cors import CORS
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 import os
+import sys
+import io
+import csv
+import gzip
+import hmac
+import heapq
+import json
+import uuid
+import atexit
+import re
+import mmap
+import bisect
+import threading
+import contextvars
+from array import array
+from collections import OrderedDict, deque
 from datetime import datetime, timedelta
 import base64
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import logging
+import logging.handlers
+import queue
+import hashlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from contextlib import contextmanager
+from functools import wraps
+import time
 
-app = Flask(__name__, static_folder='.')
-CORS(app)
+IMPORT_STARTED = time.monotonic()  # Cold-start reference point (see STARTUP_TIMING)
+
+# All routes live on this blueprint - create_app() builds the Flask app around it
+api = Blueprint("dashboard", __name__)
 
 # Cache for part descriptions (they don't change frequently)
 # This is for part master info only - inventory is always fetched fresh
-PART_INFO_CACHE = {}
 PART_CACHE_EXPIRY = timedelta(hours=1)  # Cache part descriptions for 1 hour
 
 # Epicor REST API Configuration - v1 API (REST v1 is required for PartWhses, PartTrans, etc.)
@@ -78,24 +103,410 @@ UOM_CONVERSIONS = {
     }
 }
 
+# Capacity history store - every /api/capacity snapshot is appended here
+# One pair of append-only float64 column files (timestamps + values) per series
+HISTORY_DIR = os.environ.get("HISTORY_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "history_data"))
+HISTORY_SKU_METRICS = ("maxProductionNow", "maxProductionFuture")
+HISTORY_COMPONENT_METRICS = ("trueAvailable", "jobDemand", "incomingQty")
+HISTORY_METRICS = {"sku": HISTORY_SKU_METRICS, "component": HISTORY_COMPONENT_METRICS}
+HISTORY_MIN_BUCKET_SECONDS = 1.0  # Smallest downsampling bucket /api/history accepts (0 = raw points)
+
+# Consumption engine - rolling windows (days) over daily PartTrans STK-MTL issues
+CONSUMPTION_WINDOWS = (7, 30)
+CONSUMPTION_HISTORY_DAYS = 90  # Days of daily issue totals kept in memory
+CONSUMPTION_SYNC_INTERVAL = timedelta(minutes=5)  # Minimum time between incremental PartTrans syncs
+
+# Change feed - how often PartTrans/PORel/JobMtl are polled for changes. While the feed
+# is healthy, cached inventory/PO/job entries are only refetched when marked dirty
+# (or when they reach the max age below as a safety net)
+CHANGE_FEED_INTERVAL = timedelta(seconds=30)
+INVENTORY_CACHE_MAX_AGE = timedelta(minutes=10)
+BINS_CACHE_MAX_AGE = timedelta(minutes=10)
+JOB_MATERIALS_CACHE_MAX_AGE = timedelta(minutes=30)
+POS_CACHE_MAX_AGE = timedelta(minutes=10)
+UNTRACKED_CACHE_MAX_AGE = timedelta(seconds=60)  # Max age for those caches while the feed is down
+
+# Epicor query sizing - OR-filters are split into chunks and results paged
+EPICOR_FILTER_CHUNK = 25  # Values per OR-filter (keeps URLs well under server limits)
+EPICOR_PAGE_SIZE = 500  # $top per page
+
+# Health monitoring - Epicor is probed in the background on this cadence
+HEALTH_PROBE_INTERVAL = timedelta(seconds=30)
+HEALTH_PROBE_HISTORY = 120  # Probe results kept for latency/error stats (1 hour at 30s)
+
+# Cache warm-up - data classes are loaded concurrently in dependency order at startup,
+# then each is refreshed at this fraction of its TTL (before it would go cold)
+WARMUP_WORKERS = 4
+WARMUP_REFRESH_FRACTION = 0.8
+WARMUP_RETRY_DELAY = timedelta(seconds=30)
+
+# Capacity snapshot - /api/capacity serves the last snapshot until it is this old
+CAPACITY_SNAPSHOT_MAX_AGE = timedelta(seconds=30)
+
+# Refresh jobs - a data class refreshed within the cooldown is skipped by the next refresh
+REFRESH_COOLDOWN = timedelta(seconds=30)
+# A progress stream holds a request thread, so it ends after this long; EventSource
+# clients reconnect on their own and the stream resumes from the job's current state
+REFRESH_STREAM_MAX = timedelta(seconds=60)
+
+# Admission control for endpoints with large upstream fan-outs:
+# endpoint -> (concurrent requests, max queued requests, max queue wait)
+ADMISSION_LIMITS = {
+    "capacity": (2, 8, timedelta(seconds=20)),
+    "job-materials": (2, 6, timedelta(seconds=20)),
+    "transactions": (3, 6, timedelta(seconds=15)),
+}
+ADMISSION_RETRY_AFTER = 10  # Seconds suggested to clients shed with 503
+# Request threads per process (gunicorn --threads, see Procfile). The limits above only
+# engage if every admitted and queued request can hold a thread (2+8 + 2+6 + 3+6 = 27) with
+# some left for cheap endpoints - with fewer, gunicorn's accept backlog absorbs the overflow
+# before admission control ever sees it
+WEB_THREADS = int(os.environ.get("WEB_THREADS", "32"))
+
+# Epicor rate limit - requests per second across the whole process, sized to the SaaS tier.
+# On 429/503 the rate is halved, then raised by EPICOR_RATE_INCREASE per successful call.
+EPICOR_RATE_LIMIT = float(os.environ.get("EPICOR_RATE_LIMIT", "10"))
+EPICOR_BURST = int(os.environ.get("EPICOR_BURST", "20"))
+EPICOR_RATE_MIN = 0.5
+EPICOR_RATE_INCREASE = 0.05
+EPICOR_PRIORITIES = ("interactive", "refresh", "background")  # Highest priority first
+
+# Hedged reads - an idempotent Epicor GET still running after its endpoint's p90 latency
+# gets one duplicate request and the first response wins. Hedges are capped at
+# HEDGE_BUDGET of the hedgeable calls (plus a small burst) so upstream load barely moves.
+HEDGE_BUDGET = 0.05
+HEDGE_BURST = 5
+HEDGE_MIN_SAMPLES = 20  # Latencies needed before an endpoint's p90 is trusted
+HEDGE_MIN_DELAY = 0.05  # Seconds - never hedge sooner than this
+ENDPOINT_LATENCY_HISTORY = 200  # Latest round trips kept per endpoint
+
+# Process lifecycle - background services create_app() starts (once per process, after
+# the gunicorn fork). Comma-separated subset of: warmup, changefeed, monitor, alerts ("" = none)
+BACKGROUND_SERVICES = os.environ.get("BACKGROUND_SERVICES", "warmup,changefeed,monitor,alerts")
+EPICOR_POOL_SIZE = int(os.environ.get("EPICOR_POOL_SIZE", "32"))  # Keep-alive connections to Epicor
+
+# Sampling profiler (/debug/profile) - only enabled when PROFILE_TOKEN is set
+PROFILE_MAX_SECONDS = 60
+
+# Bulk export (/api/export/<dataset>) - an export can target a past snapshot version. The
+# last CAPACITY_SNAPSHOTS_KEPT snapshots are held in memory; each snapshot whose data changed
+# is also written under SNAPSHOT_DIR, so every version of the last CAPACITY_SNAPSHOT_RETENTION
+# stays exportable (across restarts too). Rows are streamed in batches of EXPORT_BATCH_ROWS
+CAPACITY_SNAPSHOTS_KEPT = 12
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR", os.path.join(HISTORY_DIR, "snapshots"))
+CAPACITY_SNAPSHOT_RETENTION = timedelta(days=int(os.environ.get("CAPACITY_SNAPSHOT_RETENTION_DAYS", "7")))
+EXPORT_BATCH_ROWS = 2000
+
+# Shortage alerts - rules run on each new capacity snapshot in the "alerts" background
+# service, only against the SKUs/components whose figures changed. A "<=" rule fires when
+# the metric drops to `trigger` and resolves only once it is back at `clear` or above
+# (">=" rules the other way round), so a value hovering at a threshold alerts once.
+# Entities: sku (SKU result), component (per component), bottleneck (SKU x component).
+ALERT_RULES = {
+    "skuBlocked": {"entity": "sku", "metric": "maxProductionNow", "op": "<=", "trigger": 0, "clear": 1,
+                   "severity": "critical"},
+    "componentOutOfStock": {"entity": "component", "metric": "trueAvailable", "op": "<=", "trigger": 0,
+                            "clear": 10, "severity": "critical"},
+    "componentLimitsSku": {"entity": "bottleneck", "metric": "maxUnitsNow", "op": "<=", "trigger": 9,
+                           "clear": 15, "severity": "warning"},
+    "lowDaysOfCover": {"entity": "component", "metric": "daysOfCover", "op": "<=", "trigger": 7,
+                       "clear": 10, "severity": "warning"},
+    "poPastDue": {"entity": "component", "metric": "pastDuePoQty", "op": ">=", "trigger": 1, "clear": 0,
+                  "severity": "warning"}
+}
+ALERT_RULES_FILE = os.environ.get("ALERT_RULES_FILE")  # Optional JSON of rule name -> overrides/new rules
+ALERT_SINKS = os.environ.get("ALERT_SINKS", "log")  # Comma-separated subset of log, file, webhook
+ALERT_FILE = os.environ.get("ALERT_FILE", os.path.join(HISTORY_DIR, "alerts.jsonl"))
+ALERT_WEBHOOK_URL = os.environ.get("ALERT_WEBHOOK_URL")
+ALERT_RECENT_KEPT = 200  # Fired/resolved events kept for /api/alerts
+
+# Base TTLs for the remaining data classes - the cache manager adapts each one to how
+# often refreshes find changes (between TTL / CACHE_TTL_RANGE and TTL * CACHE_TTL_RANGE)
+BOM_CACHE_EXPIRY = timedelta(minutes=30)  # Refresh BOM every 30 minutes
+STARBUCKS_JOBS_CACHE_EXPIRY = timedelta(seconds=60)
+JOB_DEMANDS_CACHE_EXPIRY = timedelta(minutes=5)
+OPEN_SBX_JOBS_CACHE_EXPIRY = timedelta(minutes=5)
+SHIP_DATE_CACHE_EXPIRY = timedelta(minutes=30)
+CACHE_TARGET_CHANGE_RATE = 0.25  # Share of refreshes expected to find changes at the base TTL
+CACHE_CHANGE_RATE_ALPHA = 0.2  # Weight of the latest refresh in the change rate average
+CACHE_TTL_RANGE = 4.0
+CACHE_MAX_ENTRIES = 5000  # LRU bound for each keyed cache
+
+# Structured logging - JSON lines on stdout written by one listener thread, so request and
+# fan-out threads only enqueue a record. Events listed in LOG_SAMPLE_EVERY are kept 1 in N.
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = 10000  # Records waiting for the writer - beyond this they're dropped (and counted)
+LOG_SAMPLE_EVERY = {
+    "inventory.fromTransactions": 20,
+    "admission.shed": 10,
+    "jobs.materialsError": 10,
+    "jobs.shipDateError": 10,
+    "jobMaterials.jobError": 10
+}
+
+# Logging pipeline - log_event() builds a record on the calling thread and queues it;
+# formatting and the stdout write happen on the listener thread
+LOG = logging.getLogger("dashboard")
+LOG_LOCK = threading.Lock()
+LOG_LISTENER = None
+LOG_LISTENER_PID = None
+LOG_STATS = {"queued": 0, "dropped": 0, "sampledOut": 0}
+LOG_SAMPLE_COUNTS = {}  # event -> occurrences seen
+REQUEST_ID = contextvars.ContextVar("request_id", default=None)  # Request or background trace id
+
+
+class _JsonLogFormatter(logging.Formatter):
+    """One JSON object per record: time, level, event, message, trace id, thread and fields"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "event": getattr(record, "event", record.name),
+            "msg": record.getMessage(),
+            "requestId": getattr(record, "request_id", None),
+            "thread": record.threadName,
+            **getattr(record, "fields", {})
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks or formats on the caller's thread - a full queue drops"""
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            LOG_STATS["queued"] += 1
+        except queue.Full:
+            LOG_STATS["dropped"] += 1
+
+
+def init_logging(level=None):
+    """Route the dashboard logger through a bounded queue to a stdout listener thread.
+    Started lazily on first use and again in a forked worker (threads don't survive fork).
+    """
+    global LOG_LISTENER, LOG_LISTENER_PID
+
+    with LOG_LOCK:
+        if LOG_LISTENER is not None and LOG_LISTENER_PID == os.getpid():
+            if level:
+                LOG.setLevel(level)
+            return
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(_JsonLogFormatter())
+        LOG.handlers = [_DroppingQueueHandler(log_queue)]
+        LOG.setLevel(level or LOG_LEVEL)
+        LOG.propagate = False
+        LOG_LISTENER = logging.handlers.QueueListener(log_queue, stream)
+        LOG_LISTENER.start()
+        LOG_LISTENER_PID = os.getpid()
+        atexit.register(LOG_LISTENER.stop)  # Flush what's queued on shutdown
+
+
+def log_event(level, event, message, **fields):
+    """Log a structured event. level: debug, info, warning or error; event: dotted name
+    ("bom.loaded") used for filtering and sampling; fields: extra JSON keys.
+    """
+    if LOG_LISTENER_PID != os.getpid():
+        init_logging()
+    levelno = logging.getLevelName(level.upper())
+    if not LOG.isEnabledFor(levelno):
+        return
+
+    every = LOG_SAMPLE_EVERY.get(event)
+    if every:
+        with LOG_LOCK:
+            seen = LOG_SAMPLE_COUNTS[event] = LOG_SAMPLE_COUNTS.get(event, 0) + 1
+        if (seen - 1) % every:
+            LOG_STATS["sampledOut"] += 1
+            return
+        fields["sampled"] = f"1/{every}"
+        fields["occurrences"] = seen
+
+    LOG.log(levelno, message, exc_info=fields.pop("exc_info", None),
+            extra={"event": event, "request_id": REQUEST_ID.get(), "fields": fields})
+
+
+# Cache manager - each data class gets a CacheRegion with an adaptive TTL and hit/miss
+# stats. Keyed regions also hold their entries, bounded with LRU eviction.
+CACHE_MISS = object()  # lookup() result when there's no fresh entry (None is a valid cached value)
+
+
+def _fingerprint(value):
+    """Comparable form of a cached value - used to tell whether a refresh changed anything"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _fingerprint(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_fingerprint(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(value)
+    if hasattr(value, "__slots__"):
+        return tuple(_fingerprint(getattr(value, slot, None)) for slot in value.__slots__)
+    return value
+
+
+class CacheRegion:
+    """One data class's cache.
+    The TTL adapts to how often refreshes find changed data: it is base_ttl at
+    CACHE_TARGET_CHANGE_RATE and scales inversely with the observed change rate,
+    clamped to [base_ttl / CACHE_TTL_RANGE, base_ttl * CACHE_TTL_RANGE].
+    """
+
+    def __init__(self, name, base_ttl, max_entries=None, adaptive=True):
+        self.name = name
+        self.base_ttl = base_ttl
+        self.ttl = base_ttl
+        self.max_entries = max_entries
+        self.adaptive = adaptive
+        self.entries = OrderedDict()  # key -> (fetched_time, value), least recently used first
+        self.lock = threading.Lock()
+        self.change_rate = CACHE_TARGET_CHANGE_RATE
+        self.generation = 0  # Bumped on every store - lets derived indexes tell they're stale
+        self.stats_counts = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0,
+                             "refreshes": 0, "changedRefreshes": 0}
+        self.hit_age_total = 0.0
+        self.hit_age_max = 0.0
+        CACHE_REGIONS[name] = self
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def values(self):
+        return list(self.entries.values())
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def _record_hit(self, age):
+        self.stats_counts["hits"] += 1
+        age = age.total_seconds()
+        self.hit_age_total += age
+        self.hit_age_max = max(self.hit_age_max, age)
+
+    def check(self, fetched_time, max_age=None):
+        """Freshness check for single-value caches kept outside the region. Records a hit or miss."""
+        with self.lock:
+            if fetched_time is None:
+                self.stats_counts["misses"] += 1
+                return False
+            age = datetime.now() - fetched_time
+            if age < (max_age or self.ttl):
+                self._record_hit(age)
+                return True
+            self.stats_counts["misses"] += 1
+            self.stats_counts["expired"] += 1
+            return False
+
+    def lookup(self, key, max_age=None):
+        """Cached value for key if younger than max_age (default: the adaptive TTL), else CACHE_MISS"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats_counts["misses"] += 1
+                return CACHE_MISS
+            age = datetime.now() - entry[0]
+            if age >= (max_age or self.ttl):
+                self.stats_counts["misses"] += 1
+                self.stats_counts["expired"] += 1
+                return CACHE_MISS
+            self.entries.move_to_end(key)
+            self._record_hit(age)
+            return entry[1]
+
+    def peek(self, key):
+        """Cached value regardless of age, without touching stats or LRU order (None if absent)"""
+        entry = self.entries.get(key)
+        return entry[1] if entry else None
+
+    def evict(self, key):
+        """Drop key so the next lookup refetches it"""
+        with self.lock:
+            if self.entries.pop(key, None) is not None:
+                self.generation += 1
+
+    def store(self, key, value):
+        """Cache value for key, evicting least recently used entries beyond max_entries"""
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            self.entries[key] = (datetime.now(), value)
+            self.generation += 1
+            if self.max_entries:
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+                    self.stats_counts["evictions"] += 1
+        if previous is not None:
+            self.observe(previous[1], value)
+
+    def observe(self, old_value, new_value):
+        """Record a refresh of existing data and adapt the TTL to the change rate"""
+        changed = _fingerprint(old_value) != _fingerprint(new_value)
+        with self.lock:
+            self.stats_counts["refreshes"] += 1
+            if changed:
+                self.stats_counts["changedRefreshes"] += 1
+            self.change_rate += CACHE_CHANGE_RATE_ALPHA * ((1.0 if changed else 0.0) - self.change_rate)
+            if self.adaptive:
+                scale = CACHE_TARGET_CHANGE_RATE / max(self.change_rate, 0.001)
+                scale = min(CACHE_TTL_RANGE, max(1 / CACHE_TTL_RANGE, scale))
+                self.ttl = self.base_ttl * scale
+
+    def stats(self):
+        with self.lock:
+            counts = dict(self.stats_counts)
+            lookups = counts["hits"] + counts["misses"]
+            return {
+                **counts,
+                "entries": len(self.entries),
+                "maxEntries": self.max_entries,
+                "hitRate": round(counts["hits"] / lookups, 3) if lookups else None,
+                "changeRate": round(self.change_rate, 3),
+                "ttlSeconds": round(self.ttl.total_seconds(), 1),
+                "baseTtlSeconds": self.base_ttl.total_seconds(),
+                "avgHitAgeSeconds": round(self.hit_age_total / counts["hits"], 1) if counts["hits"] else None,
+                "maxHitAgeSeconds": round(self.hit_age_max, 1)
+            }
+
+
+CACHE_REGIONS = {}  # name -> CacheRegion
+
+# Single-value caches (kept in their own globals) - the regions track TTL and stats only
+BOM_CACHE_REGION = CacheRegion("bom", BOM_CACHE_EXPIRY)
+STARBUCKS_JOBS_CACHE_REGION = CacheRegion("starbucksJobs", STARBUCKS_JOBS_CACHE_EXPIRY)
+OPEN_SBX_JOBS_CACHE_REGION = CacheRegion("openJobs", OPEN_SBX_JOBS_CACHE_EXPIRY)
+JOB_DEMANDS_CACHE_REGION = CacheRegion("jobDemands", JOB_DEMANDS_CACHE_EXPIRY)
+
+# Part master info (description, UOM) - part_num -> PartInfo (None if not found)
+PART_INFO_CACHE = CacheRegion("partInfo", PART_CACHE_EXPIRY, max_entries=CACHE_MAX_ENTRIES)
+
+
 # Cache for BOM data (refreshed on demand or periodically)
 BOM_CACHE = {}
 BOM_CACHE_TIME = None
-BOM_CACHE_EXPIRY = timedelta(minutes=30)  # Refresh BOM every 30 minutes
 
 
-def fetch_quote_bom_from_epicor():
+def fetch_quote_bom_from_epicor(force=False):
     """Fetch BOM dynamically from Epicor Quote 109209.
     Returns dict of SKU -> {description, starbucksPartNum, quoteLine, components}
     """
     global BOM_CACHE, BOM_CACHE_TIME
 
     # Return cached BOM if still valid
-    if BOM_CACHE_TIME and (datetime.now() - BOM_CACHE_TIME) < BOM_CACHE_EXPIRY and BOM_CACHE:
-        print("Using cached BOM data")
+    if not force and BOM_CACHE and BOM_CACHE_REGION.check(BOM_CACHE_TIME):
+        log_event("debug", "bom.cacheHit", "Using cached BOM data")
         return BOM_CACHE
 
-    print(f"Fetching fresh BOM from Epicor Quote {MASTER_QUOTE_NUM}...")
+    log_event("info", "bom.fetch", f"Fetching fresh BOM from Epicor Quote {MASTER_QUOTE_NUM}...")
     bom_data = {}
 
     try:
@@ -105,10 +516,10 @@ def fetch_quote_bom_from_epicor():
             "$filter": f"QuoteNum eq {MASTER_QUOTE_NUM}",
             "$select": "QuoteNum,QuoteLine,AssemblySeq,PartNum,Description"
         }
-        response = requests.get(url, headers=get_epicor_headers(), params=params, timeout=30)
+        response = epicor_get(url, params=params, timeout=30)
 
         if response.status_code != 200:
-            print(f"Failed to fetch quote assemblies: {response.status_code}")
+            log_event("error", "bom.assembliesFailed", f"Failed to fetch quote assemblies: {response.status_code}")
             return BOM_CACHE if BOM_CACHE else {}
 
         assemblies = response.json().get("value", [])
@@ -130,10 +541,10 @@ def fetch_quote_bom_from_epicor():
                 "quoteLine": quote_line,
                 "assemblySeq": 0
             }
-            mtl_response = requests.get(mtl_url, headers=get_epicor_headers(), params=mtl_params, timeout=30)
+            mtl_response = epicor_get(mtl_url, params=mtl_params, timeout=30)
 
             if mtl_response.status_code != 200:
-                print(f"Failed to fetch materials for line {quote_line}: {mtl_response.status_code}")
+                log_event("error", "bom.materialsFailed", f"Failed to fetch materials for line {quote_line}: {mtl_response.status_code}")
                 continue
 
             mtl_data = mtl_response.json()
@@ -165,14 +576,16 @@ def fetch_quote_bom_from_epicor():
             }
 
         # Update cache
+        if BOM_CACHE:
+            BOM_CACHE_REGION.observe(BOM_CACHE, bom_data)
         BOM_CACHE = bom_data
         BOM_CACHE_TIME = datetime.now()
-        print(f"BOM cache updated with {len(bom_data)} SKUs")
+        log_event("info", "bom.loaded", f"BOM cache updated with {len(bom_data)} SKUs", skus=len(bom_data))
 
         return bom_data
 
     except Exception as e:
-        print(f"Error fetching BOM from Epicor: {e}")
+        log_event("error", "bom.fetchError", f"Error fetching BOM from Epicor: {e}")
         return BOM_CACHE if BOM_CACHE else {}
 
 
@@ -202,11 +615,424 @@ def get_epicor_headers():
     }
 
 
+# Epicor HTTP client - one pooled requests.Session per process, built by init_epicor_client()
+# (called from create_app, or lazily on first use by scripts that never create the app)
+EPICOR_SESSION = None
+EPICOR_SESSION_PID = None
+EPICOR_SESSION_LOCK = threading.Lock()
+
+
+def init_epicor_client(pool_size=None):
+    """Build this process's Epicor session - keep-alive connections shared by all threads"""
+    global EPICOR_SESSION, EPICOR_SESSION_PID
+
+    pool_size = pool_size or EPICOR_POOL_SIZE
+    session = requests.Session()
+    session.headers.update(get_epicor_headers())
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    with EPICOR_SESSION_LOCK:
+        EPICOR_SESSION = session
+        EPICOR_SESSION_PID = os.getpid()
+    return session
+
+
+def get_epicor_session():
+    """This process's Epicor session - rebuilt after a fork so workers never share sockets"""
+    session = EPICOR_SESSION
+    if session is None or EPICOR_SESSION_PID != os.getpid():
+        session = init_epicor_client()
+    return session
+
+
+# Epicor rate limiter - every Epicor call takes a token from one process-wide bucket.
+# Waiting callers are served by priority class (interactive before refresh before
+# background warm-up); the rate backs off on 429/503 and creeps back up on success.
+EPICOR_PRIORITY = contextvars.ContextVar("epicor_priority", default="interactive")
+EPICOR_LIMITER = {
+    "rate": EPICOR_RATE_LIMIT,  # Current tokens per second (adapted between the min and max)
+    "tokens": float(EPICOR_BURST),
+    "updated": None,  # time.monotonic() of the last refill
+    "pausedUntil": 0.0,  # monotonic time before which no tokens are handed out (Retry-After)
+    "waiting": [],  # heap of (priority rank, sequence) for callers waiting on a token
+    "sequence": 0,
+    "requests": {name: 0 for name in EPICOR_PRIORITIES},
+    "waitMsTotal": {name: 0 for name in EPICOR_PRIORITIES},
+    "throttled": 0,  # 429/503 responses seen
+    "backoffs": 0
+}
+EPICOR_LIMITER_CONDITION = threading.Condition()
+
+
+def _acquire_epicor_token(priority):
+    """Block until a token is free and no higher-priority caller is waiting for it"""
+
+    limiter = EPICOR_LIMITER
+    with EPICOR_LIMITER_CONDITION:
+        limiter["sequence"] += 1
+        ticket = (EPICOR_PRIORITIES.index(priority), limiter["sequence"])
+        heapq.heappush(limiter["waiting"], ticket)
+        started = time.monotonic()
+        try:
+            while True:
+                now = time.monotonic()
+                if limiter["updated"] is not None:
+                    elapsed = now - limiter["updated"]
+                    limiter["tokens"] = min(float(EPICOR_BURST), limiter["tokens"] + elapsed * limiter["rate"])
+                limiter["updated"] = now
+
+                if limiter["waiting"][0] == ticket and now >= limiter["pausedUntil"] and limiter["tokens"] >= 1:
+                    limiter["tokens"] -= 1
+                    heapq.heappop(limiter["waiting"])
+                    EPICOR_LIMITER_CONDITION.notify_all()  # Next in line re-checks
+                    break
+
+                # Sleep until the next token (or pause end) - or until woken by another caller
+                delay = max(limiter["pausedUntil"] - now, (1 - limiter["tokens"]) / limiter["rate"], 0.01)
+                EPICOR_LIMITER_CONDITION.wait(delay)
+        except BaseException:
+            limiter["waiting"].remove(ticket)
+            heapq.heapify(limiter["waiting"])
+            EPICOR_LIMITER_CONDITION.notify_all()
+            raise
+        limiter["requests"][priority] += 1
+        limiter["waitMsTotal"][priority] += int((time.monotonic() - started) * 1000)
+
+
+def _adapt_epicor_rate(status_code, retry_after=None):
+    """AIMD - halve the rate on 429/503 (pausing for Retry-After), otherwise add a little back"""
+
+    limiter = EPICOR_LIMITER
+    with EPICOR_LIMITER_CONDITION:
+        if status_code in (429, 503):
+            limiter["throttled"] += 1
+            now = time.monotonic()
+            # One backoff per burst of throttled responses
+            if now >= limiter["pausedUntil"]:
+                limiter["backoffs"] += 1
+                limiter["rate"] = max(EPICOR_RATE_MIN, limiter["rate"] * 0.5)
+                limiter["tokens"] = 0.0
+                log_event("warning", "epicor.throttled", f"Epicor throttled ({status_code}) - rate limit lowered to {limiter['rate']:.2f}/s",
+                          status=status_code, rateLimit=round(limiter["rate"], 2))
+            try:
+                pause = float(retry_after) if retry_after else 1.0
+            except ValueError:
+                pause = 1.0
+            limiter["pausedUntil"] = max(limiter["pausedUntil"], now + min(pause, 60.0))
+        elif limiter["rate"] < EPICOR_RATE_LIMIT:
+            limiter["rate"] = min(EPICOR_RATE_LIMIT, limiter["rate"] + EPICOR_RATE_INCREASE)
+
+
+def epicor_get(url, params=None, timeout=30):
+    """GET an Epicor REST endpoint through the shared rate limiter.
+    Priority comes from the EPICOR_PRIORITY context (see epicor_priority).
+    """
+    _acquire_epicor_token(EPICOR_PRIORITY.get())
+    response = get_epicor_session().get(url, params=params, timeout=timeout)
+    _adapt_epicor_rate(response.status_code, response.headers.get("Retry-After"))
+    if response.status_code == 200:
+        _record_endpoint_latency(url, response.elapsed.total_seconds())
+    return response
+
+
+# Per-endpoint round-trip latencies (successful calls) and hedging counters
+ENDPOINT_LATENCY_LOCK = threading.Lock()
+ENDPOINT_LATENCY = {}  # endpoint -> deque of seconds
+HEDGE_STATS = {
+    "calls": 0,  # Hedgeable calls made
+    "hedged": 0,  # Duplicates fired
+    "hedgeWins": 0,  # Duplicate answered first
+    "overBudget": 0  # Past p90 but no budget left
+}
+HEDGE_EXECUTOR = None
+
+
+def _endpoint_name(url):
+    """Service/method part of an Epicor URL, e.g. Erp.BO.JobEntrySvc/GetByID"""
+    return "/".join(url.split("?")[0].rstrip("/").split("/")[-2:])
+
+
+def _record_endpoint_latency(url, seconds):
+    name = _endpoint_name(url)
+    with ENDPOINT_LATENCY_LOCK:
+        history = ENDPOINT_LATENCY.get(name)
+        if history is None:
+            history = ENDPOINT_LATENCY[name] = deque(maxlen=ENDPOINT_LATENCY_HISTORY)
+        history.append(seconds)
+
+
+def endpoint_latency_percentile(url, pct):
+    """pct-th percentile round trip for url's endpoint in seconds, or None until HEDGE_MIN_SAMPLES"""
+    with ENDPOINT_LATENCY_LOCK:
+        history = sorted(ENDPOINT_LATENCY.get(_endpoint_name(url), ()))
+    if len(history) < HEDGE_MIN_SAMPLES:
+        return None
+    return history[min(len(history) - 1, int(len(history) * pct / 100))]
+
+
+def _take_hedge_budget():
+    """True if one more hedge keeps duplicates within HEDGE_BUDGET of calls"""
+    with ENDPOINT_LATENCY_LOCK:
+        if HEDGE_STATS["hedged"] < HEDGE_STATS["calls"] * HEDGE_BUDGET + HEDGE_BURST:
+            HEDGE_STATS["hedged"] += 1
+            return True
+        HEDGE_STATS["overBudget"] += 1
+        return False
+
+
+def _get_hedge_executor():
+    """Threads running hedged calls - created on first use, sized like the connection pool"""
+    global HEDGE_EXECUTOR
+    with ENDPOINT_LATENCY_LOCK:
+        if HEDGE_EXECUTOR is None:
+            HEDGE_EXECUTOR = ThreadPoolExecutor(max_workers=EPICOR_POOL_SIZE, thread_name_prefix="epicor-hedge")
+        return HEDGE_EXECUTOR
+
+
+def epicor_get_hedged(url, params=None, timeout=30):
+    """epicor_get for idempotent reads with tail-latency hedging.
+    If no response arrives within the endpoint's p90 latency, fire one duplicate
+    (budget permitting) and return whichever response comes back first. The slower
+    request is left to finish in the background - requests can't cancel it.
+    """
+
+    with ENDPOINT_LATENCY_LOCK:
+        HEDGE_STATS["calls"] += 1
+    p90 = endpoint_latency_percentile(url, 90)
+    if p90 is None:
+        return epicor_get(url, params=params, timeout=timeout)
+
+    executor = _get_hedge_executor()
+    primary = submit_in_context(executor, epicor_get, url, params, timeout)
+    done, _ = wait([primary], timeout=max(p90, HEDGE_MIN_DELAY))
+    if done or not _take_hedge_budget():
+        return primary.result()
+
+    hedge = submit_in_context(executor, epicor_get, url, params, timeout)
+    pending = {primary, hedge}
+    while True:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        # First usable answer wins; a failed call defers to the other one
+        for future in done:
+            if future.exception() is None:
+                if future is hedge:
+                    with ENDPOINT_LATENCY_LOCK:
+                        HEDGE_STATS["hedgeWins"] += 1
+                return future.result()
+        if not pending:
+            # Both calls failed - surface the primary's error
+            return primary.result()
+
+
+def hedging_stats():
+    """Hedging counters and per-endpoint p90 for /api/metrics"""
+    with ENDPOINT_LATENCY_LOCK:
+        stats = dict(HEDGE_STATS)
+        endpoints = list(ENDPOINT_LATENCY)
+    stats["budget"] = HEDGE_BUDGET
+    stats["endpointP90Ms"] = {
+        name: round(p90 * 1000, 1)
+        for name in endpoints
+        for p90 in [endpoint_latency_percentile(name, 90)]
+        if p90 is not None
+    }
+    return stats
+
+
+def epicor_priority(priority):
+    """Context manager running the enclosed Epicor calls at the given priority class"""
+
+    @contextmanager
+    def scope():
+        token = EPICOR_PRIORITY.set(priority)
+        try:
+            yield
+        finally:
+            EPICOR_PRIORITY.reset(token)
+    return scope()
+
+
+def submit_in_context(executor, fn, *args):
+    """executor.submit that carries the caller's context (Epicor priority, request id) into the worker"""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def epicor_limiter_stats():
+    """Rate limiter state for /api/metrics"""
+    with EPICOR_LIMITER_CONDITION:
+        limiter = EPICOR_LIMITER
+        waiting = [EPICOR_PRIORITIES[rank] for rank, _ in limiter["waiting"]]
+        return {
+            "rateLimit": round(limiter["rate"], 2),
+            "configuredRateLimit": EPICOR_RATE_LIMIT,
+            "burst": EPICOR_BURST,
+            "tokens": round(limiter["tokens"], 2),
+            "waiting": {name: waiting.count(name) for name in EPICOR_PRIORITIES},
+            "requests": dict(limiter["requests"]),
+            "avgWaitMs": {
+                name: round(limiter["waitMsTotal"][name] / limiter["requests"][name], 1) if limiter["requests"][name] else 0
+                for name in EPICOR_PRIORITIES
+            },
+            "throttled": limiter["throttled"],
+            "backoffs": limiter["backoffs"]
+        }
+
+
+# Compact cached records - Epicor payloads are parsed into these as soon as they
+# arrive and the raw JSON dropped, so caches only hold the fields we actually use.
+class PartInfo:
+    """Part master fields (Part)"""
+    __slots__ = ("part_num", "description", "ium")
+
+    def __init__(self, part_num, description, ium):
+        self.part_num = part_num
+        self.description = description
+        self.ium = ium
+
+    @classmethod
+    def from_record(cls, record):
+        return cls(record.get("PartNum", ""), record.get("PartDescription", ""), record.get("IUM", "EA"))
+
+
+class WarehouseQty:
+    """On-hand/allocated quantity for a part in one warehouse (PartWhse)"""
+    __slots__ = ("warehouse_code", "on_hand", "allocated")
+
+    def __init__(self, warehouse_code, on_hand, allocated=0.0):
+        self.warehouse_code = warehouse_code
+        self.on_hand = float(on_hand or 0)
+        self.allocated = float(allocated or 0)
+
+    @classmethod
+    def from_record(cls, record):
+        return cls(record.get("WarehouseCode", ""), record.get("OnHandQty", 0), record.get("AllocatedQty", 0))
+
+
+class JobInfo:
+    """Job header fields (JobHead)"""
+    __slots__ = ("job_num", "part_num", "part_description", "prod_qty", "start_date", "req_due_date")
+
+    def __init__(self, job_num, part_num, part_description, prod_qty, start_date, req_due_date):
+        self.job_num = job_num
+        self.part_num = part_num
+        self.part_description = part_description
+        self.prod_qty = float(prod_qty or 0)
+        self.start_date = start_date or ""
+        self.req_due_date = req_due_date or ""
+
+    @classmethod
+    def from_record(cls, record, prefix=""):
+        """Build from a JobHead record - prefix is "JobHead_" for BAQ rows"""
+        return cls(
+            record.get(prefix + "JobNum", ""),
+            record.get(prefix + "PartNum", ""),
+            record.get(prefix + "PartDescription", ""),
+            record.get(prefix + "ProdQty", 0),
+            record.get(prefix + "StartDate", ""),
+            record.get(prefix + "ReqDueDate", "")
+        )
+
+
+class JobMaterial:
+    """Material requirement on a job (JobMtl)"""
+    __slots__ = ("mtl_seq", "part_num", "required_qty", "issued_qty", "ium")
+
+    def __init__(self, mtl_seq, part_num, required_qty, issued_qty, ium):
+        self.mtl_seq = mtl_seq
+        self.part_num = part_num
+        self.required_qty = float(required_qty or 0)
+        self.issued_qty = float(issued_qty or 0)
+        self.ium = ium or "EA"
+
+    @classmethod
+    def from_record(cls, record, prefix=""):
+        """Build from a JobMtl record - prefix is "JobMtl_" for BAQ rows"""
+        return cls(
+            record.get(prefix + "MtlSeq"),
+            record.get(prefix + "PartNum", ""),
+            record.get(prefix + "RequiredQty", 0),
+            record.get(prefix + "IssuedQty", 0),
+            record.get(prefix + "IUM", "EA")
+        )
+
+
+class JobOrderLink:
+    """Sales order release a job produces for (JobProd)"""
+    __slots__ = ("order_num", "order_line", "order_rel_num")
+
+    def __init__(self, order_num, order_line, order_rel_num):
+        self.order_num = order_num
+        self.order_line = order_line
+        self.order_rel_num = order_rel_num or 1
+
+    @classmethod
+    def from_record(cls, record, prefix=""):
+        """Build from a JobProd record - prefix is "JobProd_" for BAQ rows"""
+        return cls(record.get(prefix + "OrderNum"), record.get(prefix + "OrderLine"), record.get(prefix + "OrderRelNum"))
+
+
+class OpenJob:
+    """Open job with its materials and order links"""
+    __slots__ = ("info", "materials", "prods")
+
+    def __init__(self, info, materials, prods):
+        self.info = info
+        self.materials = tuple(materials)
+        self.prods = tuple(prods)
+
+
+def _deep_sizeof(obj, seen):
+    """Approximate bytes held by obj and everything it references"""
+
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_sizeof(k, seen) + _deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        size += sum(_deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, "__slots__"):
+        size += sum(_deep_sizeof(getattr(obj, slot), seen) for slot in obj.__slots__ if hasattr(obj, slot))
+    return size
+
+
+def cache_memory_usage():
+    """Entries and approximate memory per in-process cache"""
+    stale_responses = {}
+    for name, condition in ADMISSION_CONDITIONS.items():
+        with condition:  # Request threads add and evict these concurrently
+            stale_responses[name] = dict(ADMISSION_LAST_RESPONSE[name])
+    caches = {
+        "partInfo": PART_INFO_CACHE,
+        "inventory": INVENTORY_CACHE,
+        "bins": BIN_INDEX,
+        "openJobs": OPEN_SBX_JOBS,
+        "jobMaterials": JOB_MATERIALS_CACHE,
+        "jobDemands": JOB_DEMANDS_CACHE,
+        "shipDates": SHIP_DATE_CACHE,
+        "poReleases": PO_RELEASES,
+        "consumption": CONSUMPTION_DAILY,
+        "bom": BOM_CACHE,
+        "capacitySnapshot": CAPACITY_SNAPSHOT or {},
+        "staleResponses": stale_responses
+    }
+    usage = {}
+    for name, cache in caches.items():
+        if isinstance(cache, CacheRegion):
+            cache = cache.entries
+        # Shallow copy so a concurrent update can't break the walk
+        usage[name] = {"entries": len(cache), "bytes": _deep_sizeof(dict(cache), set())}
+    return usage
+
+
 def calculate_inventory_from_transactions(part_num):
     """Calculate on-hand inventory by summing transaction history.
     Used as fallback for parts without PartWhse records (e.g., parts that were
     previously set to 'purchase direct' and have been adjusted to stock).
     Only counts non-WIP warehouse transactions (inventory in stock, not WIP).
+    Returns warehouse -> qty ({} when there is no stock), or None if the query failed.
     """
     try:
         url = f"{EPICOR_CONFIG['base_url']}/Erp.BO.PartTranSvc/PartTrans"
@@ -215,7 +1041,7 @@ def calculate_inventory_from_transactions(part_num):
             "$select": "TranType,TranQty,WareHouseCode",
             "$top": "500"
         }
-        response = requests.get(url, headers=get_epicor_headers(), params=params, timeout=30)
+        response = epicor_get(url, params=params, timeout=30)
         if response.status_code == 200:
             data = response.json()
             # Sum quantities by warehouse, excluding WIP transactions
@@ -232,15 +1058,22 @@ def calculate_inventory_from_transactions(part_num):
 
             total = sum(warehouse_totals.values())
             if total > 0:
-                print(f"Calculated {part_num} inventory from transactions: {total} in warehouses {warehouse_totals}")
+                log_event("info", "inventory.fromTransactions", f"Calculated {part_num} inventory from transactions: {total} in warehouses {warehouse_totals}",
+                          part=part_num, total=total)
                 return warehouse_totals
+            return {}
     except Exception as e:
-        print(f"Error calculating inventory from transactions for {part_num}: {e}")
+        log_event("error", "inventory.fromTransactionsError", f"Error calculating inventory from transactions for {part_num}: {e}")
     return None
 
 
 def query_epicor_partwhse(part_num):
-    """Query inventory for a specific part - tries PartWhses, then calculates from transactions"""
+    """Query inventory for a specific part - tries PartWhses, then calculates from transactions.
+    Returns list of WarehouseQty (empty when every source answered with no stock),
+    or None if a source failed and none reported stock.
+    """
+    failed = False
+
     # First try PartSvc/PartWhses
     try:
         url = f"{EPICOR_CONFIG['base_url']}/Erp.BO.PartSvc/PartWhses"
@@ -248,33 +1081,29 @@ def query_epicor_partwhse(part_num):
             "$filter": f"PartNum eq '{part_num}'",
             "$select": "PartNum,WarehouseCode,OnHandQty,AllocatedQty"
         }
-        response = requests.get(url, headers=get_epicor_headers(), params=params, timeout=30)
+        response = epicor_get(url, params=params, timeout=30)
         if response.status_code == 200:
             data = response.json()
             if data.get("value") and len(data["value"]) > 0:
+                warehouses = [WarehouseQty.from_record(r) for r in data["value"]]
                 # Check if we have actual inventory (OnHandQty > 0)
-                total_on_hand = sum(float(r.get("OnHandQty", 0) or 0) for r in data["value"])
+                total_on_hand = sum(w.on_hand for w in warehouses)
                 if total_on_hand > 0:
-                    return data
+                    return warehouses
+        else:
+            failed = True
     except requests.exceptions.RequestException as e:
-        print(f"Error querying PartWhse for {part_num}: {e}")
+        log_event("error", "inventory.partWhseError", f"Error querying PartWhse for {part_num}: {e}")
+        failed = True
 
     # Fallback 1: Calculate inventory from transaction history
     # This is needed for parts like FOAM-170/171 that were previously "purchase direct"
     # and don't have PartWhse records but have ADJ-QTY transactions
     warehouse_totals = calculate_inventory_from_transactions(part_num)
     if warehouse_totals:
-        return {
-            "value": [
-                {
-                    "PartNum": part_num,
-                    "WarehouseCode": whse,
-                    "OnHandQty": qty,
-                    "AllocatedQty": 0
-                }
-                for whse, qty in warehouse_totals.items() if qty > 0
-            ]
-        }
+        return [WarehouseQty(whse, qty) for whse, qty in warehouse_totals.items() if qty > 0]
+    if warehouse_totals is None:
+        failed = True
 
     # Fallback 2: Use PartCostSearchSvc to get TotalQtyAvg (on-hand quantity for average costing)
     try:
@@ -284,35 +1113,56 @@ def query_epicor_partwhse(part_num):
             "$top": "1",
             "$select": "PartNum,TotalQtyAvg"
         }
-        response = requests.get(url, headers=get_epicor_headers(), params=params, timeout=30)
+        response = epicor_get(url, params=params, timeout=30)
         if response.status_code == 200:
             data = response.json()
             if data.get("value") and len(data["value"]) > 0:
                 qty = float(data["value"][0].get("TotalQtyAvg", 0) or 0)
                 if qty > 0:
                     # Return synthetic warehouse record matching the format
-                    return {
-                        "value": [{
-                            "PartNum": part_num,
-                            "WarehouseCode": "TOTAL",
-                            "OnHandQty": qty,
-                            "AllocatedQty": 0
-                        }]
-                    }
+                    return [WarehouseQty("TOTAL", qty)]
+        else:
+            failed = True
     except requests.exceptions.RequestException as e:
-        print(f"Error querying PartCostSearch for {part_num}: {e}")
+        log_event("error", "inventory.partCostError", f"Error querying PartCostSearch for {part_num}: {e}")
+        failed = True
 
-    return None
+    return None if failed else []
+
+
+# Warehouse quantities per part, refreshed when the change feed marks the part dirty
+INVENTORY_CACHE = CacheRegion("inventory", INVENTORY_CACHE_MAX_AGE, max_entries=CACHE_MAX_ENTRIES)  # part_num -> tuple of WarehouseQty
 
 
-def query_epicor_part(part_num):
-    """Query part master info for description and UOM - uses cache for speed"""
+def get_part_warehouse_data(part_num, force=False):
+    """Warehouse quantities for a part - served from cache unless the change feed marked it dirty.
+    An empty tuple means no stock; None means Epicor couldn't be read.
+    """
+    dirty = take_dirty(DIRTY_PARTS, part_num)
+    if not dirty and not force:
+        cached = INVENTORY_CACHE.lookup(part_num, cache_max_age(INVENTORY_CACHE.ttl))
+        if cached is not CACHE_MISS:
+            return cached
+
+    result = query_epicor_partwhse(part_num)
+    if result is None:
+        # Don't keep serving the old quantities - the next access retries the fetch
+        INVENTORY_CACHE.evict(part_num)
+        return None
+    result = tuple(result)
+    INVENTORY_CACHE.store(part_num, result)
+    return result
+
+
+def query_epicor_part(part_num, force=False):
+    """Query part master info for description and UOM - uses cache for speed.
+    Returns PartInfo, or None if the part wasn't found or the query failed.
+    """
     # Check cache first
-    cache_entry = PART_INFO_CACHE.get(part_num)
-    if cache_entry:
-        cached_time, cached_data = cache_entry
-        if datetime.now() - cached_time < PART_CACHE_EXPIRY:
-            return cached_data
+    if not force:
+        cached = PART_INFO_CACHE.lookup(part_num)
+        if cached is not CACHE_MISS:
+            return cached
 
     try:
         url = f"{EPICOR_CONFIG['base_url']}/Erp.BO.PartSvc/Parts"
@@ -321,50 +1171,160 @@ def query_epicor_part(part_num):
             "$top": "1",
             "$select": "PartNum,PartDescription,IUM"
         }
-        response = requests.get(url, headers=get_epicor_headers(), params=params, timeout=30)
+        response = epicor_get(url, params=params, timeout=30)
         response.raise_for_status()
-        result = response.json()
+        records = response.json().get("value", [])
+        result = PartInfo.from_record(records[0]) if records else None
 
         # Cache the result
-        PART_INFO_CACHE[part_num] = (datetime.now(), result)
+        PART_INFO_CACHE.store(part_num, result)
         return result
     except requests.exceptions.RequestException as e:
-        print(f"Error querying Part for {part_num}: {e}")
+        log_event("error", "part.queryError", f"Error querying Part for {part_num}: {e}")
         return None
 
 
-def query_epicor_partbin(part_num):
-    """Query inventory by bin for a specific part using PartSvc/PartBins"""
+def query_epicor_partbins(part_nums):
+    """Query bin quantities for many parts using PartSvc/PartBins - chunked part filters, paged results.
+    Returns list of records, or None on failure.
+    """
     try:
         url = f"{EPICOR_CONFIG['base_url']}/Erp.BO.PartSvc/PartBins"
-        params = {
-            "$filter": f"PartNum eq '{part_num}'",
-            "$select": "PartNum,WarehouseCode,BinNum,OnhandQty"
-        }
-        response = requests.get(url, headers=get_epicor_headers(), params=params, timeout=30)
-        response.raise_for_status()
-        return response.json()
+        records = []
+        for part_filter in odata_or_filters("PartNum", part_nums):
+            params = {
+                "$filter": part_filter,
+                "$select": "PartNum,WarehouseCode,BinNum,OnhandQty",
+                "$orderby": "PartNum,WarehouseCode,BinNum"
+            }
+            records.extend(query_epicor_paged(url, params))
+        return records
     except requests.exceptions.RequestException as e:
-        print(f"Error querying PartBin for {part_num}: {e}")
+        log_event("error", "bins.queryError", f"Error querying PartBins: {e}")
         return None
 
 
+# Bin-level inventory index - part -> warehouse -> bin -> on-hand qty (inventory UOM).
+# Loaded for all components in one batched query; parts the change feed marks dirty
+# are reloaded together on the next access.
+BINS_LOCK = threading.Lock()
+BIN_INDEX = {}
+BINS_CACHE_TIME = None
+
+
+def _build_bin_index(records):
+    """Fold PartBins records into a part -> warehouse -> bin index"""
+    index = {}
+    for record in records:
+        part_num = record.get("PartNum", "")
+        if not part_num:
+            continue
+        warehouses = index.setdefault(part_num, {})
+        bins = warehouses.setdefault(record.get("WarehouseCode", ""), {})
+        bin_num = record.get("BinNum", "")
+        bins[bin_num] = bins.get(bin_num, 0) + float(record.get("OnhandQty", 0) or 0)
+    return index
+
+
+def load_part_bins(part_nums, force=False):
+    """Make sure the bin index covers part_nums and is current.
+    Does a full batched reload when cold/expired (or forced), otherwise reloads only dirty parts.
+    """
+    global BIN_INDEX, BINS_CACHE_TIME
+
+    with BINS_LOCK:
+        missing = [p for p in part_nums if p not in BIN_INDEX]
+        expired = BINS_CACHE_TIME is None or datetime.now() - BINS_CACHE_TIME >= cache_max_age(BINS_CACHE_MAX_AGE)
+        if force or expired:
+            records = query_epicor_partbins(part_nums)
+            if records is None:
+                raise RuntimeError("Failed to load PartBins from Epicor")
+            index = _build_bin_index(records)
+            for part_num in part_nums:
+                index.setdefault(part_num, {})  # Parts with no bins are still indexed
+            BIN_INDEX = index
+            BINS_CACHE_TIME = datetime.now()
+            log_event("info", "bins.loaded", f"Loaded {len(records)} PartBins records for {len(part_nums)} parts")
+            return
+
+        with CHANGE_FEED_LOCK:
+            dirty = [p for p in part_nums if p in DIRTY_BIN_PARTS]
+            DIRTY_BIN_PARTS.difference_update(dirty)
+        reload_parts = sorted(set(missing) | set(dirty))
+        if not reload_parts:
+            return
+        records = query_epicor_partbins(reload_parts)
+        if records is None:
+            with CHANGE_FEED_LOCK:
+                DIRTY_BIN_PARTS.update(dirty)  # Retry on the next access
+            raise RuntimeError("Failed to reload PartBins from Epicor")
+        index = _build_bin_index(records)
+        updated = dict(BIN_INDEX)
+        for part_num in reload_parts:
+            updated[part_num] = index.get(part_num, {})
+        BIN_INDEX = updated
+
+
+def get_part_bins(part_num, warehouse=None):
+    """Bins holding stock for a part from the index, largest quantity first"""
+    bins = []
+    for warehouse_code, warehouse_bins in BIN_INDEX.get(part_num, {}).items():
+        if warehouse and warehouse_code != warehouse:
+            continue
+        for bin_num, qty in warehouse_bins.items():
+            if qty:
+                bins.append({"warehouse": warehouse_code, "bin": bin_num, "onHand": qty})
+    bins.sort(key=lambda b: (-b["onHand"], b["warehouse"], b["bin"]))
+    return bins
+
+
+def odata_or_filters(field, values, chunk_size=None):
+    """Split an OR-filter over many values into chunks Epicor will accept.
+    Returns list of filter strings like "(PartNum eq 'A' or PartNum eq 'B')"
+    """
+    chunk_size = chunk_size or EPICOR_FILTER_CHUNK
+    values = sorted(values)
+    filters = []
+    for i in range(0, len(values), chunk_size):
+        terms = [f"{field} eq '{v}'" if isinstance(v, str) else f"{field} eq {v}" for v in values[i:i + chunk_size]]
+        filters.append("(" + " or ".join(terms) + ")")
+    return filters
+
+
+def query_epicor_paged(url, params, timeout=30):
+    """GET an OData collection page by page ($top/$skip) until a short page comes back.
+    Returns list of all records. Raises requests.exceptions.RequestException on failure.
+    """
+    records = []
+    skip = 0
+    while True:
+        page_params = dict(params)
+        page_params["$top"] = str(EPICOR_PAGE_SIZE)
+        page_params["$skip"] = str(skip)
+        response = epicor_get(url, params=page_params, timeout=timeout)
+        response.raise_for_status()
+        page = response.json().get("value", [])
+        records.extend(page)
+        if len(page) < EPICOR_PAGE_SIZE:
+            return records
+        skip += EPICOR_PAGE_SIZE
+
+
 def query_epicor_open_pos(part_nums):
-    """Query open purchase orders using POSvc/PORels"""
+    """Query open purchase orders using POSvc/PORels - chunked part filters, paged results"""
     try:
-        # Build filter for multiple parts - use POSvc not PORelSvc
-        part_filter = " or ".join([f"PartNum eq '{p}'" for p in part_nums])
         url = f"{EPICOR_CONFIG['base_url']}/Erp.BO.POSvc/PORels"
-        params = {
-            "$filter": f"({part_filter}) and OpenRelease eq true",
-            "$select": "PONum,POLine,PORelNum,PartNum,XRelQty,ReceivedQty,DueDate,PromiseDt",
-            "$orderby": "DueDate"
-        }
-        response = requests.get(url, headers=get_epicor_headers(), params=params, timeout=30)
-        response.raise_for_status()
-        return response.json()
+        records = []
+        for part_filter in odata_or_filters("PartNum", part_nums):
+            params = {
+                "$filter": f"{part_filter} and OpenRelease eq true",
+                "$select": "PONum,POLine,PORelNum,PartNum,XRelQty,ReceivedQty,DueDate,PromiseDt",
+                "$orderby": "DueDate"
+            }
+            records.extend(query_epicor_paged(url, params))
+        return {"value": records}
     except requests.exceptions.RequestException as e:
-        print(f"Error querying POs: {e}")
+        log_event("error", "pos.queryError", f"Error querying POs: {e}")
         return None
 
 
@@ -372,14 +1332,174 @@ def query_epicor_baq(baq_name, params_dict=None):
     """Query a BAQ (Business Activity Query) in Epicor"""
     try:
         url = f"{EPICOR_CONFIG['base_url']}/BaqSvc/{baq_name}"
-        response = requests.get(url, headers=get_epicor_headers(), params=params_dict, timeout=30)
+        response = epicor_get(url, params=params_dict, timeout=30)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
-        print(f"Error querying BAQ {baq_name}: {e}")
+        log_event("error", "baq.queryError", f"Error querying BAQ {baq_name}: {e}")
+        return None
+
+
+def query_epicor_baq_paged(baq_name, filters, orderby=None):
+    """Query a BAQ once per OData filter chunk, paging each. Returns None if the BAQ is unavailable.
+    Pass orderby (a unique row key) so $skip paging is stable.
+    """
+    url = f"{EPICOR_CONFIG['base_url']}/BaqSvc/{baq_name}"
+    records = []
+    try:
+        for baq_filter in filters:
+            params = {"$filter": baq_filter}
+            if orderby:
+                params["$orderby"] = orderby
+            records.extend(query_epicor_paged(url, params))
+        return records
+    except requests.exceptions.RequestException as e:
+        log_event("error", "baq.queryError", f"Error querying BAQ {baq_name}: {e}")
         return None
 
 
+# Change feed - a background poller reads Epicor records newer than a watermark and
+# marks only the affected parts, jobs and POs dirty so their cache entries get refetched
+CHANGE_FEED_LOCK = threading.Lock()
+CHANGE_FEED_WATERMARKS = {}  # source -> highest TranNum / SysRevID seen
+CHANGE_FEED_DISABLED = set()  # Optional sources the Epicor instance doesn't support
+CHANGE_FEED_LAST_POLL = None  # Time of last successful PartTrans poll
+DIRTY_PARTS = set()
+DIRTY_BIN_PARTS = set()  # Parts whose bin quantities changed (see load_part_bins)
+DIRTY_JOBS = set()
+DIRTY_POS = set()  # (PONum, POLine, PORelNum) release keys
+
+# Change feed sources: name -> (url path, watermark field, fields to select)
+CHANGE_FEED_SOURCES = {
+    "PartTrans": ("Erp.BO.PartTranSvc/PartTrans", "TranNum", "TranNum,PartNum,JobNum,PONum,POLine,PORelNum"),
+    "JobMtl": ("Erp.BO.JobMtlSearchSvc/JobMtlSearches", "SysRevID", "SysRevID,JobNum,PartNum"),
+    "PORel": ("Erp.BO.POSvc/PORels", "SysRevID", "SysRevID,PONum,POLine,PORelNum,PartNum"),
+}
+
+
+def _poll_change_source(source):
+    """Fetch records from one change source newer than its watermark.
+    The first poll only establishes the watermark (everything is cold then anyway).
+    Returns list of changed records.
+    """
+    path, field, select = CHANGE_FEED_SOURCES[source]
+    url = f"{EPICOR_CONFIG['base_url']}/{path}"
+    watermark = CHANGE_FEED_WATERMARKS.get(source)
+
+    if watermark is None:
+        params = {"$select": field, "$orderby": f"{field} desc", "$top": "1"}
+    else:
+        params = {
+            "$filter": f"{field} gt {watermark}",
+            "$select": select,
+            "$orderby": field,
+            "$top": "1000"
+        }
+    response = epicor_get(url, params=params, timeout=15)
+    response.raise_for_status()
+    records = response.json().get("value", [])
+
+    for record in records:
+        value = int(record.get(field, 0) or 0)
+        if watermark is None or value > watermark:
+            watermark = value
+    CHANGE_FEED_WATERMARKS[source] = watermark or 0
+    return records if params.get("$filter") else []
+
+
+def poll_change_feed():
+    """Run one change-feed poll across all sources and mark affected entries dirty"""
+    global CHANGE_FEED_LAST_POLL
+
+    changed_parts, changed_jobs, changed_pos, changed_bin_parts = set(), set(), set(), set()
+    for source in CHANGE_FEED_SOURCES:
+        if source in CHANGE_FEED_DISABLED:
+            continue
+        try:
+            records = _poll_change_source(source)
+        except requests.exceptions.RequestException as e:
+            if source == "PartTrans":
+                log_event("warning", "changeFeed.pollFailed", f"Change feed: PartTrans poll failed: {e}")
+                return
+            # JobMtl/PORel change stamps aren't exposed on every Epicor instance - Epicor rejects the
+            # stamp field with 400/404 then. Anything else (timeout, reset, 5xx) is retried next poll;
+            # the watermark hasn't moved, so nothing is missed
+            status = e.response.status_code if e.response is not None else None
+            if status in (400, 404):
+                log_event("warning", "changeFeed.sourceDisabled", f"Change feed: disabling {source} source: {e}",
+                          source=source, status=status)
+                CHANGE_FEED_DISABLED.add(source)
+            else:
+                log_event("warning", "changeFeed.pollFailed", f"Change feed: {source} poll failed, retrying next poll: {e}",
+                          source=source)
+            continue
+
+        for record in records:
+            part_num = record.get("PartNum", "")
+            # Only track entries we actually cache - everything else is fetched fresh anyway
+            if part_num in INVENTORY_CACHE:
+                changed_parts.add(part_num)
+            if part_num in BIN_INDEX:
+                changed_bin_parts.add(part_num)
+            if record.get("JobNum") in JOB_MATERIALS_CACHE:
+                changed_jobs.add(record["JobNum"])
+            if record.get("PONum"):
+                # Releases are tracked individually - (PONum, POLine, PORelNum)
+                key = (int(record["PONum"]), int(record.get("POLine") or 0), int(record.get("PORelNum") or 0))
+                if key in PO_RELEASES or part_num in PO_TRACKED_PARTS:
+                    changed_pos.add(key)
+
+    with CHANGE_FEED_LOCK:
+        DIRTY_PARTS.update(changed_parts)
+        DIRTY_BIN_PARTS.update(changed_bin_parts)
+        DIRTY_JOBS.update(changed_jobs)
+        DIRTY_POS.update(changed_pos)
+        CHANGE_FEED_LAST_POLL = datetime.now()
+
+    if changed_parts or changed_jobs or changed_pos:
+        log_event("info", "changeFeed.changes", f"Change feed: {len(changed_parts)} parts, {len(changed_jobs)} jobs, {len(changed_pos)} POs changed",
+                  parts=len(changed_parts), jobs=len(changed_jobs), pos=len(changed_pos))
+
+
+def change_feed_active():
+    """True when the poller is keeping up - otherwise caches must not be trusted beyond their TTL"""
+    return (CHANGE_FEED_LAST_POLL is not None and
+            datetime.now() - CHANGE_FEED_LAST_POLL < CHANGE_FEED_INTERVAL * 3)
+
+
+def cache_max_age(max_age):
+    """How long change-feed-tracked entries stay valid - the full max age while the feed
+    is healthy, otherwise a short TTL so untracked changes still show up promptly
+    """
+    return max_age if change_feed_active() else min(max_age, UNTRACKED_CACHE_MAX_AGE)
+
+
+def take_dirty(dirty_set, key):
+    """Check-and-clear a dirty flag. Returns True if key was dirty."""
+    with CHANGE_FEED_LOCK:
+        if key in dirty_set:
+            dirty_set.discard(key)
+            return True
+    return False
+
+
+def start_change_feed_poller():
+    """Start the background change-feed poller thread"""
+
+    def poll_loop():
+        EPICOR_PRIORITY.set("background")
+        REQUEST_ID.set("changefeed")
+        while True:
+            try:
+                poll_change_feed()
+            except Exception as e:
+                log_event("error", "changeFeed.error", f"Change feed: unexpected error: {e}")
+            time.sleep(CHANGE_FEED_INTERVAL.total_seconds())
+
+    thread = threading.Thread(target=poll_loop, daemon=True)
+    thread.start()
+
+
 # Global cache for job demands - refreshed per request cycle
 JOB_DEMANDS_CACHE = {}
 JOB_DEMANDS_CACHE_TIME = None
@@ -388,7 +1508,17 @@ JOB_DEMANDS_CACHE_TIME = None
 STARBUCKS_CUST_NUM = 272
 
 
-# Cache for Starbucks jobs (refreshed every 60 seconds)
+# Finished goods we build for Starbucks - only jobs for these parts are tracked
+SBX_FINISHED_GOODS = set(STARBUCKS_SKU_MAP)
+
+# BAQ returning JobHead+JobMtl+JobProd rows for open jobs (bulk load instead of GetByID per job).
+# Set JOB_MATERIALS_BAQ to the BAQ's ID in your Epicor instance - the columns it must return
+# are listed in the README (Job Materials Query)
+JOB_MATERIALS_BAQ = os.environ.get("JOB_MATERIALS_BAQ", "SBX_JobMaterials")
+JOB_MATERIALS_BAQ_ORDER = "JobHead_JobNum,JobMtl_MtlSeq,JobProd_OrderNum,JobProd_OrderLine,JobProd_OrderRelNum"
+JOB_GETBYID_LIMIT = 50  # Max jobs loaded through the per-job GetByID fallback
+
+# Cache for Starbucks jobs (refreshed every STARBUCKS_JOBS_CACHE_EXPIRY, adapted)
 STARBUCKS_JOBS_CACHE = set()
 STARBUCKS_JOBS_CACHE_TIME = None
 
@@ -404,25 +1534,25 @@ def get_starbucks_order_numbers():
             "$select": "OrderNum",
             "$top": "500"
         }
-        response = requests.get(url, headers=get_epicor_headers(), params=params, timeout=30)
+        response = epicor_get(url, params=params, timeout=30)
         if response.status_code == 200:
             data = response.json()
             orders = set(str(o.get("OrderNum", "")).zfill(6) for o in data.get("value", []) if o.get("OrderNum"))
             return orders
     except Exception as e:
-        print(f"Error getting Starbucks orders: {e}")
+        log_event("error", "jobs.ordersError", f"Error getting Starbucks orders: {e}")
     return set()
 
 
-def get_starbucks_open_jobs():
+def get_starbucks_open_jobs(force=False):
     """Get list of open job numbers for Starbucks customer (CustNum 272).
     Returns set of job numbers like {'025043-1-1', '024189-1-1', ...}
     Uses two methods: XRefCustNum and job number pattern matching to order numbers.
     """
     global STARBUCKS_JOBS_CACHE, STARBUCKS_JOBS_CACHE_TIME
 
-    # Return cached data if less than 60 seconds old
-    if STARBUCKS_JOBS_CACHE_TIME and (datetime.now() - STARBUCKS_JOBS_CACHE_TIME).seconds < 60:
+    # Return cached data while within its TTL
+    if not force and STARBUCKS_JOBS_CACHE_REGION.check(STARBUCKS_JOBS_CACHE_TIME):
         return STARBUCKS_JOBS_CACHE
 
     all_jobs = set()
@@ -435,12 +1565,12 @@ def get_starbucks_open_jobs():
             "$select": "JobNum",
             "$top": "500"
         }
-        response = requests.get(url, headers=get_epicor_headers(), params=params, timeout=30)
+        response = epicor_get(url, params=params, timeout=30)
         if response.status_code == 200:
             data = response.json()
             jobs = set(j.get("JobNum", "") for j in data.get("value", []) if j.get("JobNum"))
             all_jobs.update(jobs)
-            print(f"Found {len(jobs)} jobs via XRefCustNum")
+            log_event("info", "jobs.foundByXRef", f"Found {len(jobs)} jobs via XRefCustNum")
 
         # Method 2: Get Starbucks open orders and match job numbers
         starbucks_orders = get_starbucks_order_numbers()
@@ -453,7 +1583,7 @@ def get_starbucks_open_jobs():
                 "$orderby": "JobNum desc",  # Most recent jobs first
                 "$top": "2000"  # Increase limit to get more jobs
             }
-            response = requests.get(url, headers=get_epicor_headers(), params=params, timeout=30)
+            response = epicor_get(url, params=params, timeout=30)
             if response.status_code == 200:
                 data = response.json()
                 order_matched = 0
@@ -465,141 +1595,255 @@ def get_starbucks_open_jobs():
                         if order_part in starbucks_orders:
                             all_jobs.add(job_num)
                             order_matched += 1
-                print(f"Found {order_matched} additional jobs via order number matching")
+                log_event("info", "jobs.foundByOrder", f"Found {order_matched} additional jobs via order number matching")
 
-        print(f"Total Starbucks jobs: {len(all_jobs)}")
+        log_event("info", "jobs.starbucksTotal", f"Total Starbucks jobs: {len(all_jobs)}")
+        if STARBUCKS_JOBS_CACHE_TIME:
+            STARBUCKS_JOBS_CACHE_REGION.observe(STARBUCKS_JOBS_CACHE, all_jobs)
         STARBUCKS_JOBS_CACHE = all_jobs
         STARBUCKS_JOBS_CACHE_TIME = datetime.now()
         return all_jobs
 
     except Exception as e:
-        print(f"Error getting Starbucks jobs: {e}")
+        log_event("error", "jobs.starbucksError", f"Error getting Starbucks jobs: {e}")
 
     return STARBUCKS_JOBS_CACHE if STARBUCKS_JOBS_CACHE else set()
 
 
+# Per-job GetByID results, refreshed when the change feed marks the job dirty
+JOB_MATERIALS_CACHE = CacheRegion("jobMaterials", JOB_MATERIALS_CACHE_MAX_AGE, max_entries=CACHE_MAX_ENTRIES)  # job_num -> (materials, job_prods)
+
+
 def get_job_materials_via_getbyid(job_num):
     """Get job materials using GetByID method (OData entity query doesn't return materials).
-    Returns tuple of (materials, job_prod_data) where job_prod_data contains order link info.
+    Returns tuple of (materials, job_prods) - JobMaterial and JobOrderLink records.
     """
+    dirty = take_dirty(DIRTY_JOBS, job_num)
+    if not dirty:
+        cached = JOB_MATERIALS_CACHE.lookup(job_num, cache_max_age(JOB_MATERIALS_CACHE.ttl))
+        if cached is not CACHE_MISS:
+            return cached
+
     try:
         url = f"{EPICOR_CONFIG['base_url']}/Erp.BO.JobEntrySvc/GetByID"
         params = {"jobNum": job_num}
-        response = requests.get(url, headers=get_epicor_headers(), params=params, timeout=15)
+        # Hedged - a few slow GetByID calls otherwise set the wall time of the whole batch
+        response = epicor_get_hedged(url, params=params, timeout=15)
         if response.status_code == 200:
             data = response.json()
             if 'returnObj' in data:
-                materials = data['returnObj'].get('JobMtl', [])
-                job_prods = data['returnObj'].get('JobProd', [])
+                # Keep only the fields we use - the full dataset has dozens of columns per row
+                materials = tuple(JobMaterial.from_record(m) for m in data['returnObj'].get('JobMtl', []))
+                job_prods = tuple(JobOrderLink.from_record(p) for p in data['returnObj'].get('JobProd', []))
+                JOB_MATERIALS_CACHE.store(job_num, (materials, job_prods))
                 return (materials, job_prods)
     except Exception as e:
-        print(f"Error getting materials for job {job_num}: {e}")
-    return ([], [])
+        log_event("error", "jobs.materialsError", f"Error getting materials for job {job_num}: {e}")
+    return ((), ())
 
 
-def query_all_job_demands(part_nums):
-    """Query open job material demands for Starbucks orders only.
-    Uses GetByID method since OData entity queries don't return job materials.
-    Returns dict of part_num -> {totalDemand, jobCount, jobs}
+# Open Starbucks SBX jobs with their materials and order links, loaded in bulk
+OPEN_SBX_JOBS = {}  # job_num -> OpenJob
+OPEN_SBX_JOBS_TIME = None
+OPEN_SBX_JOBS_SOURCE = None  # "baq" (JOB_MATERIALS_BAQ) or "getbyid" (fallback)
+
+
+def parse_job_materials_baq(rows):
+    """Group JobHead+JobMtl+JobProd BAQ rows by job.
+    The BAQ returns one row per material x order link, so materials are de-duplicated
+    by MtlSeq and order links by OrderNum/Line/Rel.
+    Returns dict of job_num -> OpenJob
     """
-    global JOB_DEMANDS_CACHE, JOB_DEMANDS_CACHE_TIME
+    grouped = {}  # job_num -> (info, {mtl_seq: material}, {order key: link})
+    for row in rows:
+        job_num = row.get("JobHead_JobNum", "")
+        if not job_num:
+            continue
+        job = grouped.get(job_num)
+        if job is None:
+            job = grouped[job_num] = (JobInfo.from_record(row, "JobHead_"), {}, {})
+
+        mtl_seq = row.get("JobMtl_MtlSeq")
+        if row.get("JobMtl_PartNum") and mtl_seq not in job[1]:
+            job[1][mtl_seq] = JobMaterial.from_record(row, "JobMtl_")
+
+        prod_key = (row.get("JobProd_OrderNum"), row.get("JobProd_OrderLine"), row.get("JobProd_OrderRelNum"))
+        if prod_key[0] and prod_key not in job[2]:
+            job[2][prod_key] = JobOrderLink.from_record(row, "JobProd_")
 
-    # Cache job demands for 5 minutes to avoid repeated expensive queries
-    if JOB_DEMANDS_CACHE_TIME and (datetime.now() - JOB_DEMANDS_CACHE_TIME).seconds < 300:
-        return JOB_DEMANDS_CACHE
+    return {
+        job_num: OpenJob(info, materials.values(), prods.values())
+        for job_num, (info, materials, prods) in grouped.items()
+    }
+
+
+def fetch_open_sbx_jobs_via_baq(starbucks_jobs, job_nums=None):
+    """Load open SBX jobs through the JOB_MATERIALS_BAQ - the SBX part filter is applied
+    server-side and results are paged. Pass job_nums to refetch just those jobs.
+    Returns None if the BAQ is unavailable.
+    """
+    if job_nums:
+        filters = odata_or_filters("JobHead_JobNum", job_nums)
+    else:
+        open_filter = "JobHead_JobComplete eq false and JobHead_JobClosed eq false"
+        filters = [f"{open_filter} and {part_filter}"
+                   for part_filter in odata_or_filters("JobHead_PartNum", SBX_FINISHED_GOODS)]
+    rows = query_epicor_baq_paged(JOB_MATERIALS_BAQ, filters, orderby=JOB_MATERIALS_BAQ_ORDER)
+    if rows is None:
+        return None
+
+    jobs = parse_job_materials_baq(rows)
+    return {
+        job_num: job for job_num, job in jobs.items()
+        if job_num in starbucks_jobs and job.info.part_num in SBX_FINISHED_GOODS
+    }
 
+
+def fetch_open_sbx_jobs_via_getbyid(starbucks_jobs):
+    """Fallback loader: JobEntries for job info, then one GetByID per job for materials.
+    Limited to the most recent JOB_GETBYID_LIMIT jobs to avoid timeouts.
+    """
+    url = f"{EPICOR_CONFIG['base_url']}/Erp.BO.JobEntrySvc/JobEntries"
+    params = {
+        "$filter": "JobComplete eq false and JobClosed eq false",
+        "$select": "JobNum,PartNum,PartDescription,ProdQty,StartDate,ReqDueDate",
+        "$orderby": "JobNum desc",
+        "$top": "2000"
+    }
+    response = epicor_get(url, params=params, timeout=30)
+    job_info = {}
+    if response.status_code == 200:
+        for job in response.json().get("value", []):
+            job_info[job.get("JobNum", "")] = JobInfo.from_record(job)
+
+    # Filter Starbucks jobs to only SBX finished goods
+    sbx_jobs = [j for j in starbucks_jobs if j in job_info and job_info[j].part_num in SBX_FINISHED_GOODS]
+
+    # Sort by job number descending to get most recent first
+    recent_sbx_jobs = sorted(sbx_jobs, reverse=True)[:JOB_GETBYID_LIMIT]
+    log_event("info", "jobs.getByIdFallback", f"Processing {len(recent_sbx_jobs)} most recent SBX jobs via GetByID")
+
+    jobs = {}
+    with ThreadPoolExecutor(max_workers=15) as executor:
+        futures = {submit_in_context(executor, get_job_materials_via_getbyid, job): job for job in recent_sbx_jobs}
+        for future in as_completed(futures):
+            job_num = futures[future]
+            materials, job_prods = future.result()
+            jobs[job_num] = OpenJob(job_info[job_num], materials, job_prods)
+    return jobs
+
+
+def load_open_sbx_jobs(force=False):
+    """Open Starbucks SBX jobs with materials and order links - the single result set
+    that both job demands and job cards are built from.
+    Uses the bulk BAQ when available and falls back to per-job GetByID.
+    Returns dict of job_num -> OpenJob
+    """
+    global OPEN_SBX_JOBS, OPEN_SBX_JOBS_TIME, OPEN_SBX_JOBS_SOURCE
+
+    starbucks_jobs = get_starbucks_open_jobs()
+    if not starbucks_jobs:
+        log_event("info", "jobDemands.noJobs", "No Starbucks jobs found - no demands to track")
+        return {}
+
+    if not force and OPEN_SBX_JOBS_CACHE_REGION.check(OPEN_SBX_JOBS_TIME):
+        # Only the jobs the change feed flagged need reloading
+        with CHANGE_FEED_LOCK:
+            dirty_jobs = DIRTY_JOBS & set(OPEN_SBX_JOBS)
+            # Jobs that are no longer open won't be loaded again - drop their flags
+            DIRTY_JOBS.intersection_update(OPEN_SBX_JOBS)
+        if not dirty_jobs:
+            return OPEN_SBX_JOBS
+        if OPEN_SBX_JOBS_SOURCE == "baq":
+            refreshed = fetch_open_sbx_jobs_via_baq(starbucks_jobs, dirty_jobs)
+            if refreshed is not None:
+                with CHANGE_FEED_LOCK:
+                    DIRTY_JOBS.difference_update(dirty_jobs)
+                jobs = {j: job for j, job in OPEN_SBX_JOBS.items() if j not in dirty_jobs}
+                jobs.update(refreshed)
+                OPEN_SBX_JOBS = jobs
+                return jobs
+
+    jobs = fetch_open_sbx_jobs_via_baq(starbucks_jobs)
+    source = "baq"
+    if jobs is None:
+        log_event("warning", "jobs.baqUnavailable", f"BAQ {JOB_MATERIALS_BAQ} unavailable - falling back to per-job GetByID")
+        jobs = fetch_open_sbx_jobs_via_getbyid(starbucks_jobs)
+        source = "getbyid"
+    else:
+        with CHANGE_FEED_LOCK:
+            DIRTY_JOBS.difference_update(jobs)
+        # Keep the per-job cache warm so a later fallback doesn't start cold
+        for job_num, job in jobs.items():
+            JOB_MATERIALS_CACHE.store(job_num, (job.materials, job.prods))
+
+    log_event("info", "jobs.loaded", f"Loaded {len(jobs)} open Starbucks SBX jobs via {source}",
+              jobs=len(jobs), source=source)
+    if OPEN_SBX_JOBS_TIME:
+        OPEN_SBX_JOBS_CACHE_REGION.observe(OPEN_SBX_JOBS, jobs)
+    OPEN_SBX_JOBS = jobs
+    OPEN_SBX_JOBS_TIME = datetime.now()
+    OPEN_SBX_JOBS_SOURCE = source
+    return jobs
+
+
+def aggregate_job_demands(jobs, part_nums):
+    """Sum remaining (required - issued) material per part across jobs.
+    Returns dict of part_num -> {totalDemand, jobCount, jobs}
+    """
     results = {p: {"totalDemand": 0, "jobCount": 0, "jobs": []} for p in part_nums}
-    part_nums_set = set(part_nums)
 
-    try:
-        # First get Starbucks job numbers
-        starbucks_jobs = get_starbucks_open_jobs()
-        if not starbucks_jobs:
-            print("No Starbucks jobs found - no demands to track")
-            JOB_DEMANDS_CACHE = results
-            JOB_DEMANDS_CACHE_TIME = datetime.now()
-            return results
-
-        # Filter to only jobs that produce SBX parts (our finished goods)
-        sbx_finished_goods = {'SBX-22721', 'SBX-22880', 'SBX-24540', 'SBX-24541', 'SBX-24545'}
-
-        # Query jobs to get their part numbers
-        url = f"{EPICOR_CONFIG['base_url']}/Erp.BO.JobEntrySvc/JobEntries"
-        params = {
-            "$filter": "JobComplete eq false and JobClosed eq false",
-            "$select": "JobNum,PartNum",
-            "$orderby": "JobNum desc",
-            "$top": "2000"
-        }
-        response = requests.get(url, headers=get_epicor_headers(), params=params, timeout=30)
-        job_parts = {}
-        if response.status_code == 200:
-            for job in response.json().get("value", []):
-                job_parts[job.get("JobNum", "")] = job.get("PartNum", "")
-
-        # Filter Starbucks jobs to only SBX finished goods
-        sbx_jobs = [j for j in starbucks_jobs if job_parts.get(j, "") in sbx_finished_goods]
-        print(f"Found {len(sbx_jobs)} Starbucks SBX jobs to check for materials")
-
-        # Query materials for each SBX job using GetByID (limited to avoid timeout)
-        # Process in parallel for speed
-        def process_job(job_num):
-            materials, _ = get_job_materials_via_getbyid(job_num)
-            job_demands = []
-            for mtl in materials:
-                part_num = mtl.get("PartNum", "")
-                if part_num in part_nums_set:
-                    required = float(mtl.get("RequiredQty", 0) or 0)
-                    issued = float(mtl.get("IssuedQty", 0) or 0)
-                    remaining = max(0, required - issued)
-                    if remaining > 0:
-                        job_demands.append({
-                            "partNum": part_num,
-                            "jobNum": job_num,
-                            "required": required,
-                            "issued": issued,
-                            "remaining": remaining
-                        })
-            return job_demands
-
-        # Process most recent jobs in parallel (limit to 30 jobs to avoid timeout)
-        # Sort by job number descending to get most recent first
-        recent_sbx_jobs = sorted(sbx_jobs, reverse=True)[:30]
-        print(f"Processing {len(recent_sbx_jobs)} most recent SBX jobs for materials")
-
-        all_demands = []
-        with ThreadPoolExecutor(max_workers=15) as executor:  # Increased parallelism
-            futures = {executor.submit(process_job, job): job for job in recent_sbx_jobs}
-            for future in as_completed(futures):
-                demands = future.result()
-                all_demands.extend(demands)
-
-        # Aggregate demands by part
-        for demand in all_demands:
-            part_num = demand["partNum"]
-            if part_num in results:
-                results[part_num]["totalDemand"] += demand["remaining"]
+    for job_num, job in jobs.items():
+        for mtl in job.materials:
+            part_num = mtl.part_num
+            if part_num not in results:
+                continue
+            required = mtl.required_qty
+            issued = mtl.issued_qty
+            remaining = max(0, required - issued)
+            if remaining > 0:
+                results[part_num]["totalDemand"] += remaining
                 results[part_num]["jobs"].append({
-                    "jobNum": demand["jobNum"],
-                    "required": demand["required"],
-                    "issued": demand["issued"],
-                    "remaining": demand["remaining"]
+                    "jobNum": job_num,
+                    "required": required,
+                    "issued": issued,
+                    "remaining": remaining
                 })
 
-        # Calculate job counts
-        for part_num in results:
-            results[part_num]["jobCount"] = len(results[part_num]["jobs"])
+    # Calculate job counts
+    for part_num in results:
+        results[part_num]["jobCount"] = len(results[part_num]["jobs"])
+    return results
+
+
+def query_all_job_demands(part_nums, force=False):
+    """Query open job material demands for Starbucks orders only.
+    Built from the bulk open-job result set (see load_open_sbx_jobs).
+    Returns dict of part_num -> {totalDemand, jobCount, jobs}
+    """
+    global JOB_DEMANDS_CACHE, JOB_DEMANDS_CACHE_TIME
+
+    # Cache job demands (JOB_DEMANDS_CACHE_EXPIRY, adapted) to avoid repeated expensive queries
+    # A dirty job forces re-aggregation, but only that job's materials are refetched
+    if not force and not DIRTY_JOBS and JOB_DEMANDS_CACHE_REGION.check(JOB_DEMANDS_CACHE_TIME):
+        return JOB_DEMANDS_CACHE
+
+    try:
+        jobs = load_open_sbx_jobs()
+        results = aggregate_job_demands(jobs, part_nums)
 
         total_demand = sum(r["totalDemand"] for r in results.values())
-        print(f"Total material demands found: {total_demand}")
+        log_event("info", "jobDemands.loaded", f"Total material demands found: {total_demand}")
 
+        if JOB_DEMANDS_CACHE_TIME:
+            JOB_DEMANDS_CACHE_REGION.observe(JOB_DEMANDS_CACHE, results)
         JOB_DEMANDS_CACHE = results
         JOB_DEMANDS_CACHE_TIME = datetime.now()
         return results
 
     except requests.exceptions.RequestException as e:
-        print(f"Error querying batch job demands: {e}")
-        return results
+        log_event("error", "jobDemands.error", f"Error querying batch job demands: {e}")
+        return {p: {"totalDemand": 0, "jobCount": 0, "jobs": []} for p in part_nums}
 
 
 def query_epicor_job_demands(part_num):
@@ -625,16 +1869,15 @@ def apply_uom_conversion(part_num, qty, from_uom):
 
 def fetch_part_inventory(part_num):
     """Fetch inventory, part info, and job demands for a single part - used for parallel execution"""
-    whse_result = query_epicor_partwhse(part_num)
+    whse_result = get_part_warehouse_data(part_num)
     part_result = query_epicor_part(part_num)
     demand_result = query_epicor_job_demands(part_num)
 
     description = ""
     uom = "EA"
-    if part_result and "value" in part_result and len(part_result["value"]) > 0:
-        part_info = part_result["value"][0]
-        description = part_info.get("PartDescription", "")
-        uom = part_info.get("IUM", "EA")
+    if part_result:
+        description = part_result.description
+        uom = part_result.ium
 
     # Get job demand (committed to open jobs)
     job_demand = 0
@@ -643,9 +1886,10 @@ def fetch_part_inventory(part_num):
         job_demand = demand_result.get("totalDemand", 0)
         job_count = len(demand_result.get("jobs", []))
 
-    if whse_result and "value" in whse_result and len(whse_result["value"]) > 0:
-        total_on_hand = sum(float(r.get("OnHandQty", 0) or 0) for r in whse_result["value"])
-        total_allocated = sum(float(r.get("AllocatedQty", 0) or 0) for r in whse_result["value"])
+    # An empty result is a part with no stock; only None means the fetch failed
+    if whse_result is not None:
+        total_on_hand = sum(w.on_hand for w in whse_result)
+        total_allocated = sum(w.allocated for w in whse_result)
 
         # True available = On Hand - Allocated (from Epicor) - Job Demands (uncommitted material)
         # Note: Epicor's AllocatedQty may or may not include job demands depending on config
@@ -679,11 +1923,11 @@ def fetch_part_inventory(part_num):
             "conversionApplied": conversion_applied,
             "warehouses": [
                 {
-                    "warehouseCode": r.get("WarehouseCode", ""),
-                    "onHand": float(r.get("OnHandQty", 0) or 0),
-                    "allocated": float(r.get("AllocatedQty", 0) or 0)
+                    "warehouseCode": w.warehouse_code,
+                    "onHand": w.on_hand,
+                    "allocated": w.allocated
                 }
-                for r in whse_result["value"]
+                for w in whse_result
             ],
             "error": None
         }
@@ -705,10 +1949,183 @@ def fetch_part_inventory(part_num):
         }
 
 
-@app.route('/api/inventory', methods=['GET'])
+# Admission control - expensive endpoints run at most `concurrency` at a time with a
+# bounded wait queue. Requests that can't get a slot are shed: they get the endpoint's
+# last good response if there is one, otherwise 503 with Retry-After.
+ADMISSION_STATS = {
+    name: {"active": 0, "queued": 0, "admitted": 0, "shed": 0, "servedStale": 0,
+           "timedOut": 0, "queueFull": 0, "maxQueued": 0, "waitMsTotal": 0}
+    for name in ADMISSION_LIMITS
+}
+ADMISSION_CONDITIONS = {name: threading.Condition() for name in ADMISSION_LIMITS}
+ADMISSION_LAST_RESPONSE = {name: {} for name in ADMISSION_LIMITS}  # full path -> (time, body)
+ADMISSION_LAST_RESPONSE_MAX = 50  # Stale responses kept per endpoint (distinct query strings)
+
+
+def _admit(name):
+    """Wait for a slot on the endpoint. Returns None when admitted, else the shed reason."""
+
+    concurrency, queue_size, max_wait = ADMISSION_LIMITS[name]
+    stats = ADMISSION_STATS[name]
+    condition = ADMISSION_CONDITIONS[name]
+    with condition:
+        if stats["active"] < concurrency and stats["queued"] == 0:
+            stats["active"] += 1
+            stats["admitted"] += 1
+            return None
+        if stats["queued"] >= queue_size:
+            stats["queueFull"] += 1
+            return "queueFull"
+
+        stats["queued"] += 1
+        stats["maxQueued"] = max(stats["maxQueued"], stats["queued"])
+        started = time.monotonic()
+        deadline = started + max_wait.total_seconds()
+        try:
+            while stats["active"] >= concurrency:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    stats["timedOut"] += 1
+                    return "timedOut"
+                condition.wait(remaining)
+        finally:
+            stats["queued"] -= 1
+            stats["waitMsTotal"] += int((time.monotonic() - started) * 1000)
+        stats["active"] += 1
+        stats["admitted"] += 1
+        return None
+
+
+def _release(name):
+    condition = ADMISSION_CONDITIONS[name]
+    with condition:
+        ADMISSION_STATS[name]["active"] -= 1
+        condition.notify()
+
+
+def admission_controlled(name, fallback=None):
+    """Route decorator applying the ADMISSION_LIMITS entry for `name`.
+    fallback: optional callable returning a cached payload to serve when shed
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            reason = _admit(name)
+            if reason:
+                with ADMISSION_CONDITIONS[name]:
+                    ADMISSION_STATS[name]["shed"] += 1
+                    cached = ADMISSION_LAST_RESPONSE[name].get(request.full_path)
+                log_event("warning", "admission.shed", f"Shedding {request.full_path} ({reason}){' - serving last response' if cached else ''}",
+                          endpoint=name, reason=reason, servedStale=bool(cached))
+                if cached:
+                    with ADMISSION_CONDITIONS[name]:
+                        ADMISSION_STATS[name]["servedStale"] += 1
+                    response = Response(cached[1], mimetype="application/json")
+                    response.headers["X-Served-Stale"] = cached[0].isoformat()
+                    return response
+                payload = fallback() if fallback else None
+                if payload:
+                    with ADMISSION_CONDITIONS[name]:
+                        ADMISSION_STATS[name]["servedStale"] += 1
+                    response = jsonify(payload)
+                    response.headers["X-Served-Stale"] = payload.get("timestamp", "")
+                    return response
+                response = jsonify({
+                    "success": False,
+                    "error": f"Server busy - too many concurrent {name} requests",
+                    "timestamp": datetime.now().isoformat()
+                })
+                response.status_code = 503
+                response.headers["Retry-After"] = str(ADMISSION_RETRY_AFTER)
+                return response
+
+            try:
+                response = make_response(view(*args, **kwargs))
+            finally:
+                _release(name)
+
+            # Remember successful payloads so shed requests can still be answered
+            if response.status_code == 200 and response.is_json and (response.get_json(silent=True) or {}).get("success", True):
+                body = response.get_data()
+                # Request threads store and shed lookups run concurrently - all under the endpoint's lock
+                with ADMISSION_CONDITIONS[name]:
+                    last = ADMISSION_LAST_RESPONSE[name]
+                    last[request.full_path] = (datetime.now(), body)
+                    if len(last) > ADMISSION_LAST_RESPONSE_MAX:
+                        del last[min(last, key=lambda path: last[path][0])]
+            return response
+        return wrapper
+    return decorator
+
+
+@api.route('/api/inventory', methods=['GET'])
 def get_inventory():
-    """Query current inventory from Epicor for all BOM components - REAL-TIME DATA ONLY"""
+    """Query current inventory from Epicor for all BOM components - REAL-TIME DATA ONLY
+    Query params:
+        bins: "true" to include each part's bin breakdown (from the bin index)
+    """
+    components = get_all_components()
+    inventory_data, errors = load_inventory(components)
+
+    if request.args.get('bins', '').lower() == 'true':
+        try:
+            load_part_bins(components)
+        except Exception as e:
+            log_event("error", "bins.indexError", f"Error loading bin index: {e}")
+        for part_num, part_data in inventory_data.items():
+            part_data["bins"] = get_part_bins(part_num)
+
+    return jsonify({
+        "success": len(errors) == 0,
+        "data": inventory_data,
+        "timestamp": datetime.now().isoformat(),
+        "source": "Epicor Kinetic REST API - Live",
+        "errors": errors if errors else None
+    })
+
+
+@api.route('/api/inventory/bins', methods=['GET'])
+def get_inventory_bins():
+    """Bin-level on-hand quantities (inventory UOM) for BOM components - pick locations.
+    Query params:
+        part_num: Filter by specific part (optional)
+        warehouse: Filter by warehouse code (optional)
+    """
+    part_num = request.args.get('part_num')
+    warehouse = request.args.get('warehouse')
     components = get_all_components()
+
+    try:
+        load_part_bins(components)
+    except Exception as e:
+        log_event("error", "bins.indexError", f"Error loading bin index: {e}")
+        if not BINS_CACHE_TIME:
+            return jsonify({
+                "success": False,
+                "error": str(e),
+                "timestamp": datetime.now().isoformat()
+            })
+
+    parts = [part_num] if part_num else sorted(components)
+    data = {p: get_part_bins(p, warehouse) for p in parts}
+    return jsonify({
+        "success": True,
+        "data": data,
+        "count": sum(len(bins) for bins in data.values()),
+        "filter": {
+            "partNum": part_num,
+            "warehouse": warehouse
+        },
+        "asOf": BINS_CACHE_TIME.isoformat() if BINS_CACHE_TIME else None,
+        "timestamp": datetime.now().isoformat()
+    })
+
+
+def load_inventory(components):
+    """Inventory, part info and job demand per component.
+    Returns tuple of (inventory_data, errors) - errors lists parts that failed to load
+    """
     inventory_data = {}
     errors = []
 
@@ -717,7 +2134,7 @@ def get_inventory():
 
     # Use ThreadPoolExecutor for parallel requests (max 5 concurrent to avoid rate limiting)
     with ThreadPoolExecutor(max_workers=5) as executor:
-        future_to_part = {executor.submit(fetch_part_inventory, part): part for part in components}
+        future_to_part = {submit_in_context(executor, fetch_part_inventory, part): part for part in components}
 
         for future in as_completed(future_to_part):
             part_num = future_to_part[future]
@@ -727,7 +2144,7 @@ def get_inventory():
                 if result.get("error"):
                     errors.append(part_num)
             except Exception as e:
-                print(f"Error fetching inventory for {part_num}: {e}")
+                log_event("error", "inventory.fetchError", f"Error fetching inventory for {part_num}: {e}")
                 errors.append(part_num)
                 inventory_data[part_num] = {
                     "partNum": part_num,
@@ -740,89 +2157,229 @@ def get_inventory():
                     "error": str(e)
                 }
 
-    return jsonify({
-        "success": len(errors) == 0,
-        "data": inventory_data,
-        "timestamp": datetime.now().isoformat(),
-        "source": "Epicor Kinetic REST API - Live",
-        "errors": errors if errors else None
-    })
+    return (inventory_data, errors)
 
 
-@app.route('/api/pos', methods=['GET'])
-def get_open_pos():
-    """Query open purchase orders from Epicor for BOM components"""
-    components = get_all_components()
+# Open PO release index - releases keyed by (PONum, POLine, PORelNum) with secondary
+# indexes by part and by due date. Releases are refreshed individually when the change
+# feed sees their change stamp move.
+PO_LOCK = threading.Lock()
+PO_RELEASES = {}  # release key -> po release row
+PO_BY_PART = {}  # part_num -> set of release keys
+PO_BY_DUE = []  # sorted list of (due date, release key)
+PO_TRACKED_PARTS = set()  # Components covered by the last full load
+POS_CACHE_TIME = None
+POS_CACHE_SOURCE = None  # "baq" (MRP_POs) or "porels" (fallback)
 
-    # Try querying the MRP_POs BAQ first
-    baq_result = query_epicor_baq("MRP_POs")
 
-    pos_data = {}
+def po_release_key(row):
+    """Index key for a PO release row"""
+    return (int(row.get("poNum") or 0), int(row.get("poLine") or 0), int(row.get("relNum") or 0))
 
-    if baq_result and "value" in baq_result:
-        for record in baq_result["value"]:
-            part_num = record.get("PODetail_PartNum", "")
-            if part_num in components:
-                if part_num not in pos_data:
-                    pos_data[part_num] = []
-
-                # Ensure numeric conversion - Epicor may return strings
-                rel_qty = float(record.get("PORel_XRelQty", 0) or record.get("RelQty", 0) or 0)
-                recv_qty = float(record.get("PORel_ReceivedQty", 0) or record.get("ReceivedQty", 0) or 0)
-
-                pos_data[part_num].append({
-                    "poNum": record.get("PORel_PONum", "") or record.get("PONum", ""),
-                    "poLine": record.get("PORel_POLine", "") or record.get("POLine", ""),
-                    "relNum": record.get("PORel_PORelNum", "") or record.get("PORelNum", ""),
-                    "partNum": part_num,
-                    "description": record.get("PODetail_LineDesc", "") or record.get("LineDesc", ""),
-                    "vendorName": record.get("Vendor_Name", "") or record.get("VendorName", ""),
-                    "orderQty": rel_qty,
-                    "receivedQty": recv_qty,
-                    "remainQty": rel_qty - recv_qty,
-                    "uom": record.get("PORel_BaseUOM", "") or record.get("UOM", "EA"),
-                    "dueDate": record.get("PORel_DueDate", "") or record.get("DueDate", ""),
-                    "promiseDate": record.get("PORel_PromiseDt", "") or record.get("PromiseDt", ""),
-                    "status": record.get("Calculated_Status", "Open")
-                })
-    else:
-        # Fallback: Query PORels directly
-        result = query_epicor_open_pos(components)
-        if result and "value" in result:
-            for record in result["value"]:
-                part_num = record.get("PartNum", "")
-                if part_num not in pos_data:
-                    pos_data[part_num] = []
-
-                # Ensure numeric conversion - Epicor may return strings
-                rel_qty = float(record.get("XRelQty", 0) or record.get("RelQty", 0) or 0)
-                recv_qty = float(record.get("ReceivedQty", 0) or 0)
-
-                pos_data[part_num].append({
-                    "poNum": record.get("PONum", ""),
-                    "poLine": record.get("POLine", ""),
-                    "relNum": record.get("PORelNum", ""),
-                    "partNum": part_num,
-                    "description": record.get("LineDesc", ""),
-                    "vendorName": record.get("VendorName", ""),
-                    "orderQty": rel_qty,
-                    "receivedQty": recv_qty,
-                    "remainQty": rel_qty - recv_qty,
-                    "uom": "EA",
-                    "dueDate": record.get("DueDate", ""),
-                    "promiseDate": record.get("PromiseDt", ""),
-                    "status": "Open"
-                })
 
-    return jsonify({
-        "success": True,
-        "data": pos_data,
-        "timestamp": datetime.now().isoformat(),
-        "source": "Epicor REST API"
-    })
+def _po_due_key(row):
+    """Sort key for the due-date index - undated releases sort last"""
+    return (row.get("dueDate") or "9999-12-31")[:10]
 
 
-@app.route('/api/bom', methods=['GET'])
+def _index_po_release(row):
+    """Add a release to all indexes - caller must hold PO_LOCK"""
+    key = po_release_key(row)
+    _unindex_po_release(key)
+    PO_RELEASES[key] = row
+    PO_BY_PART.setdefault(row["partNum"], set()).add(key)
+    bisect.insort(PO_BY_DUE, (_po_due_key(row), key))
+
+
+def _unindex_po_release(key):
+    """Remove a release from all indexes - caller must hold PO_LOCK"""
+    row = PO_RELEASES.pop(key, None)
+    if row is None:
+        return
+    PO_BY_PART.get(row["partNum"], set()).discard(key)
+    entry = (_po_due_key(row), key)
+    i = bisect.bisect_left(PO_BY_DUE, entry)
+    if i < len(PO_BY_DUE) and PO_BY_DUE[i] == entry:
+        del PO_BY_DUE[i]
+
+
+def parse_baq_po_record(record):
+    """Convert an MRP_POs BAQ row into a PO release row"""
+    # Ensure numeric conversion - Epicor may return strings
+    rel_qty = float(record.get("PORel_XRelQty", 0) or record.get("RelQty", 0) or 0)
+    recv_qty = float(record.get("PORel_ReceivedQty", 0) or record.get("ReceivedQty", 0) or 0)
+
+    return {
+        "poNum": record.get("PORel_PONum", "") or record.get("PONum", ""),
+        "poLine": record.get("PORel_POLine", "") or record.get("POLine", ""),
+        "relNum": record.get("PORel_PORelNum", "") or record.get("PORelNum", ""),
+        "partNum": record.get("PODetail_PartNum", ""),
+        "description": record.get("PODetail_LineDesc", "") or record.get("LineDesc", ""),
+        "vendorName": record.get("Vendor_Name", "") or record.get("VendorName", ""),
+        "orderQty": rel_qty,
+        "receivedQty": recv_qty,
+        "remainQty": rel_qty - recv_qty,
+        "uom": record.get("PORel_BaseUOM", "") or record.get("UOM", "EA"),
+        "dueDate": record.get("PORel_DueDate", "") or record.get("DueDate", ""),
+        "promiseDate": record.get("PORel_PromiseDt", "") or record.get("PromiseDt", ""),
+        "status": record.get("Calculated_Status", "Open")
+    }
+
+
+def parse_porel_record(record):
+    """Convert a POSvc/PORels row into a PO release row"""
+    # Ensure numeric conversion - Epicor may return strings
+    rel_qty = float(record.get("XRelQty", 0) or record.get("RelQty", 0) or 0)
+    recv_qty = float(record.get("ReceivedQty", 0) or 0)
+
+    return {
+        "poNum": record.get("PONum", ""),
+        "poLine": record.get("POLine", ""),
+        "relNum": record.get("PORelNum", ""),
+        "partNum": record.get("PartNum", ""),
+        "description": record.get("LineDesc", ""),
+        "vendorName": record.get("VendorName", ""),
+        "orderQty": rel_qty,
+        "receivedQty": recv_qty,
+        "remainQty": rel_qty - recv_qty,
+        "uom": "EA",
+        "dueDate": record.get("DueDate", ""),
+        "promiseDate": record.get("PromiseDt", ""),
+        "status": "Open"
+    }
+
+
+def fetch_all_open_pos(components):
+    """Full open-PO load filtered server-side to the BOM components.
+    Returns tuple of (release rows, source) - source is None if both queries failed.
+    """
+    # Try the MRP_POs BAQ first, filtered to our parts in chunks
+    records = query_epicor_baq_paged("MRP_POs", odata_or_filters("PODetail_PartNum", components))
+    if records is not None:
+        return ([parse_baq_po_record(r) for r in records], "baq")
+
+    # Fallback: Query PORels directly
+    result = query_epicor_open_pos(components)
+    if result and "value" in result:
+        return ([parse_porel_record(r) for r in result["value"]], "porels")
+
+    return ([], None)
+
+
+def refresh_po_releases(keys):
+    """Refetch only the given PO releases and update the index.
+    Returns False if the targeted query failed and a full reload is needed.
+    """
+    terms = sorted(keys)
+    if POS_CACHE_SOURCE == "baq":
+        filters = [
+            "(" + " or ".join(f"(PORel_PONum eq {po} and PORel_POLine eq {line} and PORel_PORelNum eq {rel})"
+                              for po, line, rel in terms[i:i + EPICOR_FILTER_CHUNK]) + ")"
+            for i in range(0, len(terms), EPICOR_FILTER_CHUNK)
+        ]
+        records = query_epicor_baq_paged("MRP_POs", filters)
+        parse = parse_baq_po_record
+    else:
+        url = f"{EPICOR_CONFIG['base_url']}/Erp.BO.POSvc/PORels"
+        records = []
+        try:
+            for i in range(0, len(terms), EPICOR_FILTER_CHUNK):
+                release_filter = " or ".join(f"(PONum eq {po} and POLine eq {line} and PORelNum eq {rel})"
+                                             for po, line, rel in terms[i:i + EPICOR_FILTER_CHUNK])
+                params = {
+                    "$filter": f"({release_filter}) and OpenRelease eq true",
+                    "$select": "PONum,POLine,PORelNum,PartNum,XRelQty,ReceivedQty,DueDate,PromiseDt"
+                }
+                records.extend(query_epicor_paged(url, params))
+        except requests.exceptions.RequestException as e:
+            log_event("error", "pos.refreshError", f"Error refreshing PO releases: {e}")
+            records = None
+        parse = parse_porel_record
+
+    if records is None:
+        return False
+
+    with PO_LOCK:
+        # Closed releases simply don't come back, so drop every requested key first
+        for key in keys:
+            _unindex_po_release(key)
+        for record in records:
+            row = parse(record)
+            if row["partNum"] in PO_TRACKED_PARTS:
+                _index_po_release(row)
+    log_event("info", "pos.refreshed", f"Refreshed {len(keys)} changed PO releases")
+    return True
+
+
+def load_open_pos(components, force=False):
+    """Keep the open-PO index current - full load when cold or the BOM changed,
+    otherwise only the releases the change feed marked dirty.
+    """
+    global POS_CACHE_TIME, POS_CACHE_SOURCE, PO_TRACKED_PARTS
+
+    components = set(components)
+    cache_valid = (not force and POS_CACHE_TIME and components <= PO_TRACKED_PARTS and
+                   datetime.now() - POS_CACHE_TIME < cache_max_age(POS_CACHE_MAX_AGE))
+    if cache_valid:
+        with CHANGE_FEED_LOCK:
+            keys = set(DIRTY_POS)
+            DIRTY_POS.clear()
+        if not keys or refresh_po_releases(keys):
+            return
+
+    rows, source = fetch_all_open_pos(components)
+    if not source:
+        return
+
+    with PO_LOCK:
+        PO_RELEASES.clear()
+        PO_BY_PART.clear()
+        del PO_BY_DUE[:]
+        PO_TRACKED_PARTS = components
+        for row in rows:
+            if row["partNum"] in components:
+                _index_po_release(row)
+    POS_CACHE_TIME = datetime.now()
+    POS_CACHE_SOURCE = source
+    log_event("info", "pos.loaded", f"Loaded {len(PO_RELEASES)} open PO releases via {source}",
+              releases=len(PO_RELEASES), source=source)
+
+
+def get_pos_by_part(components, due_before=None):
+    """Open PO releases grouped by part, each list in due-date order (read from the index)"""
+    components = set(components)
+    pos_data = {}
+    with PO_LOCK:
+        end = len(PO_BY_DUE)
+        if due_before:
+            end = bisect.bisect_right(PO_BY_DUE, (due_before[:10], (float("inf"),)))
+        for _, key in PO_BY_DUE[:end]:
+            row = PO_RELEASES[key]
+            if row["partNum"] in components:
+                pos_data.setdefault(row["partNum"], []).append(row)
+    return pos_data
+
+
+@api.route('/api/pos', methods=['GET'])
+def get_open_pos():
+    """Query open purchase orders from Epicor for BOM components.
+    Query params:
+        due_before: Only releases due on or before this date (YYYY-MM-DD, optional)
+    """
+    components = get_all_components()
+    load_open_pos(components)
+    due_before = request.args.get('due_before')
+    pos_data = get_pos_by_part(components, due_before)
+
+    return jsonify({
+        "success": True,
+        "data": pos_data,
+        "timestamp": datetime.now().isoformat(),
+        "source": "Epicor REST API"
+    })
+
+
+@api.route('/api/bom', methods=['GET'])
 def get_bom():
     """Return master BOM structure - fetched dynamically from Epicor"""
     force_refresh = request.args.get('refresh', 'false').lower() == 'true'
@@ -841,22 +2398,267 @@ def get_bom():
     })
 
 
-@app.route('/api/capacity', methods=['GET'])
-def calculate_capacity():
-    """Calculate production capacity using live Epicor data"""
+# Open append handles and last timestamp per series, guarded by HISTORY_LOCK
+HISTORY_LOCK = threading.Lock()
+HISTORY_HANDLES = {}
+HISTORY_LAST_TS = {}
+
+
+def _history_series_path(kind, entity, metric):
+    """Base path (without extension) for a series' column files"""
+    # kind and metric become path components - only the recorded names are allowed
+    if metric not in HISTORY_METRICS.get(kind, ()):
+        raise ValueError(f"Unknown history series {kind}/{metric}")
+    safe_entity = re.sub(r"[^A-Za-z0-9_.-]", "_", str(entity))
+    if safe_entity in ("", ".", ".."):
+        safe_entity = safe_entity.replace(".", "_") or "_"
+    return os.path.join(HISTORY_DIR, kind, safe_entity, metric)
+
+
+def _history_handles(kind, entity, metric):
+    """Get (or open) the append handles for a series - caller must hold HISTORY_LOCK"""
+    key = (kind, entity, metric)
+    handles = HISTORY_HANDLES.get(key)
+    if handles is None:
+        base = _history_series_path(kind, entity, metric)
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+        ts_file = open(base + ".ts", "ab")
+        val_file = open(base + ".val", "ab")
+        # Truncate a torn write (e.g. crash between the two appends) so columns stay aligned
+        rows = min(os.path.getsize(base + ".ts"), os.path.getsize(base + ".val")) // 8
+        ts_file.truncate(rows * 8)
+        val_file.truncate(rows * 8)
+        handles = (ts_file, val_file)
+        HISTORY_HANDLES[key] = handles
+        if rows:
+            last = _history_read_column(base + ".ts", rows - 1, rows)
+            HISTORY_LAST_TS[key] = last[0] if last else 0.0
+    return handles
+
+
+def _history_read_column(path, start, stop):
+    """Read rows [start, stop) of a float64 column file into an array"""
+    values = array("d")
+    with open(path, "rb") as f:
+        f.seek(start * 8)
+        values.frombytes(f.read((stop - start) * 8))
+    return values
+
+
+def record_capacity_history(results, timestamp=None):
+    """Append per-SKU and per-component figures from a capacity snapshot to the history store.
+    Each series is two columns (epoch seconds, value) appended as raw float64s.
+    """
+    ts = (timestamp or datetime.now()).timestamp()
+
+    points = []
+    seen_components = set()
+    for sku, sku_result in results.items():
+        for metric in HISTORY_SKU_METRICS:
+            points.append(("sku", sku, metric, sku_result.get(metric, 0)))
+        for b in sku_result.get("bottlenecks", []):
+            component = b["component"]
+            # Component figures are identical across SKUs - record each once
+            if component in seen_components:
+                continue
+            seen_components.add(component)
+            for metric in HISTORY_COMPONENT_METRICS:
+                points.append(("component", component, metric, b.get(metric, 0)))
+
+    try:
+        with HISTORY_LOCK:
+            for kind, entity, metric, value in points:
+                key = (kind, entity, metric)
+                ts_file, val_file = _history_handles(kind, entity, metric)
+                # Keep each series sorted by time so range queries can bisect
+                point_ts = max(ts, HISTORY_LAST_TS.get(key, 0.0))
+                ts_file.write(array("d", [point_ts]).tobytes())
+                val_file.write(array("d", [float(value or 0)]).tobytes())
+                ts_file.flush()
+                val_file.flush()
+                HISTORY_LAST_TS[key] = point_ts
+    except OSError as e:
+        log_event("error", "history.recordError", f"Error recording capacity history: {e}")
+
+
+def list_history_series():
+    """List all recorded series as {kind, entity, metric} dicts"""
+    series = []
+    if not os.path.isdir(HISTORY_DIR):
+        return series
+    for kind in sorted(os.listdir(HISTORY_DIR)):
+        kind_dir = os.path.join(HISTORY_DIR, kind)
+        if not os.path.isdir(kind_dir):
+            continue
+        for entity in sorted(os.listdir(kind_dir)):
+            entity_dir = os.path.join(kind_dir, entity)
+            for name in sorted(os.listdir(entity_dir)):
+                if name.endswith(".ts"):
+                    series.append({"kind": kind, "entity": entity, "metric": name[:-3]})
+    return series
+
+
+def query_history_series(kind, entity, metric, start_ts, end_ts, bucket_seconds=None):
+    """Range query one series, downsampled server-side.
+    Returns raw [ts, value] points when bucket_seconds is falsy, otherwise one
+    {t, min, max, last, count} dict per non-empty bucket.
+    """
+    base = _history_series_path(kind, entity, metric)
+    ts_path, val_path = base + ".ts", base + ".val"
+    if not os.path.exists(ts_path) or not os.path.exists(val_path):
+        return None
+
+    rows = min(os.path.getsize(ts_path), os.path.getsize(val_path)) // 8
+    if rows == 0:
+        return []
+
+    with open(ts_path, "rb") as f:
+        with mmap.mmap(f.fileno(), rows * 8, access=mmap.ACCESS_READ) as mm:
+            ts_col = memoryview(mm).cast("d")
+            try:
+                # Binary search the range on the memory-mapped timestamp column
+                lo = bisect.bisect_left(ts_col, start_ts)
+                hi = bisect.bisect_right(ts_col, end_ts)
+                timestamps = array("d", ts_col[lo:hi])
+            finally:
+                ts_col.release()
+
+    if lo >= hi:
+        return []
+    values = _history_read_column(val_path, lo, hi)
+
+    if not bucket_seconds:
+        return [[timestamps[i], values[i]] for i in range(len(values))]
+
+    # Bucket boundaries are found by bisecting the (sorted) timestamps, and
+    # min/max run over array slices so the per-point work stays in C
+    buckets = []
+    i = 0
+    n = len(timestamps)
+    while i < n:
+        bucket_start = timestamps[i] - (timestamps[i] % bucket_seconds)
+        # At least one point per bucket, even if float rounding puts the boundary at timestamps[i]
+        j = max(i + 1, bisect.bisect_left(timestamps, bucket_start + bucket_seconds, i))
+        window = values[i:j]
+        buckets.append({
+            "t": bucket_start,
+            "min": min(window),
+            "max": max(window),
+            "last": window[-1],
+            "count": j - i
+        })
+        i = j
+    return buckets
+
+
+def _parse_history_time(value, default):
+    """Parse an ISO-8601 string or epoch seconds query param"""
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+@api.route('/api/history', methods=['GET'])
+def get_history():
+    """Capacity history range query with server-side downsampling.
+    Query params:
+        entity: SKU or component part number (omit to list available series)
+        metric: e.g. maxProductionNow, trueAvailable (default: all metrics for the entity)
+        kind: sku or component (optional - inferred from where the entity is recorded)
+        from / to: ISO-8601 or epoch seconds (default: last 7 days)
+        bucket: bucket size in seconds, 0 for raw points (default: sized for ~500 points)
+    """
+    entity = request.args.get('entity')
+    if not entity:
+        return jsonify({
+            "success": True,
+            "series": list_history_series(),
+            "timestamp": datetime.now().isoformat()
+        })
+
+    try:
+        now_ts = datetime.now().timestamp()
+        end_ts = _parse_history_time(request.args.get('to'), now_ts)
+        start_ts = _parse_history_time(request.args.get('from'), end_ts - 7 * 86400)
+        # Rejects NaN/inf and timestamps outside the platform's datetime range
+        from_iso = datetime.fromtimestamp(start_ts).isoformat()
+        to_iso = datetime.fromtimestamp(end_ts).isoformat()
+        if start_ts > end_ts:
+            raise ValueError("from must not be after to")
+        bucket_param = request.args.get('bucket')
+        if bucket_param is not None:
+            bucket_seconds = float(bucket_param)
+            if bucket_seconds != 0 and not HISTORY_MIN_BUCKET_SECONDS <= bucket_seconds < float("inf"):
+                raise ValueError(f"bucket must be 0 (raw) or at least {HISTORY_MIN_BUCKET_SECONDS:g} seconds")
+        else:
+            bucket_seconds = max(60.0, (end_ts - start_ts) / 500)
+    except (ValueError, OverflowError, OSError) as e:
+        return jsonify({"success": False, "error": f"Invalid query parameter: {e}"}), 400
+
+    kind_param = request.args.get('kind')
+    metric = request.args.get('metric')
+    if kind_param and kind_param not in HISTORY_METRICS:
+        return jsonify({"success": False, "error": f"Invalid kind: {kind_param} (use sku or component)"}), 400
+    kinds = [kind_param] if kind_param else list(HISTORY_METRICS)
+    if metric:
+        kinds = [kind for kind in kinds if metric in HISTORY_METRICS[kind]]
+        if not kinds:
+            return jsonify({"success": False, "error": f"Invalid metric: {metric}"}), 400
+
+    series = {}
+    for kind in kinds:
+        metrics = [metric] if metric else HISTORY_METRICS[kind]
+        for m in metrics:
+            points = query_history_series(kind, entity, m, start_ts, end_ts, bucket_seconds)
+            if points is not None:
+                series[m] = {"kind": kind, "points": points}
+        if series:
+            break
+
+    if not series:
+        return jsonify({"success": False, "error": f"No history recorded for {entity}"}), 404
+
+    return jsonify({
+        "success": True,
+        "entity": entity,
+        "from": from_iso,
+        "to": to_iso,
+        "bucketSeconds": bucket_seconds,
+        "data": series,
+        "timestamp": datetime.now().isoformat()
+    })
+
+
+def build_capacity_payload():
+    """Calculate production capacity from the (warm) Epicor caches.
+    Returns the full /api/capacity payload dict.
+    """
     # Get the dynamic BOM from Epicor
     master_bom = get_master_bom()
+    components = get_all_components()
 
     # Fetch live inventory
-    inv_response = get_inventory()
-    inv_data = inv_response.get_json()
-    inventory = inv_data.get("data", {}) if inv_data.get("success") else {}
+    inventory_data, errors = load_inventory(components)
+    inventory = inventory_data if not errors else {}
+
+    # Fetch live POs (read from the open-PO index)
+    load_open_pos(components)
+    pos = get_pos_by_part(components)
+
+    # Burn rates for runway figures (incremental PartTrans sync, usually a no-op)
+    consumption = get_consumption_rates(components)
+
+    return compute_capacity(master_bom, inventory, pos, consumption)
 
-    # Fetch live POs
-    pos_response = get_open_pos()
-    pos_data_json = pos_response.get_json()
-    pos = pos_data_json.get("data", {}) if pos_data_json.get("success") else {}
 
+def compute_capacity(master_bom, inventory, pos, consumption):
+    """Capacity per SKU from already-loaded data (no Epicor calls).
+    inventory: part -> fetch_part_inventory result, pos: part -> PO release rows,
+    consumption: part -> get_consumption_rates entry
+    """
     results = {}
     total_current = 0
     total_future = 0
@@ -912,6 +2714,9 @@ def calculate_capacity():
             max_units_now = int(true_available / effective_qty_per) if effective_qty_per > 0 else 0
             max_units_future = int(future_available / effective_qty_per) if effective_qty_per > 0 else 0
 
+            burn_rate = consumption.get(component, {}).get("burnRate", 0)
+            days_of_cover, stock_out_date = calculate_days_of_cover(true_available, burn_rate)
+
             # Determine status based on true available
             if true_available <= 0:
                 status = "critical"
@@ -936,6 +2741,9 @@ def calculate_capacity():
                 "futureAvailable": future_available,
                 "maxUnitsNow": max_units_now,
                 "maxUnitsFuture": max_units_future,
+                "burnRate": burn_rate,  # Avg daily issues (consumption UOM)
+                "daysOfCover": days_of_cover,  # None when not being consumed
+                "stockOutDate": stock_out_date,
                 "uom": display_uom,  # Display in consumption UOM
                 "type": details["type"],
                 "status": status,
@@ -948,6 +2756,7 @@ def calculate_capacity():
 
         limiting_now = next((b for b in bottlenecks if b["maxUnitsNow"] == max_now), None)
         limiting_future = next((b for b in bottlenecks if b["maxUnitsFuture"] == max_future), None)
+        covers = [b["daysOfCover"] for b in bottlenecks if b["daysOfCover"] is not None]
 
         total_current += max_now
         total_future += max_future
@@ -961,10 +2770,11 @@ def calculate_capacity():
             "limitingComponentNow": limiting_now["component"] if limiting_now else "UNKNOWN",
             "limitingComponentFuture": limiting_future["component"] if limiting_future else "UNKNOWN",
             "bottlenecks": bottlenecks,
+            "daysOfCover": min(covers) if covers else None,
             "isBlocked": max_now == 0
         }
 
-    return jsonify({
+    return {
         "success": True,
         "data": results,
         "summary": {
@@ -975,10 +2785,822 @@ def calculate_capacity():
         },
         "timestamp": datetime.now().isoformat(),
         "source": f"Epicor REST API - Live Data (Quote {MASTER_QUOTE_NUM})"
+    }
+
+
+# Current capacity snapshot - replaced as a whole so readers always see one consistent
+# result, never a mix of old and refreshed data
+CAPACITY_LOCK = threading.Lock()
+CAPACITY_BUILD_LOCK = threading.Lock()  # Serializes rebuilds so concurrent requests share one
+CAPACITY_SNAPSHOT = None  # {"version", "builtAt", "payload", "jobs"}
+CAPACITY_SNAPSHOT_VERSION = 0
+CAPACITY_SNAPSHOT_HISTORY = deque(maxlen=CAPACITY_SNAPSHOTS_KEPT)  # Recent snapshots, oldest first
+
+# Persisted snapshots - SNAPSHOT_DIR/index.jsonl lists the versions where the exported data
+# changed ({"version", "builtAt", "sha"}, oldest first), each with its data in v<version>.json.gz.
+# A version between two entries has the earlier entry's data. last_version holds the highest
+# version issued, so the counter carries on after a restart.
+SNAPSHOT_STORE_LOCK = threading.Lock()
+SNAPSHOT_INDEX = []
+SNAPSHOT_STORE_LOADED = False
+
+
+def load_snapshot_store():
+    """Read the persisted snapshot index and resume version numbering (once per process)"""
+    global SNAPSHOT_STORE_LOADED, CAPACITY_SNAPSHOT_VERSION
+
+    with SNAPSHOT_STORE_LOCK:
+        if SNAPSHOT_STORE_LOADED:
+            return
+        SNAPSHOT_STORE_LOADED = True
+        try:
+            with open(os.path.join(SNAPSHOT_DIR, "index.jsonl")) as f:
+                SNAPSHOT_INDEX.extend(json.loads(line) for line in f if line.strip())
+            with open(os.path.join(SNAPSHOT_DIR, "last_version")) as f:
+                last_version = int(f.read().strip() or 0)
+        except FileNotFoundError:
+            last_version = 0
+        except (OSError, ValueError) as e:
+            log_event("error", "snapshots.loadError", f"Error loading persisted capacity snapshots: {e}")
+            last_version = 0
+        last_version = max([last_version] + [entry["version"] for entry in SNAPSHOT_INDEX])
+        with CAPACITY_LOCK:
+            CAPACITY_SNAPSHOT_VERSION = max(CAPACITY_SNAPSHOT_VERSION, last_version)
+
+
+def _write_snapshot_file(name, data):
+    """Replace SNAPSHOT_DIR/name atomically"""
+    path = os.path.join(SNAPSHOT_DIR, name)
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
+
+
+def persist_capacity_snapshot(snapshot):
+    """Record the snapshot's version and, if its exported data changed, write that data to disk.
+    Job cards are stored as built now, so a later export of this version doesn't depend on live jobs.
+    """
+
+    body = json.dumps({"data": snapshot["payload"]["data"], "jobCards": list(_export_job_cards(snapshot))},
+                      sort_keys=True, default=str).encode()
+    sha = hashlib.sha1(body).hexdigest()
+    try:
+        with SNAPSHOT_STORE_LOCK:
+            os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+            _write_snapshot_file("last_version", str(snapshot["version"]).encode())
+            if SNAPSHOT_INDEX and SNAPSHOT_INDEX[-1]["sha"] == sha:
+                return
+            _write_snapshot_file(f"v{snapshot['version']}.json.gz", gzip.compress(body))
+            entry = {"version": snapshot["version"], "builtAt": snapshot["builtAt"].isoformat(), "sha": sha}
+            SNAPSHOT_INDEX.append(entry)
+
+            # Past retention - keep the newest entry, it still describes the current data
+            cutoff = (datetime.now() - CAPACITY_SNAPSHOT_RETENTION).isoformat()
+            expired = [e for e in SNAPSHOT_INDEX[:-1] if e["builtAt"] < cutoff]
+            if expired:
+                del SNAPSHOT_INDEX[:len(expired)]
+                for e in expired:
+                    try:
+                        os.remove(os.path.join(SNAPSHOT_DIR, f"v{e['version']}.json.gz"))
+                    except FileNotFoundError:
+                        pass
+                _write_snapshot_file("index.jsonl", "".join(json.dumps(e) + "\n" for e in SNAPSHOT_INDEX).encode())
+            else:
+                with open(os.path.join(SNAPSHOT_DIR, "index.jsonl"), "a") as f:
+                    f.write(json.dumps(entry) + "\n")
+    except OSError as e:
+        log_event("error", "snapshots.persistError", f"Error persisting capacity snapshot {snapshot['version']}: {e}")
+
+
+def load_persisted_snapshot(version):
+    """A past snapshot version from SNAPSHOT_DIR as {"version", "builtAt", "payload", "jobCards"}, or None.
+    builtAt is when that version's data was first recorded.
+    """
+
+    load_snapshot_store()
+    with SNAPSHOT_STORE_LOCK:
+        if version > CAPACITY_SNAPSHOT_VERSION:
+            return None
+        position = bisect.bisect_right([e["version"] for e in SNAPSHOT_INDEX], version) - 1
+        if position < 0:
+            return None
+        entry = SNAPSHOT_INDEX[position]
+    try:
+        with open(os.path.join(SNAPSHOT_DIR, f"v{entry['version']}.json.gz"), "rb") as f:
+            stored = json.loads(gzip.decompress(f.read()))
+    except (OSError, ValueError) as e:
+        log_event("error", "snapshots.readError", f"Error reading persisted capacity snapshot {version}: {e}")
+        return None
+    return {
+        "version": version,
+        "builtAt": datetime.fromisoformat(entry["builtAt"]),
+        "payload": {"data": stored["data"]},
+        "jobCards": stored["jobCards"]
+    }
+
+
+def publish_capacity_snapshot(payload):
+    """Atomically make payload the current capacity snapshot. Returns the new snapshot."""
+    global CAPACITY_SNAPSHOT, CAPACITY_SNAPSHOT_VERSION
+
+    load_snapshot_store()  # Version numbers continue from the persisted ones
+    with CAPACITY_LOCK:
+        CAPACITY_SNAPSHOT_VERSION += 1
+        snapshot = {
+            "version": CAPACITY_SNAPSHOT_VERSION,
+            "builtAt": datetime.now(),
+            "payload": {**payload, "snapshotVersion": CAPACITY_SNAPSHOT_VERSION},
+            # Open jobs the job demands came from - the dict is replaced, never mutated, on reload
+            "jobs": OPEN_SBX_JOBS
+        }
+        CAPACITY_SNAPSHOT = snapshot
+        CAPACITY_SNAPSHOT_HISTORY.append(snapshot)
+
+    # Keep a record of this snapshot for trend and "when did it block" queries
+    record_capacity_history(payload["data"], snapshot["builtAt"])
+    persist_capacity_snapshot(snapshot)
+    queue_alert_evaluation(snapshot)
+    return snapshot
+
+
+def get_capacity_snapshot(max_age=None):
+    """Current capacity snapshot, rebuilt from the caches if older than max_age"""
+    max_age = max_age or CAPACITY_SNAPSHOT_MAX_AGE
+    snapshot = CAPACITY_SNAPSHOT
+    if snapshot and datetime.now() - snapshot["builtAt"] < max_age:
+        return snapshot
+
+    with CAPACITY_BUILD_LOCK:
+        # Another request may have rebuilt it while we waited
+        snapshot = CAPACITY_SNAPSHOT
+        if snapshot and datetime.now() - snapshot["builtAt"] < max_age:
+            return snapshot
+        return publish_capacity_snapshot(build_capacity_payload())
+
+
+# Serialized capacity views (full payload, projections, per SKU) for the current snapshot -
+# each is encoded once per snapshot version instead of on every poll
+CAPACITY_VIEW_LOCK = threading.Lock()
+CAPACITY_VIEW_CACHE = {}  # (snapshot version, view key) -> JSON bytes
+CAPACITY_VIEW_CACHE_MAX = 64  # Distinct views kept (fields= combinations are client-chosen)
+CAPACITY_SUMMARY_FIELDS = ("description", "starbucksPartNum", "maxProductionNow", "maxProductionFuture",
+                           "limitingComponentNow", "limitingComponentFuture", "daysOfCover", "isBlocked")
+
+
+def project_sku(sku_data, fields):
+    """Keep only the requested fields of a SKU result. "bottlenecks.<field>" selects
+    fields inside each bottleneck; a plain "bottlenecks" keeps them whole.
+    """
+    result = {f: sku_data[f] for f in fields if "." not in f and f in sku_data}
+    bottleneck_fields = [f.split(".", 1)[1] for f in fields if f.startswith("bottlenecks.")]
+    if bottleneck_fields and "bottlenecks" not in result:
+        result["bottlenecks"] = [
+            {f: b[f] for f in bottleneck_fields if f in b}
+            for b in sku_data.get("bottlenecks", [])
+        ]
+    return result
+
+
+def not_modified(etag):
+    """304 response for clients whose If-None-Match already matches etag, else None"""
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+
+def content_etag(payload):
+    """ETag over a payload's content - the volatile "timestamp" and "snapshotVersion" fields
+    are left out so a rebuild that changed nothing still matches
+    """
+    stable = current_app.json.dumps({k: v for k, v in payload.items() if k not in ("timestamp", "snapshotVersion")})
+    return hashlib.sha1(stable.encode("utf-8")).hexdigest()[:20]
+
+
+def conditional_json(payload):
+    """JSON response with a content ETag - 304 Not Modified (no body) when the client
+    already holds this content
+    """
+    etag = content_etag(payload)
+    response = not_modified(etag)
+    if response is None:
+        response = jsonify(payload)
+        response.set_etag(etag)
+    return response
+
+
+def serve_capacity_view(view, build):
+    """Response for a view of the current capacity snapshot, encoded once per snapshot version.
+    build(payload) returns the view's dict.
+    """
+    snapshot = get_capacity_snapshot()
+    key = (snapshot["version"], view)
+    cached = CAPACITY_VIEW_CACHE.get(key)
+    if cached is None:
+        view_payload = build(snapshot["payload"])
+        cached = (current_app.json.dumps(view_payload).encode("utf-8"), content_etag(view_payload))
+        with CAPACITY_VIEW_LOCK:
+            # Views of older snapshots are never served again
+            for old_key in [k for k in CAPACITY_VIEW_CACHE if k[0] != snapshot["version"]]:
+                del CAPACITY_VIEW_CACHE[old_key]
+            if len(CAPACITY_VIEW_CACHE) >= CAPACITY_VIEW_CACHE_MAX:
+                CAPACITY_VIEW_CACHE.clear()
+            CAPACITY_VIEW_CACHE[key] = cached
+    body, etag = cached
+    response = not_modified(etag)
+    if response is None:
+        response = Response(body, mimetype="application/json")
+        response.set_etag(etag)
+    return response
+
+
+@api.route('/api/capacity', methods=['GET'])
+@admission_controlled("capacity", fallback=lambda: CAPACITY_SNAPSHOT and CAPACITY_SNAPSHOT["payload"])
+def calculate_capacity():
+    """Calculate production capacity using live Epicor data.
+    Query params:
+        fields: Comma-separated per-SKU fields to return, e.g.
+                "maxProductionNow,limitingComponentNow,bottlenecks.component,bottlenecks.status"
+                (default: everything)
+    """
+    fields = request.args.get('fields')
+    if not fields:
+        return serve_capacity_view("full", lambda payload: payload)
+
+    fields = tuple(sorted({f.strip() for f in fields.split(",") if f.strip()}))
+    return serve_capacity_view(("fields",) + fields, lambda payload: {
+        **payload,
+        "data": {sku: project_sku(sku_data, fields) for sku, sku_data in payload["data"].items()},
+        "fields": list(fields)
     })
 
 
-@app.route('/api/transactions', methods=['GET'])
+@api.route('/api/capacity/summary', methods=['GET'])
+@admission_controlled("capacity")
+def get_capacity_summary():
+    """Capacity totals plus each SKU's headline numbers and limiting components"""
+    return serve_capacity_view("summary", lambda payload: {
+        **payload,
+        "data": {sku: project_sku(sku_data, CAPACITY_SUMMARY_FIELDS) for sku, sku_data in payload["data"].items()}
+    })
+
+
+@api.route('/api/capacity/<sku>', methods=['GET'])
+@admission_controlled("capacity")
+def get_sku_capacity(sku):
+    """Full capacity detail for a single SKU"""
+    snapshot = get_capacity_snapshot()
+    if sku not in snapshot["payload"]["data"]:
+        return jsonify({
+            "success": False,
+            "error": f"Unknown SKU {sku}",
+            "skus": sorted(snapshot["payload"]["data"]),
+            "timestamp": datetime.now().isoformat()
+        }), 404
+    return serve_capacity_view(("sku", sku), lambda payload: {
+        **{k: v for k, v in payload.items() if k not in ("data", "summary")},
+        "sku": sku,
+        "data": payload["data"][sku]
+    })
+
+
+# Bulk export datasets - name -> (columns, rows(snapshot)). Columns are (name, type) with
+# type one of "str", "int", "float", "bool"; rows yields one tuple per row, lazily.
+EXPORT_SKU_COLUMNS = (("sku", "str"), ("description", "str"), ("starbucksPartNum", "str"),
+                      ("quoteLine", "str"), ("maxProductionNow", "int"), ("maxProductionFuture", "int"),
+                      ("limitingComponentNow", "str"), ("limitingComponentFuture", "str"),
+                      ("daysOfCover", "float"), ("isBlocked", "bool"))
+EXPORT_BOTTLENECK_COLUMNS = (("sku", "str"), ("component", "str"), ("description", "str"), ("type", "str"),
+                             ("qtyPer", "float"), ("uom", "str"), ("available", "float"),
+                             ("trueAvailable", "float"), ("jobDemand", "float"), ("incomingQty", "float"),
+                             ("futureAvailable", "float"), ("maxUnitsNow", "int"), ("maxUnitsFuture", "int"),
+                             ("burnRate", "float"), ("daysOfCover", "float"), ("stockOutDate", "str"),
+                             ("status", "str"))
+EXPORT_INVENTORY_COLUMNS = (("component", "str"), ("description", "str"), ("uom", "str"), ("onHand", "float"),
+                            ("allocated", "float"), ("available", "float"), ("jobDemand", "float"),
+                            ("jobCount", "int"), ("trueAvailable", "float"), ("incomingQty", "float"),
+                            ("futureAvailable", "float"), ("burnRate", "float"), ("daysOfCover", "float"),
+                            ("stockOutDate", "str"))
+EXPORT_JOB_COLUMNS = (("jobNum", "str"), ("partNum", "str"), ("partDescription", "str"), ("prodQty", "float"),
+                      ("startDate", "str"), ("dueDate", "str"), ("shipByDate", "str"),
+                      ("materialCount", "int"), ("status", "str"))
+EXPORT_JOB_MATERIAL_COLUMNS = (("jobNum", "str"), ("shipByDate", "str"), ("partNum", "str"),
+                               ("required", "float"), ("issued", "float"), ("remaining", "float"),
+                               ("uom", "str"), ("status", "str"))
+
+
+def _export_sku_rows(snapshot):
+    for sku, sku_data in snapshot["payload"]["data"].items():
+        yield (sku,) + tuple(sku_data.get(name) for name, _ in EXPORT_SKU_COLUMNS[1:])
+
+
+def _export_bottleneck_rows(snapshot):
+    for sku, sku_data in snapshot["payload"]["data"].items():
+        for b in sku_data.get("bottlenecks", []):
+            yield (sku,) + tuple(b.get(name) for name, _ in EXPORT_BOTTLENECK_COLUMNS[1:])
+
+
+def _export_inventory_rows(snapshot):
+    # Component figures repeat under every SKU that uses the component - emit each once
+    seen = set()
+    for sku_data in snapshot["payload"]["data"].values():
+        for b in sku_data.get("bottlenecks", []):
+            if b["component"] in seen:
+                continue
+            seen.add(b["component"])
+            yield tuple(b.get(name) for name, _ in EXPORT_INVENTORY_COLUMNS)
+
+
+def _export_job_cards(snapshot):
+    """Job cards for the snapshot's open jobs in ship-by order (ship dates from cache only).
+    Persisted snapshots carry their cards as built when they were recorded.
+    """
+    if "jobCards" in snapshot:
+        yield from snapshot["jobCards"]
+        return
+    jobs = snapshot.get("jobs") or {}
+    dated = sorted((cached_ship_by_date(job) or "9999-12-31", job_num) for job_num, job in jobs.items())
+    for ship_by_date, job_num in dated:
+        yield build_job_card(job_num, jobs[job_num], ship_by_date)
+
+
+def _export_job_rows(snapshot):
+    for card in _export_job_cards(snapshot):
+        yield tuple(card.get(name) for name, _ in EXPORT_JOB_COLUMNS)
+
+
+def _export_job_material_rows(snapshot):
+    for card in _export_job_cards(snapshot):
+        for mtl in card["materials"]:
+            yield (card["jobNum"], card["shipByDate"]) + tuple(mtl.get(name) for name, _ in EXPORT_JOB_MATERIAL_COLUMNS[2:])
+
+
+EXPORT_DATASETS = {
+    "capacity": (EXPORT_SKU_COLUMNS, _export_sku_rows),
+    "bottlenecks": (EXPORT_BOTTLENECK_COLUMNS, _export_bottleneck_rows),
+    "inventory": (EXPORT_INVENTORY_COLUMNS, _export_inventory_rows),
+    "jobs": (EXPORT_JOB_COLUMNS, _export_job_rows),
+    "job-materials": (EXPORT_JOB_MATERIAL_COLUMNS, _export_job_material_rows)
+}
+EXPORT_FORMATS = {  # format -> (mimetype, file extension)
+    "csv": ("text/csv", "csv"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet")
+}
+
+
+def _export_batches(rows):
+    """Group a row iterator into lists of up to EXPORT_BATCH_ROWS"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= EXPORT_BATCH_ROWS:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def stream_export_csv(columns, rows):
+    """CSV body generator - header, then one chunk per batch of rows"""
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in columns])
+    for batch in _export_batches(rows):
+        writer.writerows(["" if value is None else value for value in row] for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+class _ExportSink:
+    """Write-only file object for pyarrow writers - collects bytes between drain() calls.
+    tell() keeps counting across drains so Parquet footer offsets stay correct.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def writable(self):
+        return True
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_export_arrow(columns, rows, file_format):
+    """Arrow IPC stream or Parquet body generator - one record batch (row group) per batch of rows"""
+    import pyarrow as pa
+
+    arrow_types = {"str": pa.string(), "int": pa.int64(), "float": pa.float64(), "bool": pa.bool_()}
+    schema = pa.schema([(name, arrow_types[kind]) for name, kind in columns])
+    casts = {"str": str, "int": int, "float": float, "bool": bool}
+
+    sink = _ExportSink()
+    if file_format == "parquet":
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(sink, schema)
+        write = lambda batch: writer.write_table(pa.Table.from_batches([batch]))
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+        write = writer.write_batch
+
+    for batch in _export_batches(rows):
+        arrays = [
+            pa.array([None if row[i] is None else casts[kind](row[i]) for row in batch], type=arrow_types[kind])
+            for i, (_, kind) in enumerate(columns)
+        ]
+        write(pa.record_batch(arrays, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def find_capacity_snapshot(version):
+    """A retained capacity snapshot by version number - recent ones from memory, older ones
+    from SNAPSHOT_DIR - or None
+    """
+    snapshot = next((s for s in list(CAPACITY_SNAPSHOT_HISTORY) if s["version"] == version), None)
+    return snapshot or load_persisted_snapshot(version)
+
+
+@api.route('/api/export', methods=['GET'])
+def list_exports():
+    """Export datasets, formats and the capacity snapshot versions that can still be exported.
+    versions lists the recent snapshots plus each older version where the data changed - any
+    version from oldestVersion up to the current one can be exported.
+    """
+    load_snapshot_store()
+    recent = [{"version": s["version"], "builtAt": s["builtAt"].isoformat()}
+              for s in reversed(list(CAPACITY_SNAPSHOT_HISTORY))]
+    with SNAPSHOT_STORE_LOCK:
+        persisted = list(SNAPSHOT_INDEX)
+    recent_versions = {v["version"] for v in recent}
+    versions = recent + [{"version": e["version"], "builtAt": e["builtAt"]}
+                         for e in reversed(persisted) if e["version"] not in recent_versions]
+    return jsonify({
+        "success": True,
+        "datasets": {name: [column for column, _ in columns] for name, (columns, _) in EXPORT_DATASETS.items()},
+        "formats": list(EXPORT_FORMATS),
+        "versions": versions,
+        "oldestVersion": min((v["version"] for v in versions), default=None),
+        "retentionDays": CAPACITY_SNAPSHOT_RETENTION.days,
+        "timestamp": datetime.now().isoformat()
+    })
+
+
+@api.route('/api/export/<dataset>', methods=['GET'])
+@admission_controlled("capacity")  # Exporting the current version can rebuild the snapshot
+def export_dataset(dataset):
+    """Stream a dataset from a capacity snapshot as a file download.
+    Query params:
+        format: csv (default), arrow (Arrow IPC stream) or parquet - the last two need pyarrow
+        version: Capacity snapshot version (default: current - see /api/export for the retained range)
+    """
+    file_format = request.args.get('format', 'csv').lower()
+    version = request.args.get('version')
+
+    error = None
+    if dataset not in EXPORT_DATASETS:
+        error = (f"Unknown dataset {dataset} - expected one of {', '.join(EXPORT_DATASETS)}", 404)
+    elif file_format not in EXPORT_FORMATS:
+        error = (f"Unknown format {file_format} - expected one of {', '.join(EXPORT_FORMATS)}", 400)
+    elif file_format != "csv":
+        try:
+            import pyarrow  # noqa: F401 - optional, only needed for Arrow/Parquet exports
+        except ImportError:
+            error = (f"{file_format} export needs pyarrow installed - use format=csv", 501)
+    if error is None and version is not None:
+        try:
+            snapshot = find_capacity_snapshot(int(version))
+        except ValueError:
+            snapshot = None
+        if snapshot is None:
+            error = (f"Snapshot version {version} is not retained "
+                     f"(versions are kept for {CAPACITY_SNAPSHOT_RETENTION.days} days)", 404)
+    if error:
+        return jsonify({
+            "success": False,
+            "error": error[0],
+            "timestamp": datetime.now().isoformat()
+        }), error[1]
+
+    if version is None:
+        snapshot = get_capacity_snapshot()
+
+    columns, rows = EXPORT_DATASETS[dataset]
+    if file_format == "csv":
+        body = stream_export_csv(columns, rows(snapshot))
+    else:
+        body = stream_export_arrow(columns, rows(snapshot), file_format)
+
+    mimetype, extension = EXPORT_FORMATS[file_format]
+    response = Response(body, mimetype=mimetype)
+    response.headers["Content-Disposition"] = f'attachment; filename="{dataset}-v{snapshot["version"]}.{extension}"'
+    response.headers["X-Snapshot-Version"] = str(snapshot["version"])
+    response.headers["X-Snapshot-Built-At"] = snapshot["builtAt"].isoformat()
+    return response
+
+
+# Shortage alert engine state
+ALERT_LOCK = threading.Lock()
+ALERT_CONDITION = threading.Condition()
+ALERT_PENDING = {"snapshot": None}  # Latest snapshot waiting for the alert worker
+ALERT_ENTITIES = {}  # (entity kind, key) -> {metric: value} as of the last evaluated snapshot
+ALERT_ACTIVE = {}  # (rule, entity key) -> firing event
+ALERT_RECENT = deque(maxlen=ALERT_RECENT_KEPT)
+ALERT_STATS = {"evaluations": 0, "entitiesChecked": 0, "fired": 0, "resolved": 0, "sinkErrors": 0,
+               "lastEvaluatedVersion": None, "lastEvaluatedDate": None}
+
+
+def load_alert_rules():
+    """ALERT_RULES with any ALERT_RULES_FILE overrides merged in (rule name -> fields)"""
+
+    rules = {name: dict(rule) for name, rule in ALERT_RULES.items()}
+    if ALERT_RULES_FILE:
+        try:
+            with open(ALERT_RULES_FILE) as f:
+                for name, overrides in json.load(f).items():
+                    rules[name] = {**rules.get(name, {}), **overrides}
+        except (OSError, ValueError) as e:
+            log_event("error", "alerts.rulesError", f"Error loading alert rules from {ALERT_RULES_FILE}: {e} - using defaults")
+    return rules
+
+
+def alert_entities(payload, past_due):
+    """Metric values per alertable entity in a capacity payload.
+    past_due: component -> open qty on PO releases due before today
+    """
+    entities = {}
+    for sku, sku_data in payload["data"].items():
+        entities[("sku", sku)] = {
+            "maxProductionNow": sku_data.get("maxProductionNow"),
+            "maxProductionFuture": sku_data.get("maxProductionFuture"),
+            "daysOfCover": sku_data.get("daysOfCover")
+        }
+        for b in sku_data.get("bottlenecks", []):
+            component = b["component"]
+            entities[("bottleneck", f"{sku}/{component}")] = {
+                "maxUnitsNow": b.get("maxUnitsNow"),
+                "maxUnitsFuture": b.get("maxUnitsFuture")
+            }
+            if ("component", component) not in entities:
+                entities[("component", component)] = {
+                    "trueAvailable": b.get("trueAvailable"),
+                    "futureAvailable": b.get("futureAvailable"),
+                    "daysOfCover": b.get("daysOfCover"),
+                    "pastDuePoQty": past_due.get(component, 0)
+                }
+    return entities
+
+
+def _past_due_po_qty(components):
+    """Open PO qty due before today per component, from the in-memory PO index"""
+    yesterday = (datetime.now().date() - timedelta(days=1)).isoformat()
+    return {
+        part: sum(row.get("remainQty", 0) for row in rows)
+        for part, rows in get_pos_by_part(components, due_before=yesterday).items()
+    }
+
+
+def _rule_state(rule, value, active):
+    """True if the rule should be firing for value, given whether it already is (hysteresis)"""
+    if value is None:
+        return False  # e.g. no days of cover when the component isn't being consumed
+    if rule["op"] == "<=":
+        return value < rule["clear"] if active else value <= rule["trigger"]
+    return value > rule["clear"] if active else value >= rule["trigger"]
+
+
+def evaluate_alerts(snapshot):
+    """Run the alert rules against the entities that changed since the last evaluated
+    snapshot (all of them on the first run and when the date rolls over, since POs
+    become past due with time alone). Returns the fired/resolved events.
+    """
+    rules = load_alert_rules()
+    payload = snapshot["payload"]
+    components = {b["component"] for d in payload["data"].values() for b in d.get("bottlenecks", [])}
+    entities = alert_entities(payload, _past_due_po_qty(components))
+    today = datetime.now().date().isoformat()
+    at = datetime.now().isoformat()
+
+    events = []
+    with ALERT_LOCK:
+        full = ALERT_STATS["lastEvaluatedDate"] != today
+        changed = [key for key, values in entities.items() if full or ALERT_ENTITIES.get(key) != values]
+        removed = [key for key in ALERT_ENTITIES if key not in entities]
+
+        for kind, key in changed + removed:
+            values = entities.get((kind, key), {})
+            for name, rule in rules.items():
+                if rule["entity"] != kind:
+                    continue
+                alert_key = (name, key)
+                active = alert_key in ALERT_ACTIVE
+                value = values.get(rule["metric"])
+                firing = _rule_state(rule, value, active)
+                if firing == active:
+                    continue  # Already alerted (dedup) or still fine
+                event = {
+                    "rule": name,
+                    "state": "firing" if firing else "resolved",
+                    "severity": rule.get("severity", "warning"),
+                    "entity": kind,
+                    "key": key,
+                    "metric": rule["metric"],
+                    "value": value,
+                    "threshold": rule["trigger"] if firing else rule["clear"],
+                    "snapshotVersion": snapshot["version"],
+                    "at": at
+                }
+                if firing:
+                    ALERT_ACTIVE[alert_key] = event
+                    ALERT_STATS["fired"] += 1
+                else:
+                    event["firedAt"] = ALERT_ACTIVE.pop(alert_key)["at"]
+                    ALERT_STATS["resolved"] += 1
+                events.append(event)
+                ALERT_RECENT.append(event)
+
+        ALERT_ENTITIES.clear()
+        ALERT_ENTITIES.update(entities)
+        ALERT_STATS["evaluations"] += 1
+        ALERT_STATS["entitiesChecked"] += len(changed) + len(removed)
+        ALERT_STATS["lastEvaluatedVersion"] = snapshot["version"]
+        ALERT_STATS["lastEvaluatedDate"] = today
+
+    if events:
+        deliver_alerts(events)
+    return events
+
+
+def _alert_sink_log(events):
+    for event in events:
+        log_event("warning" if event["state"] == "firing" else "info", f"alert.{event['state']}",
+                  f"ALERT {event['state'].upper()} [{event['severity']}] {event['rule']} {event['key']}: "
+                  f"{event['metric']}={event['value']} (threshold {event['threshold']})", **event)
+
+
+def _alert_sink_file(events):
+    os.makedirs(os.path.dirname(ALERT_FILE), exist_ok=True)
+    with open(ALERT_FILE, "a") as f:
+        for event in events:
+            f.write(json.dumps(event) + "\n")
+
+
+def _alert_sink_webhook(events):
+    if not ALERT_WEBHOOK_URL:
+        raise ValueError("ALERT_WEBHOOK_URL is not set")
+    response = requests.post(ALERT_WEBHOOK_URL, json={"alerts": events}, timeout=10)
+    response.raise_for_status()
+
+
+# Alert sinks - name -> deliver(events). Add more with register_alert_sink.
+ALERT_SINK_TYPES = {
+    "log": _alert_sink_log,
+    "file": _alert_sink_file,
+    "webhook": _alert_sink_webhook
+}
+
+
+def register_alert_sink(name, deliver):
+    """Make deliver(events) available as an alert sink (enable it through ALERT_SINKS)"""
+    ALERT_SINK_TYPES[name] = deliver
+
+
+def deliver_alerts(events):
+    """Send events to every configured sink - a failing sink doesn't stop the others"""
+    for name in [s.strip() for s in ALERT_SINKS.split(",") if s.strip()]:
+        deliver = ALERT_SINK_TYPES.get(name)
+        if deliver is None:
+            log_event("warning", "alerts.unknownSink", f"Unknown alert sink {name} - skipped")
+            continue
+        try:
+            deliver(events)
+        except Exception as e:
+            with ALERT_LOCK:
+                ALERT_STATS["sinkErrors"] += 1
+            log_event("error", "alerts.sinkError", f"Error delivering {len(events)} alert(s) to {name}: {e}")
+
+
+def queue_alert_evaluation(snapshot):
+    """Hand a new snapshot to the alert worker - never evaluates on the caller's thread.
+    Only the latest snapshot is kept; diffs are against the last one evaluated.
+    """
+    with ALERT_CONDITION:
+        ALERT_PENDING["snapshot"] = snapshot
+        ALERT_CONDITION.notify()
+
+
+def start_alert_worker():
+    """Start the background thread evaluating alert rules on new snapshots"""
+    def alert_loop():
+        EPICOR_PRIORITY.set("background")
+        REQUEST_ID.set("alerts")
+        while True:
+            with ALERT_CONDITION:
+                while ALERT_PENDING["snapshot"] is None:
+                    ALERT_CONDITION.wait()
+                snapshot = ALERT_PENDING["snapshot"]
+                ALERT_PENDING["snapshot"] = None
+            try:
+                evaluate_alerts(snapshot)
+            except Exception as e:
+                log_event("error", "alerts.evaluationError", f"Error evaluating alerts for snapshot {snapshot['version']}: {e}")
+
+    thread = threading.Thread(target=alert_loop, daemon=True)
+    thread.start()
+
+
+@api.route('/api/alerts', methods=['GET'])
+def get_alerts():
+    """Shortage alerts - currently firing plus recent fired/resolved events.
+    Query params:
+        severity: Only this severity - critical or warning (optional)
+    """
+    severity = request.args.get('severity')
+    with ALERT_LOCK:
+        active = [e for e in ALERT_ACTIVE.values() if not severity or e["severity"] == severity]
+        recent = [e for e in reversed(ALERT_RECENT) if not severity or e["severity"] == severity]
+        stats = dict(ALERT_STATS)
+    active.sort(key=lambda e: (e["severity"] != "critical", e["rule"], e["key"]))
+    return jsonify({
+        "success": True,
+        "active": active,
+        "recent": recent,
+        "rules": load_alert_rules(),
+        "sinks": [s.strip() for s in ALERT_SINKS.split(",") if s.strip()],
+        "stats": stats,
+        "timestamp": datetime.now().isoformat()
+    })
+
+
+def classify_transaction(tran_type, raw_qty):
+    """Classify a PartTrans record and determine its signed quantity.
+    Returns tuple of (type_label, type_class, display_qty)
+    Issues to jobs are NEGATIVE (consuming inventory)
+    Receipts are POSITIVE (adding inventory)
+    Adjustments keep their natural sign
+    """
+    if tran_type == "STK-MTL":
+        return ("Issue to Job", "issue", -abs(raw_qty))  # Always negative for issues
+    elif tran_type == "MTL-STK":
+        return ("Return from Job", "receipt", abs(raw_qty))  # Always positive for returns
+    elif tran_type in ["PUR-STK", "REC-STK"]:
+        return ("Receipt", "receipt", abs(raw_qty))  # Always positive for receipts
+    elif tran_type in ["ADJ-QTY", "ADJ-CST"]:
+        return ("Adjustment", "adjustment", raw_qty)  # Keep natural sign for adjustments
+    return (tran_type, "other", raw_qty)
+
+
+def parse_transactions(records):
+    """Convert PartTrans records into transaction rows for the dashboard"""
+    transactions = []
+    for record in records:
+        tran_type = record.get("TranType", "")
+        raw_qty = float(record.get("TranQty", 0) or 0)
+        type_label, type_class, display_qty = classify_transaction(tran_type, raw_qty)
+
+        transactions.append({
+            "date": record.get("TranDate", ""),
+            "type": tran_type,
+            "typeLabel": type_label,
+            "typeClass": type_class,
+            "qty": display_qty,
+            "jobNum": record.get("JobNum", ""),
+            "partNum": record.get("PartNum", ""),
+            "partDescription": record.get("PartDescription", ""),
+            "warehouse": record.get("WareHouseCode", ""),
+            "entryPerson": record.get("EntryPerson", ""),
+            "reference": record.get("TranReference", "")
+        })
+    return transactions
+
+
+@api.route('/api/transactions', methods=['GET'])
+@admission_controlled("transactions")
 def get_transactions():
     """Get material transaction history for Starbucks BOM parts.
     Query params:
@@ -1013,7 +3635,7 @@ def get_transactions():
             "$top": "500"
         }
 
-        response = requests.get(url, headers=get_epicor_headers(), params=params, timeout=60)
+        response = epicor_get(url, params=params, timeout=60)
 
         if response.status_code != 200:
             error_detail = ""
@@ -1021,7 +3643,7 @@ def get_transactions():
                 error_detail = response.text[:500]
             except:
                 pass
-            print(f"Epicor transactions API error: {response.status_code} - {error_detail}")
+            log_event("error", "transactions.epicorError", f"Epicor transactions API error: {response.status_code} - {error_detail}")
             return jsonify({
                 "success": False,
                 "error": f"Epicor API error: {response.status_code}",
@@ -1029,53 +3651,9 @@ def get_transactions():
                 "timestamp": datetime.now().isoformat()
             })
 
-        data = response.json()
-        transactions = []
-
-        for record in data.get("value", []):
-            tran_type = record.get("TranType", "")
-            raw_qty = float(record.get("TranQty", 0) or 0)
-
-            # Classify transaction type and determine sign for display
-            # Issues to jobs should be NEGATIVE (consuming inventory)
-            # Receipts should be POSITIVE (adding inventory)
-            # Adjustments keep their natural sign
-            if tran_type == "STK-MTL":
-                type_label = "Issue to Job"
-                type_class = "issue"
-                display_qty = -abs(raw_qty)  # Always negative for issues
-            elif tran_type == "MTL-STK":
-                type_label = "Return from Job"
-                type_class = "receipt"
-                display_qty = abs(raw_qty)  # Always positive for returns
-            elif tran_type in ["PUR-STK", "REC-STK"]:
-                type_label = "Receipt"
-                type_class = "receipt"
-                display_qty = abs(raw_qty)  # Always positive for receipts
-            elif tran_type in ["ADJ-QTY", "ADJ-CST"]:
-                type_label = "Adjustment"
-                type_class = "adjustment"
-                display_qty = raw_qty  # Keep natural sign for adjustments
-            else:
-                type_label = tran_type
-                type_class = "other"
-                display_qty = raw_qty
-
-            transactions.append({
-                "date": record.get("TranDate", ""),
-                "type": tran_type,
-                "typeLabel": type_label,
-                "typeClass": type_class,
-                "qty": display_qty,
-                "jobNum": record.get("JobNum", ""),
-                "partNum": record.get("PartNum", ""),
-                "partDescription": record.get("PartDescription", ""),
-                "warehouse": record.get("WareHouseCode", ""),
-                "entryPerson": record.get("EntryPerson", ""),
-                "reference": record.get("TranReference", "")
-            })
+        transactions = parse_transactions(response.json().get("value", []))
 
-        return jsonify({
+        return conditional_json({
             "success": True,
             "data": transactions,
             "count": len(transactions),
@@ -1087,7 +3665,7 @@ def get_transactions():
         })
 
     except Exception as e:
-        print(f"Error fetching transactions: {e}")
+        log_event("error", "transactions.error", f"Error fetching transactions: {e}")
         return jsonify({
             "success": False,
             "error": str(e),
@@ -1095,155 +3673,482 @@ def get_transactions():
         })
 
 
-@app.route('/api/job-materials', methods=['GET'])
-def get_job_materials():
-    """Get all open Starbucks SBX jobs with their material status.
-    Shows which materials have been issued vs required for each job.
-    """
-    try:
-        # Get open Starbucks jobs
-        starbucks_jobs = get_starbucks_open_jobs()
-        if not starbucks_jobs:
-            return jsonify({
-                "success": True,
-                "data": [],
-                "count": 0,
-                "timestamp": datetime.now().isoformat()
-            })
+# Consumption engine state - daily STK-MTL issue totals per part, maintained
+# incrementally from the highest PartTrans TranNum already aggregated
+CONSUMPTION_LOCK = threading.Lock()
+CONSUMPTION_SYNC_LOCK = threading.Lock()  # Serializes syncs; held across the PartTrans fetch
+CONSUMPTION_DAILY = {}  # part_num -> {"YYYY-MM-DD": issued qty}
+CONSUMPTION_PARTS = set()  # Parts whose history has been backfilled
+CONSUMPTION_WATERMARK = None  # Highest TranNum aggregated so far
+CONSUMPTION_SYNC_TIME = None
 
-        # Get job details to filter only SBX finished goods
-        sbx_finished_goods = {'SBX-22721', 'SBX-22880', 'SBX-24540', 'SBX-24541', 'SBX-24545'}
 
-        url = f"{EPICOR_CONFIG['base_url']}/Erp.BO.JobEntrySvc/JobEntries"
+def _fetch_issue_transactions(part_nums, extra_filter):
+    """Page through STK-MTL PartTrans records for the given parts matching extra_filter"""
+    url = f"{EPICOR_CONFIG['base_url']}/Erp.BO.PartTranSvc/PartTrans"
+    records = []
+    for part_filter in odata_or_filters("PartNum", part_nums):
         params = {
-            "$filter": "JobComplete eq false and JobClosed eq false",
-            "$select": "JobNum,PartNum,PartDescription,ProdQty,StartDate,ReqDueDate",
-            "$orderby": "JobNum desc",
-            "$top": "500"
+            "$filter": f"{part_filter} and TranType eq 'STK-MTL' and {extra_filter}",
+            "$select": "TranNum,TranDate,TranType,TranQty,UM,PartNum",
+            "$orderby": "TranNum"
         }
-        response = requests.get(url, headers=get_epicor_headers(), params=params, timeout=30)
+        records.extend(query_epicor_paged(url, params, timeout=60))
+    return records
 
-        job_info = {}
-        if response.status_code == 200:
-            for job in response.json().get("value", []):
-                job_info[job.get("JobNum", "")] = job
 
-        # Ship dates will be fetched per-job from JobProd in the card processing
-        job_ship_dates = {}
+def _aggregate_issue_transactions(records):
+    """Fold STK-MTL records into CONSUMPTION_DAILY - caller must hold CONSUMPTION_LOCK.
+    Returns the highest TranNum seen.
+    """
+    max_tran_num = 0
+    for record in records:
+        max_tran_num = max(max_tran_num, int(record.get("TranNum", 0) or 0))
+        tran_type = record.get("TranType", "")
+        raw_qty = float(record.get("TranQty", 0) or 0)
+        _, type_class, display_qty = classify_transaction(tran_type, raw_qty)
+        if type_class != "issue":
+            continue
+        part_num = record.get("PartNum", "")
+        day = (record.get("TranDate") or "")[:10]
+        if not part_num or not day:
+            continue
+        # Count consumption in the same UOM the capacity figures use (e.g. POLB-129 RL -> EA)
+        qty, _, _ = apply_uom_conversion(part_num, -display_qty, record.get("UM", ""))
+        daily = CONSUMPTION_DAILY.setdefault(part_num, {})
+        daily[day] = daily.get(day, 0) + qty
+    return max_tran_num
+
+
+def sync_consumption(part_nums, force=False):
+    """Bring the daily issue aggregates up to date.
+    The first sync for a part backfills CONSUMPTION_HISTORY_DAYS of history; after that
+    only transactions above the TranNum watermark (and inside the history window) are fetched.
+    PartTrans is queried outside CONSUMPTION_LOCK so readers never wait on Epicor.
+    """
+    global CONSUMPTION_WATERMARK, CONSUMPTION_SYNC_TIME
 
-        # Filter to SBX jobs only
-        sbx_jobs = [j for j in starbucks_jobs if job_info.get(j, {}).get("PartNum", "") in sbx_finished_goods]
+    with CONSUMPTION_LOCK:
+        new_parts = [p for p in part_nums if p not in CONSUMPTION_PARTS]
+    # Parts already tracked can be served while another thread syncs; new parts wait for their backfill
+    if not CONSUMPTION_SYNC_LOCK.acquire(blocking=bool(new_parts)):
+        return
+    try:
+        with CONSUMPTION_LOCK:
+            new_parts = [p for p in part_nums if p not in CONSUMPTION_PARTS]
+            if (not force and not new_parts and CONSUMPTION_SYNC_TIME
+                    and datetime.now() - CONSUMPTION_SYNC_TIME < CONSUMPTION_SYNC_INTERVAL):
+                return
+            tracked_parts = sorted(CONSUMPTION_PARTS)
+            current_watermark = CONSUMPTION_WATERMARK
+
+        from_date = (datetime.now() - timedelta(days=CONSUMPTION_HISTORY_DAYS)).strftime('%Y-%m-%d')
+        # Every query keeps the date floor - an empty backfill leaves the watermark at 0,
+        # and "TranNum gt 0" alone would download the whole issue history
+        date_filter = f"TranDate ge datetime'{from_date}T00:00:00'"
+        backfill_records = []
+        incremental_records = []
+        try:
+            if new_parts:
+                # Backfill the whole window (no TranNum cap) for parts not yet tracked. The incremental
+                # query below only covers tracked parts, so the two never overlap, and the new
+                # watermark covers everything the backfill saw
+                backfill_records = _fetch_issue_transactions(new_parts, date_filter)
+
+            if current_watermark is not None and tracked_parts:
+                # Incremental: only transactions newer than the watermark
+                incremental_records = _fetch_issue_transactions(
+                    tracked_parts, f"TranNum gt {current_watermark} and {date_filter}")
+        except requests.exceptions.RequestException as e:
+            log_event("error", "consumption.syncError", f"Error syncing consumption from PartTrans: {e}")
+            return
+
+        with CONSUMPTION_LOCK:
+            watermark = current_watermark or 0
+            watermark = max(watermark, _aggregate_issue_transactions(backfill_records))
+            watermark = max(watermark, _aggregate_issue_transactions(incremental_records))
+            CONSUMPTION_PARTS.update(new_parts)
+            CONSUMPTION_WATERMARK = watermark
+
+            # Drop days that have rolled out of the retention window
+            for daily in CONSUMPTION_DAILY.values():
+                for day in [d for d in daily if d < from_date]:
+                    del daily[day]
+
+            CONSUMPTION_SYNC_TIME = datetime.now()
+        if new_parts:
+            log_event("info", "consumption.backfilled",
+                      f"Consumption: backfilled {len(backfill_records)} issues for {len(new_parts)} parts")
+    finally:
+        CONSUMPTION_SYNC_LOCK.release()
+
+
+def get_consumption_rates(part_nums):
+    """Rolling average daily issue rate per part for each window in CONSUMPTION_WINDOWS.
+    Returns dict of part_num -> {avgDaily7, avgDaily30, ..., burnRate}
+    burnRate is the highest window average (the most conservative runway).
+    """
+    sync_consumption(part_nums)
+    today = datetime.now().date()
+
+    rates = {}
+    with CONSUMPTION_LOCK:
+        for part_num in part_nums:
+            daily = CONSUMPTION_DAILY.get(part_num, {})
+            part_rates = {}
+            for window in CONSUMPTION_WINDOWS:
+                first_day = (today - timedelta(days=window - 1)).isoformat()
+                total = sum(qty for day, qty in daily.items() if day >= first_day)
+                part_rates[f"avgDaily{window}"] = total / window
+            part_rates["burnRate"] = max(part_rates.values()) if part_rates else 0
+            rates[part_num] = part_rates
+    return rates
+
+
+def calculate_days_of_cover(available, burn_rate):
+    """Days until available stock runs out at burn_rate.
+    Returns tuple of (days_of_cover, stock_out_date) - both None when nothing is being consumed
+    """
+    if burn_rate <= 0:
+        return (None, None)
+    days = max(0, available) / burn_rate
+    stock_out = (datetime.now().date() + timedelta(days=int(days))).isoformat()
+    return (round(days, 1), stock_out)
+
+
+@api.route('/api/consumption', methods=['GET'])
+def get_consumption():
+    """Component burn rates, days-of-cover and projected stock-out dates per component and SKU"""
+    master_bom = get_master_bom()
+    components = get_all_components()
+    rates = get_consumption_rates(components)
+
+    inventory_data, errors = load_inventory(components)
+    inventory = inventory_data if not errors else {}
+
+    component_data = {}
+    for part_num in components:
+        true_available = inventory.get(part_num, {}).get("trueAvailable", 0)
+        part_rates = rates.get(part_num, {})
+        days_of_cover, stock_out = calculate_days_of_cover(true_available, part_rates.get("burnRate", 0))
+        component_data[part_num] = {
+            **part_rates,
+            "trueAvailable": true_available,
+            "daysOfCover": days_of_cover,
+            "stockOutDate": stock_out
+        }
+
+    # A SKU runs out when its first component does
+    sku_data = {}
+    for sku, bom_entry in master_bom.items():
+        limiting = None
+        for component in bom_entry["components"]:
+            days = component_data.get(component, {}).get("daysOfCover")
+            if days is not None and (limiting is None or days < component_data[limiting]["daysOfCover"]):
+                limiting = component
+        sku_data[sku] = {
+            "daysOfCover": component_data[limiting]["daysOfCover"] if limiting else None,
+            "stockOutDate": component_data[limiting]["stockOutDate"] if limiting else None,
+            "limitingComponent": limiting
+        }
 
-        # Get materials for each job (limit to most recent 50 to avoid timeout)
-        recent_jobs = sorted(sbx_jobs, reverse=True)[:50]
+    return jsonify({
+        "success": True,
+        "data": {
+            "components": component_data,
+            "skus": sku_data
+        },
+        "windows": list(CONSUMPTION_WINDOWS),
+        "watermark": CONSUMPTION_WATERMARK,
+        "lastSync": CONSUMPTION_SYNC_TIME.isoformat() if CONSUMPTION_SYNC_TIME else None,
+        "timestamp": datetime.now().isoformat()
+    })
 
-        job_cards = []
 
-        def process_job_for_card(job_num):
-            """Get job materials and build card data"""
-            materials, job_prods = get_job_materials_via_getbyid(job_num)
-            info = job_info.get(job_num, {})
+# Ship-by dates per order release
+SHIP_DATE_CACHE = CacheRegion("shipDates", SHIP_DATE_CACHE_EXPIRY, max_entries=CACHE_MAX_ENTRIES)  # (order_num, order_line, order_rel) -> ship_by_date
 
-            material_rows = []
-            total_required = 0
-            total_issued = 0
 
-            for mtl in materials:
-                required = float(mtl.get("RequiredQty", 0) or 0)
-                issued = float(mtl.get("IssuedQty", 0) or 0)
-                total_required += required
-                total_issued += issued
-
-                # Determine status
-                if issued >= required and required > 0:
-                    status = "complete"
-                elif issued > 0:
-                    status = "partial"
-                else:
-                    status = "missing"
+def query_ship_by_date(job_prods, job_num, force=False):
+    """Get ship-by date for a job from JobProd -> OrderRel NeedByDate"""
+    if not job_prods:
+        return ""
 
-                material_rows.append({
-                    "partNum": mtl.get("PartNum", ""),
-                    "required": required,
-                    "issued": issued,
-                    "remaining": max(0, required - issued),
-                    "status": status,
-                    "uom": mtl.get("IUM", "EA")
-                })
+    # JobProd contains OrderNum, OrderLine, OrderRelNum - use these to get NeedByDate
+    first_prod = job_prods[0]
+    order_num = first_prod.order_num
+    order_line = first_prod.order_line
+    order_rel = first_prod.order_rel_num
 
-            # Overall job status
-            if total_issued >= total_required and total_required > 0:
-                job_status = "complete"
-            elif total_issued > 0:
-                job_status = "partial"
-            else:
-                job_status = "missing"
-
-            # Get ship-by date from JobProd -> OrderRel
-            ship_by_date = ""
-            if job_prods:
-                # JobProd contains OrderNum, OrderLine, OrderRelNum - use these to get NeedByDate
-                first_prod = job_prods[0] if job_prods else {}
-                order_num = first_prod.get("OrderNum")
-                order_line = first_prod.get("OrderLine")
-                order_rel = first_prod.get("OrderRelNum", 1)
-
-                if order_num and order_line:
-                    try:
-                        # Query OrderRel for NeedByDate
-                        order_rel_url = f"{EPICOR_CONFIG['base_url']}/Erp.BO.SalesOrderSvc/OrderRels"
-                        order_rel_params = {
-                            "$filter": f"OrderNum eq {order_num} and OrderLine eq {order_line} and OrderRelNum eq {order_rel}",
-                            "$select": "NeedByDate,ReqDate",
-                            "$top": "1"
-                        }
-                        order_rel_resp = requests.get(order_rel_url, headers=get_epicor_headers(), params=order_rel_params, timeout=10)
-                        if order_rel_resp.status_code == 200:
-                            order_rels = order_rel_resp.json().get("value", [])
-                            if order_rels:
-                                ship_by_date = order_rels[0].get("NeedByDate", "") or order_rels[0].get("ReqDate", "")
-                    except Exception as e:
-                        print(f"Error getting ship date for job {job_num}: {e}")
+    cache_key = (order_num, order_line, order_rel)
+    if not force:
+        cached = SHIP_DATE_CACHE.lookup(cache_key)
+        if cached is not CACHE_MISS:
+            return cached
 
-            return {
-                "jobNum": job_num,
-                "partNum": info.get("PartNum", ""),
-                "partDescription": info.get("PartDescription", ""),
-                "prodQty": float(info.get("ProdQty", 0) or 0),
-                "startDate": info.get("StartDate", ""),
-                "dueDate": info.get("ReqDueDate", ""),
-                "shipByDate": ship_by_date,
-                "materials": material_rows,
-                "materialCount": len(material_rows),
-                "status": job_status
+    if order_num and order_line:
+        try:
+            # Query OrderRel for NeedByDate
+            order_rel_url = f"{EPICOR_CONFIG['base_url']}/Erp.BO.SalesOrderSvc/OrderRels"
+            order_rel_params = {
+                "$filter": f"OrderNum eq {order_num} and OrderLine eq {order_line} and OrderRelNum eq {order_rel}",
+                "$select": "NeedByDate,ReqDate",
+                "$top": "1"
             }
+            order_rel_resp = epicor_get(order_rel_url, params=order_rel_params, timeout=10)
+            if order_rel_resp.status_code == 200:
+                order_rels = order_rel_resp.json().get("value", [])
+                ship_by_date = ""
+                if order_rels:
+                    ship_by_date = order_rels[0].get("NeedByDate", "") or order_rels[0].get("ReqDate", "")
+                SHIP_DATE_CACHE.store(cache_key, ship_by_date)
+                return ship_by_date
+        except Exception as e:
+            log_event("error", "jobs.shipDateError", f"Error getting ship date for job {job_num}: {e}")
+    return ""
+
+
+def build_job_card(job_num, job, ship_by_date):
+    """Build job card data (material issue status) from a loaded open job"""
+    info = job.info
+
+    material_rows = []
+    total_required = 0
+    total_issued = 0
+
+    for mtl in job.materials:
+        required = mtl.required_qty
+        issued = mtl.issued_qty
+        total_required += required
+        total_issued += issued
+
+        # Determine status
+        if issued >= required and required > 0:
+            status = "complete"
+        elif issued > 0:
+            status = "partial"
+        else:
+            status = "missing"
+
+        material_rows.append({
+            "partNum": mtl.part_num,
+            "required": required,
+            "issued": issued,
+            "remaining": max(0, required - issued),
+            "status": status,
+            "uom": mtl.ium
+        })
+
+    # Overall job status
+    if total_issued >= total_required and total_required > 0:
+        job_status = "complete"
+    elif total_issued > 0:
+        job_status = "partial"
+    else:
+        job_status = "missing"
+
+    return {
+        "jobNum": job_num,
+        "partNum": info.part_num,
+        "partDescription": info.part_description,
+        "prodQty": info.prod_qty,
+        "startDate": info.start_date,
+        "dueDate": info.req_due_date,
+        "shipByDate": ship_by_date,
+        "materials": material_rows,
+        "materialCount": len(material_rows),
+        "status": job_status
+    }
+
+
+# Job cards - each built once per job version (the OpenJob object is replaced when the job
+# changes) and ship-by date, then indexed so /api/job-materials queries are in-memory lookups
+JOB_CARD_LOCK = threading.Lock()
+JOB_CARD_BUILD_LOCK = threading.Lock()  # One index rebuild at a time
+JOB_CARD_CACHE = {}  # job_num -> (OpenJob, ship-by date, card)
+JOB_CARD_INDEX = None  # {"jobs", "generation", "builtAt", "cards" (ship-by order), "shipKeys", "byPart", "byStatus"}
+JOB_CARD_SORTS = {  # sort param -> card sort value (ties broken by job number)
+    "shipByDate": lambda card: card["_shipKey"],
+    "dueDate": lambda card: (card["dueDate"] or "")[:10],
+    "jobNum": lambda card: card["jobNum"],
+    "prodQty": lambda card: card["prodQty"] or 0
+}
+JOB_CARD_PAGE_MAX = 500
+
 
-        # Process jobs in parallel for speed
+def get_job_card(job_num, job):
+    """Card for one open job, rebuilt only when the job or its ship-by date changed"""
+    ship_by_date = query_ship_by_date(job.prods, job_num)
+    cached = JOB_CARD_CACHE.get(job_num)
+    if cached and cached[0] is job and cached[1] == ship_by_date:
+        return cached[2]
+    card = build_job_card(job_num, job, ship_by_date)
+    with JOB_CARD_LOCK:
+        JOB_CARD_CACHE[job_num] = (job, ship_by_date, card)
+    return card
+
+
+def get_job_card_index():
+    """Index of the open jobs' cards, rebuilt when the open jobs or ship-by dates change
+    (or the ship dates it was built from have expired). Only jobs with materials are listed.
+    """
+    global JOB_CARD_INDEX
+
+    jobs = load_open_sbx_jobs()
+
+    def current(index):
+        # The index holds the jobs dict it was built from, so "is" can't be fooled by a reused id()
+        return (index is not None and index["jobs"] is jobs
+                and index["generation"] == SHIP_DATE_CACHE.generation
+                and datetime.now() - index["builtAt"] < SHIP_DATE_CACHE.ttl)
+
+    if current(JOB_CARD_INDEX):
+        return JOB_CARD_INDEX
+
+    with JOB_CARD_BUILD_LOCK:
+        if current(JOB_CARD_INDEX):
+            return JOB_CARD_INDEX
+
+        cards = []
+        # Parallel - ship-by dates not in the cache are one OrderRel call per job
         with ThreadPoolExecutor(max_workers=10) as executor:
-            futures = {executor.submit(process_job_for_card, job): job for job in recent_jobs}
+            futures = {submit_in_context(executor, get_job_card, job_num, job): job_num for job_num, job in jobs.items()}
             for future in as_completed(futures):
                 try:
                     card = future.result()
                     if card["materials"]:  # Only include jobs with materials
-                        job_cards.append(card)
+                        cards.append(card)
                 except Exception as e:
-                    print(f"Error processing job: {e}")
+                    log_event("error", "jobMaterials.jobError", f"Error processing job {futures[future]}: {e}")
 
+        for card in cards:
+            card["_shipKey"] = (card["shipByDate"] or card["dueDate"] or "9999-12-31")[:10]
         # Sort by ship date ascending (earliest first), then by job number
-        def sort_key(job):
-            ship_date = job.get("shipByDate") or job.get("dueDate") or "9999-12-31"
-            return (ship_date, job.get("jobNum", ""))
-        job_cards.sort(key=sort_key)
+        cards.sort(key=lambda card: (card["_shipKey"], card["jobNum"]))
+
+        by_part = {}  # job part or material part -> positions in cards
+        by_status = {}
+        for position, card in enumerate(cards):
+            for part in {card["partNum"]} | {m["partNum"] for m in card["materials"]}:
+                by_part.setdefault(part, []).append(position)
+            by_status.setdefault(card["status"], []).append(position)
+
+        # Jobs that are no longer open don't need their cards
+        with JOB_CARD_LOCK:
+            for job_num in [j for j in JOB_CARD_CACHE if j not in jobs]:
+                del JOB_CARD_CACHE[job_num]
+
+        JOB_CARD_INDEX = {
+            "jobs": jobs,
+            "generation": SHIP_DATE_CACHE.generation,  # Ship dates stored during the build count
+            "builtAt": datetime.now(),
+            "cards": cards,
+            "shipKeys": [card["_shipKey"] for card in cards],
+            "byPart": by_part,
+            "byStatus": by_status
+        }
+        return JOB_CARD_INDEX
+
+
+def query_job_cards(index, status=None, part_num=None, ship_from=None, ship_to=None,
+                    sort="shipByDate", cursor=None, limit=None):
+    """Filter, sort and page the card index.
+    status: comma-separated complete/partial/missing; part_num: the job's part or any material;
+    ship_from/ship_to: inclusive YYYY-MM-DD ship-by range; sort: a JOB_CARD_SORTS key,
+    "-" prefix for descending; cursor: nextCursor from the previous page.
+    Returns (page, total matching across all pages, next cursor or None).
+    """
 
+    # Ship-by range straight off the (ship-by ordered) index
+    lo = bisect.bisect_left(index["shipKeys"], ship_from[:10]) if ship_from else 0
+    hi = bisect.bisect_right(index["shipKeys"], ship_to[:10]) if ship_to else len(index["cards"])
+    positions = range(lo, hi)
+    if part_num:
+        positions = [p for p in index["byPart"].get(part_num, []) if lo <= p < hi]
+    if status:
+        wanted = set()
+        for s in status.split(","):
+            wanted.update(index["byStatus"].get(s.strip(), []))
+        positions = [p for p in positions if p in wanted]
+    cards = [index["cards"][p] for p in positions]
+
+    descending = sort.startswith("-")
+    value = JOB_CARD_SORTS[sort.lstrip("-")]
+    sort_key = lambda card: (value(card), card["jobNum"])
+    if sort.lstrip("-") != "shipByDate" or descending:
+        cards.sort(key=sort_key, reverse=descending)
+
+    # Keyset cursor - the sort key of the last card served, so pages stay stable when the
+    # index is rebuilt between requests
+    total = len(cards)
+    if cursor:
+        after = tuple(json.loads(base64.urlsafe_b64decode(cursor.encode()).decode()))
+        cards = [c for c in cards if (sort_key(c) < after if descending else sort_key(c) > after)]
+
+    page = cards[:limit] if limit else cards
+    next_cursor = None
+    if limit and len(cards) > limit:
+        next_cursor = base64.urlsafe_b64encode(json.dumps(list(sort_key(page[-1]))).encode()).decode()
+    return [{k: v for k, v in card.items() if not k.startswith("_")} for card in page], total, next_cursor
+
+
+@api.route('/api/job-materials', methods=['GET'])
+@admission_controlled("job-materials")
+def get_job_materials():
+    """Get all open Starbucks SBX jobs with their material status.
+    Shows which materials have been issued vs required for each job.
+    Query params (all optional):
+        status: complete, partial or missing (comma-separated)
+        part_num: Jobs for this part or using it as a material
+        ship_by_from / ship_by_to: Inclusive ship-by date range (YYYY-MM-DD)
+        sort: shipByDate (default), dueDate, jobNum or prodQty - prefix "-" for descending
+        limit: Page size (max JOB_CARD_PAGE_MAX; default all jobs)
+        cursor: nextCursor from the previous page
+    """
+    sort = request.args.get('sort', 'shipByDate')
+    try:
+        limit = int(request.args['limit']) if request.args.get('limit') else None
+    except ValueError:
+        limit = -1
+    if sort.lstrip("-") not in JOB_CARD_SORTS or (limit is not None and not 0 < limit <= JOB_CARD_PAGE_MAX):
         return jsonify({
+            "success": False,
+            "error": f"sort must be one of {', '.join(JOB_CARD_SORTS)} and limit 1-{JOB_CARD_PAGE_MAX}",
+            "timestamp": datetime.now().isoformat()
+        }), 400
+
+    try:
+        index = get_job_card_index()
+        try:
+            job_cards, total, next_cursor = query_job_cards(
+                index,
+                status=request.args.get('status'),
+                part_num=request.args.get('part_num'),
+                ship_from=request.args.get('ship_by_from'),
+                ship_to=request.args.get('ship_by_to'),
+                sort=sort,
+                cursor=request.args.get('cursor'),
+                limit=limit
+            )
+        except (ValueError, TypeError):  # Malformed cursor, or one from a different sort
+            return jsonify({
+                "success": False,
+                "error": "Invalid cursor",
+                "timestamp": datetime.now().isoformat()
+            }), 400
+
+        return conditional_json({
             "success": True,
             "data": job_cards,
             "count": len(job_cards),
+            "total": total,
+            "nextCursor": next_cursor,
+            "source": OPEN_SBX_JOBS_SOURCE,
             "timestamp": datetime.now().isoformat()
         })
 
     except Exception as e:
-        print(f"Error fetching job materials: {e}")
+        log_event("error", "jobMaterials.error", f"Error fetching job materials: {e}")
         return jsonify({
             "success": False,
             "error": str(e),
@@ -1251,85 +4156,921 @@ def get_job_materials():
         })
 
 
-@app.route('/api/refresh', methods=['POST'])
+# Demand pegging - open job material demands allocated to stock and dated PO receipts
+# in ship-by order, so each job knows whether its remaining need is actually covered
+PEGGING_STATUS_RANK = {"ready": 0, "awaitingPO": 1, "late": 2, "short": 3}
+PEGGING_CACHE = {"key": None, "jobs": None, "result": None}  # jobs: the dict it was computed from
+
+
+def cached_ship_by_date(job):
+    """Ship-by date from the ship-date cache only (no Epicor call), else the job due date"""
+    if job.prods:
+        link = job.prods[0]
+        ship_by_date = SHIP_DATE_CACHE.peek((link.order_num, link.order_line, link.order_rel_num))
+        if ship_by_date:
+            return ship_by_date[:10]
+    return (job.info.req_due_date or "")[:10]
+
+
+def peg_job_demands(jobs, supply, receipts):
+    """Allocate supply to open job demands, earliest ship-by first.
+    supply: part -> available qty (consumption UOM)
+    receipts: part -> list of (due date, qty) in due-date order (consumption UOM)
+    All demand lines are sorted once and allocated in a single pass, each part keeping
+    a cursor into its receipts. A line is "ready" when stock covers it, "awaitingPO"
+    when receipts due by its ship-by date cover the rest, "late" when it relies on
+    receipts due after that, and "short" when supply runs out.
+    Returns dict of job_num -> {shipByDate, status, firstShortComponent, readyDate, materials}
+    """
+    lines = []
+    for job_num, job in jobs.items():
+        ship_by = cached_ship_by_date(job) or "9999-12-31"
+        for seq, mtl in enumerate(job.materials):
+            remaining = mtl.required_qty - mtl.issued_qty
+            if remaining > 0 and mtl.part_num in supply:
+                lines.append((ship_by, job_num, seq, mtl.part_num, remaining))
+    lines.sort()
+
+    # Per part: [stock left, receipt index, qty left on that receipt]
+    state = {part: [max(0.0, qty), 0, receipts[part][0][1] if receipts.get(part) else 0.0]
+             for part, qty in supply.items()}
+    pegged = {}
+    for ship_by, job_num, seq, part_num, remaining in lines:
+        part_state = state[part_num]
+        part_receipts = receipts.get(part_num, [])
+
+        from_stock = min(remaining, part_state[0])
+        part_state[0] -= from_stock
+        need = remaining - from_stock
+
+        from_po = 0.0
+        last_due = None
+        while need > 0 and part_state[1] < len(part_receipts):
+            take = min(need, part_state[2])
+            if take > 0:
+                from_po += take
+                need -= take
+                part_state[2] -= take
+                last_due = part_receipts[part_state[1]][0]
+            if part_state[2] <= 0:
+                part_state[1] += 1
+                if part_state[1] < len(part_receipts):
+                    part_state[2] = part_receipts[part_state[1]][1]
+
+        if need > 0:
+            status = "short"
+        elif from_po == 0:
+            status = "ready"
+        elif last_due <= ship_by:
+            status = "awaitingPO"
+        else:
+            status = "late"
+
+        pegged.setdefault(job_num, {"shipByDate": ship_by if ship_by != "9999-12-31" else "", "lines": []})["lines"].append((seq, {
+            "partNum": part_num,
+            "remaining": remaining,
+            "fromStock": from_stock,
+            "fromPO": from_po,
+            "shortQty": need,
+            "coveredBy": last_due,
+            "status": status
+        }))
+
+    results = {}
+    for job_num, job in pegged.items():
+        materials = [m for _, m in sorted(job["lines"], key=lambda line: line[0])]
+        worst = max(materials, key=lambda m: PEGGING_STATUS_RANK[m["status"]])
+        first_short = next((m["partNum"] for m in materials if m["status"] in ("short", "late")), None)
+        due_dates = [m["coveredBy"] for m in materials if m["coveredBy"]]
+        results[job_num] = {
+            "shipByDate": job["shipByDate"],
+            "status": worst["status"],
+            "firstShortComponent": first_short,
+            "readyDate": max(due_dates) if worst["status"] in ("awaitingPO", "late") else None,
+            "materials": materials
+        }
+    # Jobs with nothing left to issue for tracked parts are ready
+    for job_num, job in jobs.items():
+        if job_num not in results:
+            ship_by = cached_ship_by_date(job)
+            results[job_num] = {"shipByDate": ship_by, "status": "ready", "firstShortComponent": None,
+                                "readyDate": None, "materials": []}
+    return results
+
+
+def get_pegging():
+    """Pegging for the current capacity snapshot, open jobs and PO index - recomputed
+    only when one of them changes. Returns dict with "jobs" and "computeMs".
+    """
+
+    snapshot = get_capacity_snapshot()
+    jobs = load_open_sbx_jobs()
+    key = (snapshot["version"], POS_CACHE_TIME)
+    cached = PEGGING_CACHE
+    # Identity, not id() - the cache holds the jobs dict, so it can't be freed and its id reused
+    if cached["key"] == key and cached["jobs"] is jobs:
+        return cached["result"]
+
+    started = time.perf_counter()
+    supply = {}
+    for sku_data in snapshot["payload"]["data"].values():
+        for b in sku_data["bottlenecks"]:
+            supply[b["component"]] = b["available"]  # Before job demands - pegging allocates those itself
+
+    receipts = {}
+    for part_num, rows in get_pos_by_part(supply).items():
+        factor = UOM_CONVERSIONS[part_num]["conversionFactor"] if part_num in UOM_CONVERSIONS else 1
+        receipts[part_num] = sorted(
+            ((row["dueDate"] or row["promiseDate"] or "9999-12-31")[:10], row["remainQty"] * factor)
+            for row in rows if row["remainQty"] > 0
+        )
+
+    result = {
+        "jobs": peg_job_demands(jobs, supply, receipts),
+        "snapshotVersion": snapshot["version"],
+        "computeMs": round((time.perf_counter() - started) * 1000, 2)
+    }
+    PEGGING_CACHE.update(key=key, jobs=jobs, result=result)
+    return result
+
+
+@api.route('/api/pegging', methods=['GET'])
+@admission_controlled("capacity")  # Needs the capacity snapshot, open jobs and PO index - may rebuild them
+def get_pegging_data():
+    """Per-job material readiness after allocating stock and PO receipts in ship-by order.
+    Query params:
+        job_num: Only this job (optional)
+        status: Only jobs with this readiness - ready, awaitingPO, late or short (optional)
+    """
+    job_num = request.args.get('job_num')
+    status = request.args.get('status')
+
+    try:
+        pegging = get_pegging()
+        jobs = pegging["jobs"]
+        if job_num:
+            jobs = {job_num: jobs[job_num]} if job_num in jobs else {}
+        if status:
+            jobs = {j: job for j, job in jobs.items() if job["status"] == status}
+
+        # Earliest ship-by first, matching the allocation order
+        data = [{"jobNum": j, **job} for j, job in jobs.items()]
+        data.sort(key=lambda job: (job["shipByDate"] or "9999-12-31", job["jobNum"]))
+
+        summary = {s: 0 for s in PEGGING_STATUS_RANK}
+        for job in pegging["jobs"].values():
+            summary[job["status"]] += 1
+
+        return jsonify({
+            "success": True,
+            "data": data,
+            "count": len(data),
+            "summary": summary,
+            "snapshotVersion": pegging["snapshotVersion"],
+            "computeMs": pegging["computeMs"],
+            "timestamp": datetime.now().isoformat()
+        })
+    except Exception as e:
+        log_event("error", "pegging.error", f"Error computing pegging: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        })
+
+
+# Refresh jobs - POST /api/refresh runs in the background and returns a job id.
+# Only one refresh runs at a time; further requests coalesce into it.
+REFRESH_LOCK = threading.Lock()
+REFRESH_JOBS = {}  # job id -> job status dict
+REFRESH_ACTIVE_JOB = None  # id of the running job, if any
+REFRESH_LAST_RUN = {}  # data class -> time of its last completed refresh
+REFRESH_JOBS_KEPT = 20  # Completed jobs kept for polling
+
+
+def _refresh_job_view(job):
+    """JSON-safe copy of a refresh job's status"""
+    steps = job["steps"]
+    done = sum(1 for state in steps.values() if state in ("done", "failed"))
+    return {
+        "jobId": job["id"],
+        "state": job["state"],
+        "progress": round(done / len(steps), 2) if steps else 1.0,
+        "steps": dict(steps),
+        "skipped": job["skipped"],
+        "error": job["error"],
+        "snapshotVersion": job["snapshotVersion"],
+        "createdAt": job["createdAt"].isoformat(),
+        "finishedAt": job["finishedAt"].isoformat() if job["finishedAt"] else None
+    }
+
+
+def _run_refresh_job(job):
+    """Force-reload the job's data classes in dependency order, then publish a new snapshot"""
+    global REFRESH_ACTIVE_JOB
+
+    EPICOR_PRIORITY.set("refresh")  # Own thread - inherited by the step workers
+    REQUEST_ID.set(f"refresh-{job['id']}")
+    job["state"] = "running"
+    pending = [name for name in job["steps"] if name != "capacity"]
+    try:
+        with ThreadPoolExecutor(max_workers=WARMUP_WORKERS) as executor:
+            running = {}
+            while pending or running:
+                # Start every step whose in-job dependencies are finished
+                for name in list(pending):
+                    deps = [d for d in WARMUP_TASKS[name][1] if d in job["steps"]]
+                    if all(job["steps"][d] in ("done", "failed") for d in deps):
+                        pending.remove(name)
+                        job["steps"][name] = "running"
+                        running[submit_in_context(executor, _run_warmup_task, name, True)] = name
+                finished = next(as_completed(running))
+                name = running.pop(finished)
+                # This run's own outcome - WARMUP_STATUS may already reflect a later scheduler run
+                failed = finished.result() is not None
+                job["steps"][name] = "failed" if failed else "done"
+                if not failed:
+                    REFRESH_LAST_RUN[name] = datetime.now()
+
+        # Flip to the new data in one step
+        job["steps"]["capacity"] = "running"
+        with CAPACITY_BUILD_LOCK:
+            snapshot = publish_capacity_snapshot(build_capacity_payload())
+        job["steps"]["capacity"] = "done"
+        job["snapshotVersion"] = snapshot["version"]
+        failed_steps = [name for name, state in job["steps"].items() if state == "failed"]
+        job["state"] = "done"
+        job["error"] = f"Failed to refresh: {', '.join(failed_steps)}" if failed_steps else None
+    except Exception as e:
+        log_event("error", "refresh.failed", f"Refresh job {job['id']} failed: {e}", jobId=job["id"])
+        job["state"] = "failed"
+        job["error"] = str(e)
+    finally:
+        job["finishedAt"] = datetime.now()
+        with REFRESH_LOCK:
+            REFRESH_ACTIVE_JOB = None
+
+
+def start_refresh_job(classes):
+    """Start (or join) a background refresh of the given data classes.
+    Returns tuple of (job status, created) - created is False when coalesced into the running job.
+    """
+    global REFRESH_ACTIVE_JOB
+
+    with REFRESH_LOCK:
+        if REFRESH_ACTIVE_JOB:
+            return (_refresh_job_view(REFRESH_JOBS[REFRESH_ACTIVE_JOB]), False)
+
+        # Skip data classes refreshed within the cooldown
+        now = datetime.now()
+        skipped = [c for c in classes if c in REFRESH_LAST_RUN and now - REFRESH_LAST_RUN[c] < REFRESH_COOLDOWN]
+        steps = {c: "pending" for c in classes if c not in skipped}
+        steps["capacity"] = "pending"
+
+        job = {
+            "id": uuid.uuid4().hex[:12],
+            "state": "queued",
+            "steps": steps,
+            "skipped": skipped,
+            "error": None,
+            "snapshotVersion": None,
+            "createdAt": now,
+            "finishedAt": None
+        }
+        REFRESH_JOBS[job["id"]] = job
+        REFRESH_ACTIVE_JOB = job["id"]
+
+        # Forget the oldest finished jobs
+        finished = [j for j in REFRESH_JOBS.values() if j["finishedAt"]]
+        for old in sorted(finished, key=lambda j: j["createdAt"])[:max(0, len(finished) - REFRESH_JOBS_KEPT)]:
+            del REFRESH_JOBS[old["id"]]
+
+    thread = threading.Thread(target=_run_refresh_job, args=(job,), daemon=True)
+    thread.start()
+    return (_refresh_job_view(job), True)
+
+
+@api.route('/api/refresh', methods=['POST'])
 def refresh_all_data():
-    """Force refresh all data from Epicor including BOM"""
-    global BOM_CACHE_TIME, JOB_DEMANDS_CACHE_TIME
-    # Invalidate caches to force fresh data
-    BOM_CACHE_TIME = None
-    JOB_DEMANDS_CACHE_TIME = None
-    return calculate_capacity()
+    """Start a background refresh of Epicor data (including BOM) - returns 202 with a job id.
+    Query params:
+        classes: Comma-separated data classes to refresh (default: all)
+    Poll GET /api/refresh/<job_id> or stream GET /api/refresh/<job_id>/stream for progress.
+    """
+    classes_param = request.args.get('classes')
+    classes = [c.strip() for c in classes_param.split(",")] if classes_param else list(WARMUP_TASKS)
+    unknown = [c for c in classes if c not in WARMUP_TASKS]
+    if unknown:
+        return jsonify({
+            "success": False,
+            "error": f"Unknown data classes: {', '.join(unknown)}",
+            "dataClasses": list(WARMUP_TASKS)
+        }), 400
+
+    job, created = start_refresh_job(classes)
+    response = jsonify({"success": True, "coalesced": not created, **job})
+    response.status_code = 202
+    response.headers["Location"] = f"/api/refresh/{job['jobId']}"
+    return response
+
+
+@api.route('/api/refresh/<job_id>', methods=['GET'])
+def get_refresh_job(job_id):
+    """Poll a refresh job's progress"""
+    job = REFRESH_JOBS.get(job_id)
+    if not job:
+        return jsonify({"success": False, "error": f"Unknown refresh job {job_id}"}), 404
+    return jsonify({"success": True, **_refresh_job_view(job)})
+
+
+@api.route('/api/refresh/<job_id>/stream', methods=['GET'])
+def stream_refresh_job(job_id):
+    """Stream a refresh job's progress as server-sent events until it finishes
+    (or for at most REFRESH_STREAM_MAX - the client reconnects)
+    """
 
+    job = REFRESH_JOBS.get(job_id)
+    if not job:
+        return jsonify({"success": False, "error": f"Unknown refresh job {job_id}"}), 404
 
-@app.route('/')
+    def events():
+        deadline = time.monotonic() + REFRESH_STREAM_MAX.total_seconds()
+        last = None
+        yield "retry: 1000\n\n"
+        while True:
+            view = _refresh_job_view(job)
+            if view != last:
+                yield f"data: {json.dumps(view)}\n\n"
+                last = view
+            if view["state"] in ("done", "failed") or time.monotonic() >= deadline:
+                return
+            time.sleep(0.5)
+
+    return Response(events(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@api.route('/')
 def serve_dashboard():
     """Serve the main dashboard HTML"""
     return send_from_directory('.', 'starbucks_capacity_dashboard.html')
 
 
-@app.route('/health')
-def health_check():
-    """Health check endpoint with Epicor connectivity test"""
-    epicor_connected = False
-    epicor_error = None
+# Epicor connectivity monitor - probed on a fixed cadence in the background so
+# /health and /ready never do upstream I/O on the request path
+EPICOR_MONITOR_LOCK = threading.Lock()
+EPICOR_MONITOR = {
+    "connected": False,
+    "lastProbe": None,
+    "lastSuccess": None,
+    "lastError": None,
+    "consecutiveFailures": 0,
+    "history": deque(maxlen=HEALTH_PROBE_HISTORY)  # (probe time, latency ms, ok, error)
+}
+
+
+def probe_epicor():
+    """Run one connectivity probe against Epicor and record the outcome"""
 
+    error = None
+    started = time.monotonic()
     try:
         # Test Epicor connection with a simple query
         url = f"{EPICOR_CONFIG['base_url']}/Erp.BO.PartSvc/Parts"
         params = {"$top": 1, "$select": "PartNum"}
-        response = requests.get(url, headers=get_epicor_headers(), params=params, timeout=10)
-        epicor_connected = response.status_code == 200
+        response = epicor_get(url, params=params, timeout=10)
+        ok = response.status_code == 200
+        if not ok:
+            error = f"HTTP {response.status_code}"
+        # Round trip only - time spent waiting on the rate limiter isn't Epicor latency
+        latency_ms = round(response.elapsed.total_seconds() * 1000, 1)
     except Exception as e:
-        epicor_error = str(e)
+        ok = False
+        error = str(e)
+        latency_ms = round((time.monotonic() - started) * 1000, 1)
+
+    now = datetime.now()
+    with EPICOR_MONITOR_LOCK:
+        EPICOR_MONITOR["connected"] = ok
+        EPICOR_MONITOR["lastProbe"] = now
+        EPICOR_MONITOR["lastError"] = error
+        EPICOR_MONITOR["history"].append((now, latency_ms, ok, error))
+        if ok:
+            EPICOR_MONITOR["lastSuccess"] = now
+            EPICOR_MONITOR["consecutiveFailures"] = 0
+        else:
+            EPICOR_MONITOR["consecutiveFailures"] += 1
+
+
+def start_connectivity_monitor():
+    """Start the background Epicor connectivity probe thread"""
+
+    def probe_loop():
+        EPICOR_PRIORITY.set("background")
+        REQUEST_ID.set("monitor")
+        while True:
+            probe_epicor()
+            time.sleep(HEALTH_PROBE_INTERVAL.total_seconds())
 
+    thread = threading.Thread(target=probe_loop, daemon=True)
+    thread.start()
+
+
+def _cache_status(loaded_time, expiry, entries):
+    """Warmth of one data class: loaded, within its TTL, and how many entries"""
+    age = (datetime.now() - loaded_time).total_seconds() if loaded_time else None
+    return {
+        "warm": bool(loaded_time) and age < expiry.total_seconds(),
+        "ageSeconds": round(age, 1) if age is not None else None,
+        "entries": entries
+    }
+
+
+@api.route('/health')
+def health_check():
+    """Liveness check - reports the background monitor's view of Epicor, no upstream I/O"""
+    with EPICOR_MONITOR_LOCK:
+        history = list(EPICOR_MONITOR["history"])
+        connected = EPICOR_MONITOR["connected"]
+        last_probe = EPICOR_MONITOR["lastProbe"]
+        last_success = EPICOR_MONITOR["lastSuccess"]
+        last_error = EPICOR_MONITOR["lastError"]
+        consecutive_failures = EPICOR_MONITOR["consecutiveFailures"]
+
+    latencies = sorted(h[1] for h in history if h[2])
     return jsonify({
-        "status": "healthy" if epicor_connected else "degraded",
+        "status": "healthy" if connected else "degraded",
         "timestamp": datetime.now().isoformat(),
         "epicor": {
-            "connected": epicor_connected,
+            "connected": connected,
             "endpoint": EPICOR_CONFIG["base_url"],
-            "error": epicor_error
+            "error": last_error,
+            "lastProbe": last_probe.isoformat() if last_probe else None,
+            "lastSuccess": last_success.isoformat() if last_success else None,
+            "consecutiveFailures": consecutive_failures,
+            "latencyMs": history[-1][1] if history else None,
+            "latencyP50Ms": latencies[len(latencies) // 2] if latencies else None,
+            "latencyP95Ms": latencies[int(len(latencies) * 0.95)] if latencies else None,
+            "probes": len(history),
+            "failedProbes": sum(1 for h in history if not h[2])
         },
         "cache": {
             "partInfoCached": len(PART_INFO_CACHE)
+        },
+        "startup": STARTUP_TIMING
+    })
+
+
+# Sampling profiler - /debug/profile samples every thread's stack in the background for
+# a few seconds; results are fetched from /debug/profile/<id> once sampling finishes.
+# Disabled unless PROFILE_TOKEN is set.
+PROFILE_LOCK = threading.Lock()
+PROFILES = {}  # profile id -> profile dict
+PROFILES_KEPT = 5
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)})"
+
+
+def _thread_group(name):
+    """Group pool workers together - "ThreadPoolExecutor-3_1" -> "ThreadPoolExecutor" """
+    return re.sub(r"[-_]?\d+(_\d+)?$", "", name) or name
+
+
+def _sample_threads(profile):
+    """Sample all thread stacks at profile["hz"] for profile["seconds"]"""
+
+    own_ident = threading.get_ident()
+    interval = 1.0 / profile["hz"]
+    stacks = {}  # collapsed stack -> samples
+    self_counts = {}  # leaf frame with line -> samples
+    names = {}
+    overhead = 0.0
+    samples = 0
+    started = time.monotonic()
+    deadline = started + profile["seconds"]
+
+    while time.monotonic() < deadline:
+        tick = time.monotonic()
+        if samples % profile["hz"] == 0:
+            names = {t.ident: t.name for t in threading.enumerate()}  # Pick up new pool workers
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            leaf = f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})"
+            self_counts[leaf] = self_counts.get(leaf, 0) + 1
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            labels.append(_thread_group(names.get(ident, str(ident))))
+            key = ";".join(reversed(labels))
+            stacks[key] = stacks.get(key, 0) + 1
+        samples += 1
+        spent = time.monotonic() - tick
+        overhead += spent
+        time.sleep(max(0.0, interval - spent))
+
+    elapsed = time.monotonic() - started
+    total = sum(self_counts.values()) or 1
+    profile.update({
+        "state": "done",
+        "samples": samples,
+        "durationS": round(elapsed, 2),
+        "overheadPct": round(overhead / elapsed * 100, 2) if elapsed else 0,
+        "collapsed": "\n".join(f"{stack} {count}" for stack, count in sorted(stacks.items(), key=lambda s: -s[1])),
+        "topSelf": [
+            {"frame": frame, "samples": count, "pct": round(count / total * 100, 1)}
+            for frame, count in sorted(self_counts.items(), key=lambda s: -s[1])[:25]
+        ],
+        "finishedAt": datetime.now().isoformat()
+    })
+
+
+def _profile_authorized():
+    # Header only - a query-string token would end up in access logs and request-path logs
+    token = os.environ.get("PROFILE_TOKEN")
+    supplied = request.headers.get("X-Profile-Token") or ""
+    return bool(token) and hmac.compare_digest(supplied, token)
+
+
+@api.route('/debug/profile', methods=['GET'])
+def start_profile():
+    """Start sampling all thread stacks - returns 202 with the profile id.
+    Query params:
+        seconds: Sampling duration (default 10, max PROFILE_MAX_SECONDS)
+        hz: Samples per second (default 100, max 1000)
+    Requires the PROFILE_TOKEN value in the X-Profile-Token header
+    """
+
+    if not _profile_authorized():
+        return jsonify({"success": False, "error": "Not found"}), 404
+
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        hz = min(max(int(request.args.get('hz', 100)), 1), 1000)
+    except ValueError:
+        return jsonify({"success": False, "error": "seconds and hz must be numbers"}), 400
+    # Also rejects nan and inf, which min() would pass through
+    if not 0 < seconds < float("inf"):
+        return jsonify({"success": False, "error": "seconds must be a positive number"}), 400
+    seconds = min(seconds, PROFILE_MAX_SECONDS)
+
+    with PROFILE_LOCK:
+        if any(p["state"] == "running" for p in PROFILES.values()):
+            return jsonify({"success": False, "error": "A profile is already running"}), 409
+        profile = {
+            "id": uuid.uuid4().hex[:12],
+            "state": "running",
+            "seconds": seconds,
+            "hz": hz,
+            "startedAt": datetime.now().isoformat()
+        }
+        PROFILES[profile["id"]] = profile
+        for old_id in list(PROFILES)[:-PROFILES_KEPT]:
+            del PROFILES[old_id]
+
+    threading.Thread(target=_sample_threads, args=(profile,), name="profiler", daemon=True).start()
+    response = jsonify({"success": True, "profileId": profile["id"], "seconds": seconds, "hz": hz})
+    response.status_code = 202
+    response.headers["Location"] = f"/debug/profile/{profile['id']}"
+    return response
+
+
+@api.route('/debug/profile/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """Fetch a profile - JSON with top self-time frames, or ?format=collapsed for
+    flamegraph.pl / speedscope input
+    """
+    if not _profile_authorized():
+        return jsonify({"success": False, "error": "Not found"}), 404
+
+    profile = PROFILES.get(profile_id)
+    if not profile:
+        return jsonify({"success": False, "error": f"Unknown profile {profile_id}"}), 404
+    if request.args.get('format') == 'collapsed' and profile["state"] == "done":
+        return Response(profile["collapsed"] + "\n", mimetype="text/plain")
+    return jsonify({"success": True, **profile})
+
+
+def memory_report():
+    """Per-cache memory usage plus the process peak RSS"""
+    caches = cache_memory_usage()
+    report = {
+        "caches": caches,
+        "cacheBytesTotal": sum(c["bytes"] for c in caches.values()),
+        "peakRssKb": None
+    }
+    try:
+        import resource
+        report["peakRssKb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KB on Linux
+    except ImportError:
+        pass  # Not available on Windows
+    return report
+
+
+@api.route('/api/metrics')
+def get_metrics():
+    """Admission control per endpoint (slots in use, queue depth, shed counts), Epicor rate limiter state
+    and per-cache memory usage
+    """
+    endpoints = {}
+    for name, (concurrency, queue_size, max_wait) in ADMISSION_LIMITS.items():
+        with ADMISSION_CONDITIONS[name]:
+            stats = dict(ADMISSION_STATS[name])
+        wait_ms_total = stats.pop("waitMsTotal")
+        waited = stats["admitted"] + stats["timedOut"]
+        endpoints[name] = {
+            **stats,
+            "concurrencyLimit": concurrency,
+            "queueLimit": queue_size,
+            "maxWaitSeconds": max_wait.total_seconds(),
+            "avgWaitMs": round(wait_ms_total / waited, 1) if waited else 0
         }
+    return jsonify({
+        "success": True,
+        "admission": endpoints,
+        "epicorRateLimiter": epicor_limiter_stats(),
+        "caches": {name: region.stats() for name, region in CACHE_REGIONS.items()},
+        "hedging": hedging_stats(),
+        "logging": {**LOG_STATS, "level": logging.getLevelName(LOG.level), "queueDepth": LOG_LISTENER.queue.qsize() if LOG_LISTENER else 0},
+        "memory": memory_report(),
+        "timestamp": datetime.now().isoformat()
     })
 
 
-def preload_all_caches_background():
-    """Preload all caches in background thread - doesn't block server startup"""
-    import threading
-    import time
+@api.route('/ready')
+def readiness_check():
+    """Readiness check - cache warmth per data class, answered from in-memory state.
+    Returns 503 until the data the capacity view needs is loaded.
+    """
+    component_count = len({c for sku_data in BOM_CACHE.values() for c in sku_data["components"]})
+    newest_inventory = max((entry[0] for entry in list(INVENTORY_CACHE.values())), default=None)
+    oldest_inventory = min((entry[0] for entry in list(INVENTORY_CACHE.values())), default=None)
+
+    data_classes = {
+        "bom": _cache_status(BOM_CACHE_TIME, BOM_CACHE_REGION.ttl, len(BOM_CACHE)),
+        "partInfo": {
+            "warm": component_count > 0 and len(PART_INFO_CACHE) >= component_count,
+            "entries": len(PART_INFO_CACHE)
+        },
+        "inventory": {
+            **_cache_status(oldest_inventory, INVENTORY_CACHE.ttl, len(INVENTORY_CACHE)),
+            "newest": newest_inventory.isoformat() if newest_inventory else None
+        },
+        "pos": _cache_status(POS_CACHE_TIME, POS_CACHE_MAX_AGE, len(PO_RELEASES)),
+        "jobs": _cache_status(OPEN_SBX_JOBS_TIME, OPEN_SBX_JOBS_CACHE_REGION.ttl, len(OPEN_SBX_JOBS)),
+        "jobDemands": _cache_status(JOB_DEMANDS_CACHE_TIME, JOB_DEMANDS_CACHE_REGION.ttl, len(JOB_DEMANDS_CACHE)),
+        "consumption": _cache_status(CONSUMPTION_SYNC_TIME, CONSUMPTION_SYNC_INTERVAL * 3, len(CONSUMPTION_PARTS)),
+        "changeFeed": {
+            "warm": change_feed_active(),
+            "lastPoll": CHANGE_FEED_LAST_POLL.isoformat() if CHANGE_FEED_LAST_POLL else None
+        }
+    }
 
-    def load_all():
-        time.sleep(5)  # Wait for server to be fully ready and pass health checks
-        try:
-            # Preload part cache first
-            components = get_all_components()
-            print(f"Background: Preloading part info cache for {len(components)} components...")
-            with ThreadPoolExecutor(max_workers=5) as executor:
-                futures = {executor.submit(query_epicor_part, part): part for part in components}
-                for future in as_completed(futures):
-                    part = futures[future]
-                    try:
-                        future.result()
-                    except Exception as e:
-                        print(f"Error preloading {part}: {e}")
-            print(f"Background: Part cache preloaded with {len(PART_INFO_CACHE)} parts")
-
-            # Then preload job demands
-            print("Background: Preloading job demands...")
-            query_all_job_demands(components)
-            print("Background: Job demands preloaded successfully")
-        except Exception as e:
-            print(f"Background: Error preloading caches: {e}")
+    # Inventory is only warm once every component has an entry
+    if component_count == 0 or len(INVENTORY_CACHE) < component_count:
+        data_classes["inventory"]["warm"] = False
+
+    ready = all(data_classes[name]["warm"] for name in ("bom", "inventory", "pos", "jobDemands"))
+    return jsonify({
+        "ready": ready,
+        "timestamp": datetime.now().isoformat(),
+        "epicorConnected": EPICOR_MONITOR["connected"],
+        "dataClasses": data_classes,
+        "warmup": warmup_progress()
+    }), (200 if ready else 503)
 
-    thread = threading.Thread(target=load_all, daemon=True)
+
+def _warm_parallel(func, items, force):
+    """Run func(item, force) over items on a small pool, logging per-item failures"""
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        futures = {submit_in_context(executor, func, item, force): item for item in items}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                log_event("error", "warmup.loadError", f"Warm-up: error loading {futures[future]}: {e}")
+
+
+def _warm_bom(force):
+    """BOM - everything component-based depends on it, so an empty result is a failure"""
+    if not fetch_quote_bom_from_epicor(force=force):
+        raise RuntimeError("BOM unavailable from Epicor")
+
+
+def _warm_ship_dates(force):
+    """Ship-by dates for every loaded open job"""
+    jobs = dict(OPEN_SBX_JOBS)
+    _warm_parallel(lambda job_num, f: query_ship_by_date(jobs[job_num].prods, job_num, f), list(jobs), force)
+
+
+# Warm-up tasks: name -> (loader(force), dependencies, priority, ttl())
+# Lower priority runs first - 0 is what the landing (capacity) tab needs.
+# Each task is re-run (forced) at WARMUP_REFRESH_FRACTION of its TTL so the cache is
+# replaced before it expires and no request ever finds it cold.
+WARMUP_TASKS = {
+    "bom": (_warm_bom, (), 0, lambda: BOM_CACHE_REGION.ttl),
+    "inventory": (lambda force: _warm_parallel(get_part_warehouse_data, get_all_components(), force),
+                  ("bom",), 0, lambda: cache_max_age(INVENTORY_CACHE.ttl)),
+    "pos": (lambda force: load_open_pos(get_all_components(), force=force),
+            ("bom",), 0, lambda: cache_max_age(POS_CACHE_MAX_AGE)),
+    "starbucksJobs": (lambda force: get_starbucks_open_jobs(force=force), (), 0,
+                      lambda: STARBUCKS_JOBS_CACHE_REGION.ttl),
+    "jobs": (lambda force: load_open_sbx_jobs(force=force), ("starbucksJobs",), 0,
+             lambda: OPEN_SBX_JOBS_CACHE_REGION.ttl),
+    "jobDemands": (lambda force: query_all_job_demands(get_all_components(), force=force),
+                   ("bom", "jobs"), 0, lambda: JOB_DEMANDS_CACHE_REGION.ttl),
+    "partInfo": (lambda force: _warm_parallel(query_epicor_part, get_all_components(), force),
+                 ("bom",), 1, lambda: PART_INFO_CACHE.ttl),
+    "consumption": (lambda force: sync_consumption(get_all_components(), force=force),
+                    ("bom",), 1, lambda: CONSUMPTION_SYNC_INTERVAL),
+    "shipDates": (_warm_ship_dates, ("jobs",), 2, lambda: SHIP_DATE_CACHE.ttl),
+    "bins": (lambda force: load_part_bins(get_all_components(), force=force),
+             ("bom",), 2, lambda: cache_max_age(BINS_CACHE_MAX_AGE)),
+    "capacity": (lambda force: get_capacity_snapshot(CAPACITY_SNAPSHOT_MAX_AGE * WARMUP_REFRESH_FRACTION),
+                 ("bom", "inventory", "pos", "jobDemands", "consumption"), 0, lambda: CAPACITY_SNAPSHOT_MAX_AGE),
+}
+
+# Warm-up progress per task, reported by /ready
+WARMUP_LOCK = threading.Lock()
+WARMUP_STATUS = {
+    name: {"state": "pending", "runs": 0, "lastSuccess": None, "nextRun": None, "durationMs": None, "error": None}
+    for name in WARMUP_TASKS
+}
+# One run per task at a time - the scheduler and refresh jobs both run tasks
+WARMUP_TASK_LOCKS = {name: threading.Lock() for name in WARMUP_TASKS}
+
+
+def _run_warmup_task(name, force=None):
+    """Run one warm-up task and record its outcome. Returns the error message, or None on success."""
+    with WARMUP_TASK_LOCKS[name]:
+        return _run_warmup_task_locked(name, force)
+
+
+def _run_warmup_task_locked(name, force):
+    loader, _, _, ttl = WARMUP_TASKS[name]
+    with WARMUP_LOCK:
+        status = WARMUP_STATUS[name]
+        if force is None:
+            force = status["lastSuccess"] is not None  # First run loads, later runs replace
+        status["state"] = "running"
+
+    started = time.monotonic()
+    error = None
+    try:
+        loader(force)
+    except Exception as e:
+        error = str(e)
+        log_event("error", "warmup.taskFailed", f"Warm-up: {name} failed: {e}")
+    duration_ms = round((time.monotonic() - started) * 1000, 1)
+
+    with WARMUP_LOCK:
+        status["runs"] += 1
+        status["durationMs"] = duration_ms
+        status["error"] = error
+        if error:
+            status["state"] = "failed"
+            status["nextRun"] = datetime.now() + WARMUP_RETRY_DELAY
+        else:
+            status["state"] = "done"
+            status["lastSuccess"] = datetime.now()
+            status["nextRun"] = datetime.now() + ttl() * WARMUP_REFRESH_FRACTION
+    return error
+
+
+def warmup_progress():
+    """Snapshot of warm-up progress for the readiness endpoint"""
+    with WARMUP_LOCK:
+        tasks = {
+            name: {
+                "state": st["state"],
+                "priority": WARMUP_TASKS[name][2],
+                "runs": st["runs"],
+                "durationMs": st["durationMs"],
+                "error": st["error"],
+                "lastSuccess": st["lastSuccess"].isoformat() if st["lastSuccess"] else None,
+                "nextRun": st["nextRun"].isoformat() if st["nextRun"] else None
+            }
+            for name, st in WARMUP_STATUS.items()
+        }
+    warmed = sum(1 for t in tasks.values() if t["lastSuccess"])
+    return {"warmed": warmed, "total": len(tasks), "tasks": tasks}
+
+
+def start_warmup_scheduler():
+    """Start the cache warm-up scheduler in a background thread - doesn't block server startup.
+    Independent tasks run concurrently; a task starts once its dependencies have loaded,
+    highest priority first, and is re-run just before its TTL expires.
+    """
+
+    executor = ThreadPoolExecutor(max_workers=WARMUP_WORKERS)
+
+    def schedule_loop():
+        EPICOR_PRIORITY.set("background")  # Inherited by the tasks submitted below
+        REQUEST_ID.set("warmup")
+        while True:
+            now = datetime.now()
+            with WARMUP_LOCK:
+                due = []
+                for name, (_, deps, priority, _) in WARMUP_TASKS.items():
+                    status = WARMUP_STATUS[name]
+                    if status["state"] == "running":
+                        continue
+                    if status["nextRun"] and status["nextRun"] > now:
+                        continue
+                    if any(WARMUP_STATUS[d]["lastSuccess"] is None for d in deps):
+                        continue
+                    due.append((priority, name))
+                for _, name in sorted(due):
+                    WARMUP_STATUS[name]["state"] = "running"
+            for _, name in sorted(due):
+                submit_in_context(executor, _run_warmup_task, name)
+            time.sleep(1)
+
+    thread = threading.Thread(target=schedule_loop, daemon=True)
     thread.start()
 
 
-# Start background preload (non-blocking - server starts immediately)
-preload_all_caches_background()
+# Background services started by create_app - service -> pid it was started in
+BACKGROUND_STARTED = {}
+BACKGROUND_STARTERS = {
+    "warmup": lambda: start_warmup_scheduler(),
+    "alerts": lambda: start_alert_worker(),
+    "changefeed": lambda: start_change_feed_poller(),
+    "monitor": lambda: start_connectivity_monitor(),
+}
+
+# Cold-start timing, all in ms since the module started importing
+STARTUP_TIMING = {"appCreatedMs": None, "firstRequestMs": None, "pid": None}
+
+
+def start_background_services(services):
+    """Start the named background services, each at most once per process"""
+    pid = os.getpid()
+    for name in [s.strip() for s in services.split(",") if s.strip()]:
+        if name not in BACKGROUND_STARTERS:
+            log_event("warning", "startup.unknownService", f"Unknown background service {name} - skipped")
+            continue
+        if BACKGROUND_STARTED.get(name) == pid:
+            continue
+        BACKGROUND_STARTERS[name]()
+        BACKGROUND_STARTED[name] = pid
+        log_event("info", "startup.serviceStarted", f"Started background service {name} (pid {pid})")
+
+
+def create_app(config=None):
+    """Build the Flask app. Nothing touches Epicor until this runs - gunicorn calls it in
+    each worker after forking ("backend_server:create_app()").
+    config overrides: BACKGROUND_SERVICES (e.g. "" for none), EPICOR_POOL_SIZE, LOG_LEVEL
+    """
+
+    app = Flask(__name__, static_folder='.')
+    app.config.update(BACKGROUND_SERVICES=BACKGROUND_SERVICES, EPICOR_POOL_SIZE=EPICOR_POOL_SIZE,
+                      LOG_LEVEL=LOG_LEVEL)
+    app.config.update(config or {})
+    CORS(app, expose_headers=["X-Request-ID", "ETag"])
+    app.register_blueprint(api)
+    init_logging(app.config["LOG_LEVEL"])
+
+    @app.before_request
+    def assign_request_id():
+        # Honour an upstream id (load balancer, client) so logs can be joined across hops;
+        # fan-out workers inherit it through submit_in_context
+        REQUEST_ID.set(request.headers.get("X-Request-ID") or uuid.uuid4().hex[:16])
+
+    @app.after_request
+    def tag_request_id(response):
+        response.headers["X-Request-ID"] = REQUEST_ID.get() or ""
+        return response
+
+    @app.teardown_request
+    def clear_request_id(exc):
+        REQUEST_ID.set(None)  # Worker threads are reused across requests
+
+    @app.after_request
+    def record_first_request(response):
+        if STARTUP_TIMING["firstRequestMs"] is None:
+            STARTUP_TIMING["firstRequestMs"] = round((time.monotonic() - IMPORT_STARTED) * 1000, 1)
+            log_event("info", "startup.firstRequest", f"First request served {STARTUP_TIMING['firstRequestMs']}ms after import",
+                      ms=STARTUP_TIMING["firstRequestMs"])
+        return response
+
+    admission_threads = sum(concurrency + queue_size for concurrency, queue_size, _ in ADMISSION_LIMITS.values())
+    if WEB_THREADS <= admission_threads:
+        log_event("warning", "startup.threadsBelowAdmission",
+                  f"WEB_THREADS={WEB_THREADS} can't hold the {admission_threads} admitted + queued requests "
+                  f"ADMISSION_LIMITS allows - shedding won't engage before requests back up in gunicorn",
+                  threads=WEB_THREADS, admissionThreads=admission_threads)
+
+    init_epicor_client(app.config["EPICOR_POOL_SIZE"])
+    # Warm-up etc. run in the background - the app serves immediately
+    start_background_services(app.config["BACKGROUND_SERVICES"])
+
+    STARTUP_TIMING["appCreatedMs"] = round((time.monotonic() - IMPORT_STARTED) * 1000, 1)
+    STARTUP_TIMING["pid"] = os.getpid()
+    return app
 
 
 if __name__ == '__main__':
@@ -1341,12 +5082,23 @@ if __name__ == '__main__':
     print("=" * 60)
     print("  Dashboard: http://localhost:5000")
     print("  Health:    http://localhost:5000/health")
+    print("  Ready:     http://localhost:5000/ready")
     print("  API Endpoints:")
     print("    - GET  /api/inventory  - Live inventory from Epicor")
+    print("    - GET  /api/inventory/bins - Bin-level quantities (pick locations)")
     print("    - GET  /api/pos        - Open POs from Epicor")
     print("    - GET  /api/bom        - Master BOM structure")
-    print("    - GET  /api/capacity   - Calculated capacity (live)")
-    print("    - POST /api/refresh    - Force data refresh")
+    print("    - GET  /api/capacity   - Calculated capacity (live, ?fields= projection)")
+    print("    - GET  /api/capacity/summary - Totals and limiting components per SKU")
+    print("    - GET  /api/capacity/<sku> - Capacity detail for one SKU")
+    print("    - GET  /api/history    - Capacity history (downsampled)")
+    print("    - GET  /api/consumption - Burn rates and days of cover")
+    print("    - GET  /api/pegging    - Job readiness (stock/POs pegged by ship-by date)")
+    print("    - POST /api/refresh    - Start background data refresh (202 + job id)")
+    print("    - GET  /api/metrics    - Admission control queue depth and shed counts")
     print("=" * 60)
 
+    # With the debug reloader only the child process serves - don't start services in the watcher
+    reloader_parent = os.environ.get("WERKZEUG_RUN_MAIN") != "true"
+    app = create_app({"BACKGROUND_SERVICES": ""} if reloader_parent else None)
     app.run(debug=True, host='0.0.0.0', port=5000)
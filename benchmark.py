@@ -0,0 +1,252 @@
+"""
+Starbucks Capacity Dashboard - Compute Benchmarks
+Generates synthetic Epicor-shaped data at a multiple of today's volume and times
+each pure compute stage in isolation (no Epicor calls).
+
+Usage:
+    python benchmark.py                       # scales 10 and 100, compare to baseline
+    python benchmark.py --scales 10,100,1000  # include 1000x
+    python benchmark.py --update-baseline     # store these timings as the new baseline
+
+Exits 1 when a stage is slower than its baseline by more than --tolerance.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+import backend_server as server
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+# Today's volume (scale 1)
+BASE_SKUS = 5
+BASE_COMPONENTS = 14
+BASE_COMPONENTS_PER_SKU = 10
+BASE_OPEN_JOBS = 40
+BASE_PO_RELEASES = 60
+BASE_TRANSACTIONS = 500
+
+TRAN_TYPES = ["STK-MTL", "STK-MTL", "STK-MTL", "PUR-STK", "MTL-STK", "ADJ-QTY", "STK-CUS"]
+COMPONENT_TYPE_NAMES = ["Frame", "Leather", "Foam", "Pattern", "Packaging"]
+
+
+def generate_dataset(scale, seed=42):
+    """Synthetic BOM, inventory, POs, jobs and transactions at scale x today's volume.
+    Raw records use Epicor's field names so the real parsers run on them.
+    """
+    rng = random.Random(seed)
+    today = datetime.now().date()
+
+    components = [f"CMP-{i:05d}" for i in range(BASE_COMPONENTS * scale)]
+    skus = [f"SBX-{i:05d}" for i in range(BASE_SKUS * scale)]
+
+    bom = {}
+    for line, sku in enumerate(skus, 1):
+        parts = rng.sample(components, BASE_COMPONENTS_PER_SKU)
+        bom[sku] = {
+            "description": f"Synthetic Chair {line}",
+            "starbucksPartNum": str(11170000 + line),
+            "quoteLine": f"{server.MASTER_QUOTE_NUM}-{line}",
+            "components": {
+                part: {
+                    "qty": rng.choice([1.0, 1.0, 2.0, 4.0, 0.5]),
+                    "uom": "EA",
+                    "type": rng.choice(COMPONENT_TYPE_NAMES),
+                    "mtlSeq": seq * 10
+                }
+                for seq, part in enumerate(parts, 1)
+            }
+        }
+
+    inventory = {}
+    for part in components:
+        on_hand = float(rng.randint(0, 2000))
+        allocated = float(rng.randint(0, 100))
+        job_demand = float(rng.randint(0, 300))
+        available = on_hand - allocated
+        inventory[part] = {
+            "partNum": part,
+            "description": f"Component {part}",
+            "onHand": on_hand,
+            "allocated": allocated,
+            "jobDemand": job_demand,
+            "jobCount": rng.randint(0, 10),
+            "available": available,
+            "trueAvailable": max(0, available - job_demand),
+            "uom": "EA",
+            "inventoryUom": "EA",
+            "conversionApplied": False,
+            "warehouses": [],
+            "error": None
+        }
+
+    po_records = []
+    for i in range(BASE_PO_RELEASES * scale):
+        due = today + timedelta(days=rng.randint(-10, 90))
+        po_records.append({
+            "PORel_PONum": 50000 + i // 3,
+            "PORel_POLine": i % 3 + 1,
+            "PORel_PORelNum": 1,
+            "PODetail_PartNum": rng.choice(components),
+            "Vendor_Name": f"Vendor {rng.randint(1, 40)}",
+            "PORel_XRelQty": float(rng.randint(50, 1000)),
+            "PORel_ReceivedQty": float(rng.choice([0, 0, 0, 25])),
+            "PORel_DueDate": f"{due.isoformat()}T00:00:00",
+            "PORel_PromiseDt": None
+        })
+    pos = {}
+    for record in po_records:
+        row = server.parse_baq_po_record(record)
+        pos.setdefault(row["partNum"], []).append(row)
+
+    # JOB_MATERIALS_BAQ rows - one per material x order link, like the real BAQ
+    job_rows = []
+    ship_dates = {}
+    for i in range(BASE_OPEN_JOBS * scale):
+        job_num = f"{25000 + i:06d}-1-1"
+        sku = rng.choice(skus)
+        prod_qty = rng.randint(1, 60)
+        due = today + timedelta(days=rng.randint(0, 60))
+        ship_dates[job_num] = (due - timedelta(days=2)).isoformat()
+        for seq, (part, details) in enumerate(bom[sku]["components"].items(), 1):
+            required = details["qty"] * prod_qty
+            job_rows.append({
+                "JobHead_JobNum": job_num,
+                "JobHead_PartNum": sku,
+                "JobHead_PartDescription": bom[sku]["description"],
+                "JobHead_ProdQty": prod_qty,
+                "JobHead_StartDate": f"{today.isoformat()}T00:00:00",
+                "JobHead_ReqDueDate": f"{due.isoformat()}T00:00:00",
+                "JobMtl_MtlSeq": seq * 10,
+                "JobMtl_PartNum": part,
+                "JobMtl_RequiredQty": required,
+                "JobMtl_IssuedQty": rng.choice([0, 0, required / 2, required]),
+                "JobMtl_IUM": "EA",
+                "JobProd_OrderNum": 100000 + i,
+                "JobProd_OrderLine": 1,
+                "JobProd_OrderRelNum": 1
+            })
+
+    transactions = []
+    for i in range(BASE_TRANSACTIONS * scale):
+        day = today - timedelta(days=rng.randint(0, 30))
+        transactions.append({
+            "TranNum": 9000000 + i,
+            "TranDate": f"{day.isoformat()}T00:00:00",
+            "TranType": rng.choice(TRAN_TYPES),
+            "TranQty": float(rng.randint(-50, 200)),
+            "JobNum": f"{25000 + rng.randint(0, BASE_OPEN_JOBS * scale):06d}-1-1",
+            "PartNum": rng.choice(components),
+            "WareHouseCode": rng.choice(["MAIN", "MAIN", "OVERFLOW"]),
+            "EntryPerson": "synthetic",
+            "TranReference": "",
+            "PartDescription": ""
+        })
+
+    consumption = {
+        part: {"avgDaily7": rate, "avgDaily30": rate * 0.9, "burnRate": rate}
+        for part in components
+        for rate in [float(rng.choice([0, 0, 1, 5, 12, 40]))]
+    }
+
+    return {
+        "bom": bom,
+        "components": components,
+        "inventory": inventory,
+        "pos": pos,
+        "jobRows": job_rows,
+        "shipDates": ship_dates,
+        "transactions": transactions,
+        "consumption": consumption
+    }
+
+
+def build_stages(data):
+    """Compute stages to time - name -> zero-argument callable"""
+    jobs = server.parse_job_materials_baq(data["jobRows"])
+    supply = {part: inv["available"] for part, inv in data["inventory"].items()}
+    receipts = {
+        part: sorted((row["dueDate"][:10], row["remainQty"]) for row in rows if row["remainQty"] > 0)
+        for part, rows in data["pos"].items()
+    }
+
+    def job_cards():
+        cards = [build_card(job_num, job) for job_num, job in jobs.items()]
+        cards.sort(key=lambda card: (card["shipByDate"] or card["dueDate"] or "9999-12-31", card["jobNum"]))
+        return cards
+
+    def build_card(job_num, job):
+        return server.build_job_card(job_num, job, data["shipDates"][job_num])
+
+    return {
+        "capacity": lambda: server.compute_capacity(data["bom"], data["inventory"], data["pos"], data["consumption"]),
+        "jobsBaqParse": lambda: server.parse_job_materials_baq(data["jobRows"]),
+        "jobDemands": lambda: server.aggregate_job_demands(jobs, data["components"]),
+        "jobCards": job_cards,
+        "pegging": lambda: server.peg_job_demands(jobs, supply, receipts),
+        "transactions": lambda: server.parse_transactions(data["transactions"])
+    }
+
+
+def time_stage(fn, repeat):
+    """Median wall time in ms over repeat runs"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the capacity dashboard compute paths")
+    parser.add_argument("--scales", default="10,100", help="Comma-separated multiples of today's volume")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per stage (median is reported)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="Allowed slowdown vs baseline before failing (0.5 = 50%%)")
+    parser.add_argument("--update-baseline", action="store_true", help="Store these timings as the baseline")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as f:
+            baseline = json.load(f)
+
+    results = {}
+    regressions = []
+    print(f"{'stage':<14}{'scale':>7}{'ms':>12}{'baseline':>12}{'change':>10}")
+    for scale in [int(s) for s in args.scales.split(",")]:
+        data = generate_dataset(scale, args.seed)
+        for name, fn in build_stages(data).items():
+            key = f"{name}@{scale}"
+            ms = time_stage(fn, args.repeat)
+            results[key] = round(ms, 3)
+            base = baseline.get(key)
+            change = f"{(ms / base - 1) * 100:+.0f}%" if base else "-"
+            print(f"{name:<14}{scale:>7}{ms:>12.2f}{(base or 0):>12.2f}{change:>10}")
+            if base and ms > base * (1 + args.tolerance):
+                regressions.append(key)
+
+    if args.update_baseline:
+        baseline.update(results)
+        with open(BASELINE_FILE, "w") as f:
+            json.dump(dict(sorted(baseline.items())), f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {BASELINE_FILE}")
+        return 0
+
+    if regressions:
+        print(f"REGRESSION: {', '.join(regressions)} slower than baseline by more than {args.tolerance:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())